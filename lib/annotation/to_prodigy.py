@@ -1,8 +1,8 @@
 import argparse
-import csv
-import json
 
-from idlib import Concept
+from idlib.connections import read_connections, connection_indices
+from idlib.jsonl import JSONLWriter
+from idlib.offset_index import load_concepts
 
 
 def parse_args():
@@ -11,35 +11,14 @@ def parse_args():
                         help="""iDISK JSON lines file containing
                                 all concepts.""")
     parser.add_argument("--connections_file", type=str, required=True,
-                        help="""CSV file containing indices of connections
-                                in concepts_file.""")
+                        help="""CSV or binary file containing indices of
+                                connections in concepts_file.""")
     parser.add_argument("--outfile", type=str, required=True,
                         help="Where to save the output file.")
     args = parser.parse_args()
     return args
 
 
-def read_connections_file(infile):
-    cnxs = []
-    with open(infile, 'r') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',')
-        for (i, row) in enumerate(reader):
-            if len(row) != 2:
-                raise ValueError("Improperly formatted row at line {i+1}.")
-            cnxs.append([int(i) for i in row])
-    return cnxs
-
-
-def read_concepts_file(infile):
-    concepts = []
-    with open(infile, 'r') as inF:
-        for (i, line) in enumerate(inF):
-            data = json.loads(line)
-            concept = Concept.from_dict(data)
-            concepts.append(concept)
-    return concepts
-
-
 def convert_all_to_prodigy(concepts, connections):
     for (i, j) in connections:
         ci = concepts[i]
@@ -68,14 +47,17 @@ def convert_one_to_prodigy(concept1, concept2):
 
 def main(concepts_file, connections_file, outfile):
     print("Reading concepts...", end='', flush=True)
-    concepts = read_concepts_file(concepts_file)
+    # Only the concepts in a connection are needed. Finding them
+    # also checks that connections_file was computed from concepts_file.
+    indices = connection_indices(connections_file,
+                                 concepts_file=concepts_file)
+    concepts = load_concepts(concepts_file, indices, lazy=True)
     print("Done", flush=True)
-    cnxs = read_connections_file(connections_file)
-    with open(outfile, 'w') as outF:
+    cnxs = read_connections(connections_file)
+    with JSONLWriter(outfile) as writer:
         for outjson in convert_all_to_prodigy(concepts, cnxs):
             if outjson != {}:
-                json.dump(outjson, outF)
-                outF.write('\n')
+                writer.write(outjson)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,12 @@
 import argparse
-import csv
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 from collections import defaultdict
 
-from idlib.data_elements import Concept
+from idlib.connections import (read_connections, connection_indices,
+                               write_connections)
+from idlib.offset_index import load_concepts
 
 """
 Given a set of candidate connections and the concepts,
@@ -16,174 +18,272 @@ do not have the same preferred term.
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--connections_file", type=str, required=True,
-                        help="""CSV file of connections, corresponding
-                                to concepts_file.""")
+                        help="""CSV or binary file of connections,
+                                corresponding to concepts_file.""")
     parser.add_argument("--concepts_file", type=str, required=True,
                         help="JSON lines file of concepts.")
     parser.add_argument("--outfile", type=str, required=True,
-                        help="""Where to save the filtered connections
-                                as JSON lines.""")
+                        help="""Where to save the filtered connections.
+                                Written as CSV if it ends in .csv and in
+                                the binary connections format otherwise.""")
     parser.add_argument("--ignore_concept_types", nargs='*',
                         help="List of concept types to automatically exclude.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes to use. Default 1.")
     args = parser.parse_args()
     return args
 
 
-def read_connections(infile):
-    cnxs = []
-    with open(infile, 'r') as inF:
-        reader = csv.reader(inF, delimiter=',')
-        for (i, row) in enumerate(reader):
-            if len(row) != 2:
-                raise ValueError("Improperly formatted CSV at line {i+1}.")
-            cnx = [int(i) for i in row]
-            cnxs.append(cnx)
-    return cnxs
+class ConceptTerms(object):
+    """
+    The lowercased atom terms, preferred terms, and linked preferred terms
+    of each concept, computed once and interned as integer IDs so that
+    each candidate connection is checked with a few set intersections.
+
+    :param list concepts: List of concepts. Concepts that are None, e.g.
+                          those not in any connection, have no terms.
+    :param list ignore_concept_types: List of concept types to exclude.
+    """
+    def __init__(self, concepts, ignore_concept_types=[]):
+        vocab = {}
+        self.ignored = []
+        self.terms = []
+        self.pts = []
+        # (term ID, src_id) of each linked preferred atom.
+        self.linked_atoms = []
+        # The src_ids of all linked atoms, preferred or not, for the IDFs.
+        self.linked_ids = []
+        self.n_missing = 0
+        empty = frozenset()
+        for concept in concepts:
+            if concept is None:
+                self.n_missing += 1
+                self.ignored.append(True)
+                self.terms.append(empty)
+                self.pts.append(empty)
+                self.linked_atoms.append(())
+                self.linked_ids.append(empty)
+                continue
+            self.ignored.append(
+                concept.concept_type.upper() in ignore_concept_types)
+            terms = set()
+            pts = set()
+            linked_atoms = set()
+            linked_ids = set()
+            for a in concept.get_atoms():
+                term_id = vocab.setdefault(a.term_key, len(vocab))
+                terms.add(term_id)
+                is_linked = "linking_score" in a.attrs.keys()
+                if is_linked is True:
+                    linked_ids.add(a.src_id)
+                if a.is_preferred is True:
+                    if is_linked is True:
+                        linked_atoms.add((term_id, a.src_id))
+                    else:
+                        pts.add(term_id)
+            self.terms.append(frozenset(terms))
+            self.pts.append(frozenset(pts))
+            self.linked_atoms.append(tuple(linked_atoms))
+            self.linked_ids.append(frozenset(linked_ids))
+        self.linked = [frozenset([term_id for (term_id, _) in atoms])
+                       for atoms in self.linked_atoms]
 
+    def restrict_linked(self, keep_src_ids):
+        """
+        Only count linked atoms whose src_id is in keep_src_ids as linked.
 
-def filter_connections(connections, concepts, ignore_concept_types):
+        :param set keep_src_ids: The src_ids of the linked atoms to keep.
+        """
+        self.linked = [frozenset([term_id for (term_id, src_id) in atoms
+                                  if src_id in keep_src_ids])
+                       for atoms in self.linked_atoms]
+
+
+def _keep_basic(i, j, ct):
     """
-    Keep connections if the preferred_atom.term for
-    one concept is in the atoms of the other concept.
+    The check of ``filter_connections``. Returns why the connection
+    (i, j) was kept, "no_linked" or "linked", or None if it was not.
+    """
+    if len(ct.linked[i]) == 0 or len(ct.linked[j]) == 0:
+        if len(ct.terms[i] & ct.pts[j]) > 0 or len(ct.pts[j] & ct.terms[j]) > 0:  # noqa
+            return "no_linked"
+    else:
+        num_atoms = min([len(ct.linked[i]), len(ct.linked[j])])
+        keep = int(np.ceil(num_atoms * 1.00))
+        if len(ct.linked[i] & ct.linked[j]) >= keep:
+            return "linked"
+    return None
 
-    :param list connections: List of candidate connections.
-    :param list concepts: List of concepts.
-    :param list ignore_concept_types: List of concept types to exclude.
-    :returns: Filtered connections.
-    :rtype: list
+
+def _keep_idf(i, j, ct):
     """
-    what_happen = {"no_linked": 0, "linked": 0}
-    cnxs = []
-    for (i, j) in tqdm(connections):
+    The check of ``filter_connections_idf``. Returns why the connection
+    (i, j) was kept, "no_linked" or "linked", or None if it was not.
+    """
+    if len(ct.linked[i]) == 0 or len(ct.linked[j]) == 0:
+        if len(ct.pts[i] & ct.pts[j]) > 0:
+            return "no_linked"
+    else:
+        if len(ct.linked[i] & ct.linked[j]) > 1:
+            return "linked"
+    return None
+
+
+# Set in each worker process by _init_worker.
+_worker_args = None
+
+
+def _init_worker(keep_func, concept_terms):
+    global _worker_args
+    _worker_args = (keep_func, concept_terms)
 
-        if concepts[i].concept_type.upper() in ignore_concept_types:
+
+def _filter_batch(batch):
+    """
+    Apply the filter in _worker_args to a batch of connections.
+
+    :param list batch: Candidate connections.
+    :returns: The kept connections and why they were kept.
+    :rtype: list
+    """
+    keep_func, ct = _worker_args
+    kept = []
+    for (i, j) in batch:
+        if ct.ignored[i]:
             continue
+        reason = keep_func(i, j, ct)
+        if reason is not None:
+            kept.append((i, j, reason))
+    return kept
 
-        i_terms = []
-        i_pts = []
-        i_linked_terms = []
-        for a in concepts[i].get_atoms():
-            i_terms.append(a.term.lower())
-            if a.is_preferred is True:
-                if "linking_score" in a.attrs.keys():
-                    i_linked_terms.append(a.term.lower())
-                else:
-                    i_pts.append(a.term.lower())
-
-        j_terms = []
-        j_pts = []
-        j_linked_terms = []
-        for a in concepts[j].get_atoms():
-            j_terms.append(a.term.lower())
-            if a.is_preferred is True:
-                if "linking_score" in a.attrs.keys():
-                    j_linked_terms.append(a.term.lower())
-                else:
-                    j_pts.append(a.term.lower())
-
-        if len(i_linked_terms) == 0 or len(j_linked_terms) == 0:
-            if len(set(i_terms) & set(j_pts)) > 0 or len(set(j_pts) & set(j_terms)) > 0:  # noqa
-                what_happen["no_linked"] += 1
-                cnxs.append((i, j))
-        else:
-            num_atoms = min([len(set(i_linked_terms)), len(set(j_linked_terms))])  # noqa
-            keep = int(np.ceil(num_atoms * 1.00))
-            if len(set(i_linked_terms) & set(j_linked_terms)) >= keep:
-                what_happen["linked"] += 1
-                cnxs.append((i, j))
-    print(what_happen)
 
-    return cnxs
+def _run_filter(keep_func, connections, concept_terms, workers=1,
+                batch_size=10000):
+    """
+    Apply keep_func to each of connections, optionally in a pool
+    of worker processes. The order of the connections is preserved.
+
+    :returns: Generator over filtered connections.
+    :rtype: generator
+    """
+    def _batches():
+        batch = []
+        for cnx in connections:
+            batch.append(cnx)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    what_happen = {"no_linked": 0, "linked": 0}
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(keep_func, concept_terms))
+        results = pool.imap(_filter_batch, _batches())
+    else:
+        _init_worker(keep_func, concept_terms)
+        results = map(_filter_batch, _batches())
+    try:
+        for kept in tqdm(results):
+            for (i, j, reason) in kept:
+                what_happen[reason] += 1
+                yield (i, j)
+    finally:
+        if workers > 1:
+            pool.terminate()
+    print(what_happen)
 
 
-def filter_connections_idf(connections, concepts, ignore_concept_types):
+def filter_connections(connections, concepts, ignore_concept_types,
+                       workers=1):
     """
     Keep connections if the preferred_atom.term for
     one concept is in the atoms of the other concept.
 
-    :param list connections: List of candidate connections.
+    :param iterable connections: Candidate connections.
     :param list concepts: List of concepts.
     :param list ignore_concept_types: List of concept types to exclude.
-    :returns: Filtered connections.
-    :rtype: list
+    :param int workers: Number of processes to use. Default 1.
+    :returns: Generator over filtered connections.
+    :rtype: generator
+    """
+    concept_terms = ConceptTerms(concepts, ignore_concept_types)
+    return _run_filter(_keep_basic, connections, concept_terms,
+                       workers=workers)
+
+
+def filter_connections_idf(connections, concepts, ignore_concept_types,
+                           workers=1):
+    """
+    Keep connections if the preferred_atom.term for
+    one concept is in the atoms of the other concept.
+
+    :param iterable connections: Candidate connections.
+    :param list concepts: List of all the concepts, over which the IDFs
+                          are computed. See ``linked_idf``.
+    :param list ignore_concept_types: List of concept types to exclude.
+    :param int workers: Number of processes to use. Default 1.
+    :returns: Generator over filtered connections.
+    :rtype: generator
     """
-    idfs = linked_idf(concepts)
+    concept_terms = ConceptTerms(concepts, ignore_concept_types)
+    idfs = linked_idf(concept_terms)
     idf_range = max(idfs.values()) - min(idfs.values())
     threshold = min(idfs.values()) + (idf_range / 1.5)
     print(max(idfs.values()), min(idfs.values()))
     print(threshold)
-    what_happen = {"no_linked": 0, "linked": 0}
-    cnxs = []
-    for (i, j) in tqdm(connections):
-
-        if concepts[i].concept_type.upper() in ignore_concept_types:
-            continue
+    concept_terms.restrict_linked(
+        set([lid for (lid, idf) in idfs.items() if idf >= threshold]))
+    return _run_filter(_keep_idf, connections, concept_terms,
+                       workers=workers)
 
-        i_terms = []
-        i_pts = []
-        i_linked_terms = []
-        for a in concepts[i].get_atoms():
-            i_terms.append(a.term.lower())
-            if a.is_preferred is True:
-                if "linking_score" in a.attrs.keys():
-                    if idfs[a.src_id] >= threshold:
-                        i_linked_terms.append(a.term.lower())
-                else:
-                    i_pts.append(a.term.lower())
-
-        j_terms = []
-        j_pts = []
-        j_linked_terms = []
-        for a in concepts[j].get_atoms():
-            j_terms.append(a.term.lower())
-            if a.is_preferred is True:
-                if "linking_score" in a.attrs.keys():
-                    if idfs[a.src_id] >= threshold:
-                        j_linked_terms.append(a.term.lower())
-                else:
-                    j_pts.append(a.term.lower())
-
-        if len(i_linked_terms) == 0 or len(j_linked_terms) == 0:
-            #if len(set(i_terms) & set(j_pts)) > 0 or len(set(j_pts) & set(j_terms)) > 0:  # noqa
-            if len(set(i_pts) & set(j_pts)) > 0:
-                what_happen["no_linked"] += 1
-                cnxs.append((i, j))
-        else:
-            num_atoms = min([len(set(i_linked_terms)), len(set(j_linked_terms))])  # noqa
-            if len(set(i_linked_terms) & set(j_linked_terms)) > 1:
-                what_happen["linked"] += 1
-                cnxs.append((i, j))
-    print(what_happen)
-
-    return cnxs
 
+def linked_idf(concept_terms):
+    """
+    The inverse document frequency of the src_id of each linked atom,
+    preferred or not, where the documents are the concepts.
 
-def linked_idf(concepts):
+    :param ConceptTerms concept_terms: Precomputed terms of all the
+                                       concepts.
+    :returns: {src_id: idf}
+    :rtype: dict
+    :raises ValueError: If some of the concepts were not loaded, e.g.
+                        by ``load_concepts``, since the IDFs would differ.
+    """
+    if concept_terms.n_missing > 0:
+        raise ValueError(f"{concept_terms.n_missing} concepts are not loaded. The IDFs are computed over all concepts.")  # noqa
     df = defaultdict(int)
-    for concept in concepts:
-        linked_ids = set([a.src_id for a in concept.get_atoms()
-                          if "linking_score" in a.attrs.keys()])
+    for linked_ids in concept_terms.linked_ids:
         for lid in linked_ids:
             df[lid] += 1
-    idf = {lid: np.log(len(concepts)/freq) for (lid, freq) in df.items()}
+    n_concepts = len(concept_terms.linked_ids)
+    idf = {lid: np.log(n_concepts/freq) for (lid, freq) in df.items()}
     return idf
 
 
-def main(connections_file, concepts_file, outfile, ignore_concept_types):
-    candidate_cnxs = read_connections(connections_file)
-    print(f"Number of candidate connections: {len(candidate_cnxs)}.")
-    concepts = Concept.read_jsonl_file(concepts_file)
-    ignore_concept_types = [ct.upper() for ct in ignore_concept_types]
+def main(connections_file, concepts_file, outfile, ignore_concept_types,
+         workers=1):
+    # Only the concepts in a candidate connection are needed, so find
+    # them in one pass over connections_file, which also checks that it
+    # was computed from concepts_file, and look them up in the offset
+    # index of concepts_file. The basic filter doesn't need the IDFs,
+    # which are computed over all concepts.
+    indices = connection_indices(connections_file,
+                                 concepts_file=concepts_file)
+    concepts = load_concepts(concepts_file, indices, lazy=True)
+    print(f"Loaded {len(indices)} of {len(concepts)} concepts.")
+    ignore_concept_types = [ct.upper() for ct in ignore_concept_types or []]
     print(f"Excluding concepts of types {ignore_concept_types}.")
+    candidate_cnxs = read_connections(connections_file)
     filtered_cnxs = filter_connections(candidate_cnxs, concepts,
-                                       ignore_concept_types)
-    print(f"Number of filtered connections: {len(filtered_cnxs)}.")
-    with open(outfile, 'w') as outF:
-        writer = csv.writer(outF, delimiter=',')
-        writer.writerows(filtered_cnxs)
+                                       ignore_concept_types, workers=workers)
+    n_filtered = write_connections(filtered_cnxs, outfile,
+                                   concepts_file=concepts_file)
+    print(f"Number of filtered connections: {n_filtered}.")
 
 
 if __name__ == "__main__":
     args = parse_args()
     main(args.connections_file, args.concepts_file,
-         args.outfile, args.ignore_concept_types)
+         args.outfile, args.ignore_concept_types, workers=args.workers)
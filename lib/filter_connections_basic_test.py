@@ -0,0 +1,52 @@
+import pytest
+import numpy as np
+
+from idlib.data_elements import Atom, Concept
+
+import filter_connections_basic as fcb
+
+
+def make_concept(atoms, concept_type="SDSI"):
+    """
+    :param list atoms: (term, src_id, is_preferred, is_linked) tuples.
+    """
+    atoms = [Atom(term, src="NMCD", src_id=src_id, term_type="SY",
+                  is_preferred=is_preferred,
+                  **({"linking_score": 0.9} if is_linked else {}))
+             for (term, src_id, is_preferred, is_linked) in atoms]
+    return Concept(concept_type=concept_type, atoms=atoms)
+
+
+def _concepts():
+    return [make_concept([("vitamin c", "C1", True, True),
+                          ("ascorbic acid", "C2", False, True)]),
+            make_concept([("vitamin c", "C1", True, True)]),
+            make_concept([("ascorbic acid", "C2", True, True),
+                          ("vitamin c", "X1", False, False)]),
+            make_concept([("ginseng", "G1", True, False)]),
+            make_concept([("Ginseng", "G2", True, False)]),
+            make_concept([("melatonin", "M1", True, False)], "DSP")]
+
+
+def test_linked_idf_counts_all_linked_atoms():
+    concepts = _concepts()
+    idfs = fcb.linked_idf(fcb.ConceptTerms(concepts))
+    # Non-preferred linked atoms count towards the document frequency.
+    expected = {"C1": np.log(6 / 2), "C2": np.log(6 / 2)}
+    assert idfs.keys() == expected.keys()
+    for (lid, idf) in expected.items():
+        assert np.isclose(idfs[lid], idf)
+
+
+def test_linked_idf_needs_all_concepts():
+    # Concepts that were not loaded, e.g. by load_concepts, are None.
+    concepts = _concepts()[:3] + [None] * 3
+    with pytest.raises(ValueError):
+        fcb.linked_idf(fcb.ConceptTerms(concepts))
+
+
+def test_filter_connections():
+    concepts = _concepts()
+    cnxs = [(0, 1), (0, 2), (1, 2), (3, 4), (3, 5), (5, 3)]
+    kept = list(fcb.filter_connections(cnxs, concepts, ["DSP"]))
+    assert kept == [(0, 1), (3, 4), (3, 5)]
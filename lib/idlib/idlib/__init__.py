@@ -2,11 +2,59 @@ name = "idlib"
 
 import os  # noqa
 import json  # noqa
+import logging  # noqa
 from .schema import Schema  # noqa
 from .config import gen_config  # noqa
 
 
-def load_kb(version_dir):
+def load_kb(version_dir, backend=None, workers=1, snapshot=False,
+            concept_types=None, sources=None, include_relationships=True):
+    """
+    Load the concepts of an iDISK version.
+
+    With snapshot=True, the first time a version is loaded a binary
+    snapshot of it is saved next to its concepts file, from which later
+    loads restore. The snapshot is rebuilt whenever the concepts file
+    changes. If the version directory isn't writable, the concepts are
+    loaded without saving a snapshot. Only the "columnar" backend
+    restores much faster, which is why it is the default with snapshots.
+    The "objects" backend still has to build every Concept, Atom,
+    Attribute and Relationship, so its snapshots only skip parsing the
+    JSON. See ``idlib.snapshot``.
+
+    :param str version_dir: The iDISK version directory.
+    :param str backend: How to hold the concepts in memory. "objects"
+                        returns a list of Concept instances. "columnar"
+                        returns an ``idlib.columnar.ColumnarKB``, which
+                        loads faster and uses far less memory, but is
+                        read-only, and always loads all concepts.
+                        Default "columnar" if snapshot is True and no
+                        concepts are filtered out, and "objects" otherwise.
+    :param int workers: Number of processes to parse the concepts file
+                        with. Only used by the "objects" backend.
+                        Default 1.
+    :param bool snapshot: Whether to load from and save a snapshot.
+                          Validating a snapshot computes the checksum of
+                          the concepts file. Default False.
+    :param list concept_types: Optional. Only load concepts of these
+                               types. See ``read_jsonl_file``.
+    :param list sources: Optional. Only load concepts with atoms from
+                         these sources. See ``read_jsonl_file``.
+    :param bool include_relationships: Whether to load relationships.
+                                       Default True.
+    :returns: The concepts.
+    :rtype: list or ColumnarKB
+    """
+    concept_filter = _get_concept_filter(concept_types, sources,
+                                         include_relationships)
+    if backend is None:
+        backend = "objects"
+        if snapshot is True and concept_filter is None:
+            backend = "columnar"
+    if backend not in ["objects", "columnar"]:
+        raise ValueError("backend must be 'objects' or 'columnar'.")
+    if backend == "columnar" and concept_filter is not None:
+        raise ValueError("The columnar backend always loads all concepts.")
     version_file = os.path.join(version_dir, ".version")
     version = open(version_file).read().strip()
     version_split = version.split('_')
@@ -17,16 +65,183 @@ def load_kb(version_dir):
     gen_config(config_dir, kb_version)
 
     concepts_file = os.path.join(version_dir, "concepts/concepts_merged.jsonl")
-    kb = read_jsonl_file(concepts_file)
+    # The concepts file may be compressed. See idlib.jsonl.
+    for ext in ['', ".gz", ".zst"]:
+        if os.path.exists(concepts_file + ext):
+            concepts_file += ext
+            break
+    if snapshot is False:
+        if backend == "columnar":
+            from .columnar import ColumnarKB
+            return ColumnarKB.from_jsonl(concepts_file)
+        return read_jsonl_file(concepts_file, workers=workers,
+                               concept_types=concept_types, sources=sources,
+                               include_relationships=include_relationships)
+
+    from .snapshot import (snapshot_path, is_valid, read_snapshot,
+                           read_snapshot_records, tee_records, SnapshotWriter)
+    snapshot_file = snapshot_path(concepts_file, backend=backend)
+    if is_valid(snapshot_file, concepts_file):
+        print(f"  from snapshot {snapshot_file}")
+        try:
+            if backend == "columnar":
+                return next(read_snapshot(snapshot_file))
+            records = read_snapshot_records(snapshot_file)
+            return _read_records(records, concept_filter=concept_filter)
+        except Exception as e:  # The snapshot is corrupt, so rebuild it.
+            logging.warning(f"Rebuilding snapshot '{snapshot_file}': {e}")
+            if concept_filter is not None:
+                concept_filter.excluded = set()
+                concept_filter.skipped_atoms = 0
+
+    if backend == "columnar":
+        from .columnar import ColumnarKB
+        kb = ColumnarKB.from_jsonl(concepts_file)
+        writer = SnapshotWriter(snapshot_file, concepts_file)
+        writer.write(kb)
+        writer.close()
+    else:
+        from .loading import read_records
+        # The snapshot has all the concepts, so filter after saving them.
+        records = read_records(concepts_file, workers=workers)
+        records = tee_records(records, snapshot_file, concepts_file)
+        kb = _read_records(records, concept_filter=concept_filter)
     return kb
 
 
-def read_jsonl_file(concepts_file):
-    from .data_elements import Concept
+def read_jsonl_file(concepts_file, registry=None, dedup_values=False,
+                    lazy=False, workers=1, concept_types=None, sources=None,
+                    include_relationships=True):
+    """
+    Read the concepts in a JSON lines file and resolve the objects of
+    their relationships to the concepts loaded alongside them. The file
+    may be compressed. See ``idlib.jsonl``.
+
+    If concept_types or sources are given, only the matching concepts
+    are loaded. Most other lines are skipped without parsing them.
+    Relationships to concepts that were not loaded keep the UI of the
+    concept as their object. The loaded atoms get the same UIs as when
+    all concepts are loaded. See ``idlib.loading.ConceptFilter``.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :param Registry registry: Optional. If specified, the concepts are
+                              added to this registry and relationships
+                              are resolved among all of its concepts.
+                              Use this to load several files together.
+    :param bool dedup_values: If True, equal large attribute values share
+                              a single string. See ``Attribute.from_dict``.
+                              Default False.
+    :param bool lazy: If True, attributes and relationships are only
+                      created when first accessed. See
+                      ``Concept.from_dict``. Default False.
+    :param int workers: If greater than 1, parse concepts_file in this
+                        many processes. See ``idlib.loading``. Default 1.
+    :param list concept_types: Optional. Only load concepts of these
+                               types, e.g. ["SDSI"].
+    :param list sources: Optional. Only load concepts with at least one
+                         atom from one of these sources.
+    :param bool include_relationships: If False, don't load the
+                                       relationships of the concepts.
+                                       Default True.
+    :returns: The concepts in concepts_file.
+    :rtype: list
+    """
+    concept_filter = _get_concept_filter(concept_types, sources,
+                                         include_relationships)
+    if workers > 1:
+        from .loading import read_records
+        records = read_records(concepts_file, workers=workers,
+                               concept_filter=concept_filter)
+        excluded = None if concept_filter is None else concept_filter.excluded
+        return _read_records(records, registry=registry,
+                             dedup_values=dedup_values, lazy=lazy,
+                             excluded=excluded)
+
+    from .data_elements import Concept, Registry
+    from .jsonl import open_jsonl
+    own_registry = registry is None
+    if own_registry:
+        registry = Registry(classes=[Concept])
+    value_pool = {} if dedup_values is True else None
     concepts = []
-    with open(concepts_file, 'r') as inF:
-        for line in inF:
-            concept = Concept.from_dict(json.loads(line.strip()))
-            concepts.append(concept)
-    Concept.resolve_relationships()
+    with registry:
+        with open_jsonl(concepts_file, 'r') as inF:
+            for line in inF:
+                if concept_filter is None:
+                    data = json.loads(line.strip())
+                else:
+                    data = concept_filter.parse(line.strip())
+                    # Number the atoms as if all concepts were loaded.
+                    concept_filter.skip_atoms()
+                    if data is None:
+                        continue
+                concept = Concept.from_dict(data, value_pool=value_pool,
+                                            lazy=lazy)
+                concepts.append(concept)
+    excluded = None if concept_filter is None else concept_filter.excluded
+    return _resolve_relationships(registry, own_registry, concepts,
+                                  excluded=excluded)
+
+
+def write_jsonl_file(concepts, outfile, **kwargs):
+    """
+    Write concepts to a JSON lines file, one per line. outfile is
+    compressed if it ends in ".gz" or ".zst".
+
+    :param iterable concepts: The concepts to write.
+    :param str outfile: Where to write the concepts.
+    :param kwargs: Passed to ``idlib.jsonl.JSONLWriter``, e.g.
+                   json_backend="orjson".
+    :returns: The number of concepts written.
+    :rtype: int
+    """
+    from .jsonl import JSONLWriter
+    with JSONLWriter(outfile, **kwargs) as writer:
+        return writer.write_all(concepts)
+
+
+def _get_concept_filter(concept_types, sources, include_relationships):
+    if (concept_types is None and sources is None and
+            include_relationships is True):
+        return None
+    from .loading import ConceptFilter
+    return ConceptFilter(concept_types=concept_types, sources=sources,
+                         include_relationships=include_relationships)
+
+
+def _read_records(records, registry=None, dedup_values=False, lazy=False,
+                  concept_filter=None, excluded=None):
+    """
+    As ``read_jsonl_file``, but for the concepts in an iterable of
+    records. See ``idlib.loading``. If concept_filter is given, only the
+    records it selects are loaded. Unresolved relationships to the UIs
+    in excluded are expected and not reported.
+    """
+    from .data_elements import Concept, Registry
+    from .loading import from_record
+    if concept_filter is not None:
+        records = concept_filter.filter_records(records)
+        excluded = concept_filter.excluded
+    own_registry = registry is None
+    if own_registry:
+        registry = Registry(classes=[Concept])
+    value_pool = {} if dedup_values is True else None
+    with registry:
+        concepts = [from_record(record, value_pool=value_pool, lazy=lazy)
+                    for record in records]
+    return _resolve_relationships(registry, own_registry, concepts,
+                                  excluded=excluded)
+
+
+def _resolve_relationships(registry, own_registry, concepts, excluded=None):
+    from .data_elements import Concept
+    unresolved = Concept.resolve_relationships(registry=registry)
+    if excluded is not None:
+        # Relationships to concepts that were filtered out stay as UIs.
+        unresolved = dict([(ui, rels) for (ui, rels) in unresolved.items()
+                           if ui not in excluded])
+    # With a shared registry, later files may resolve the rest.
+    if own_registry and len(unresolved) > 0:
+        n_rels = sum([len(rels) for rels in unresolved.values()])
+        logging.warning(f"{n_rels} relationship objects not found among {len(unresolved)} UIs, e.g. '{next(iter(unresolved))}'.")  # noqa
     return concepts
@@ -0,0 +1,707 @@
+"""
+A columnar, in-memory store for the iDISK knowledge base. Rather than
+one Python object per Atom, Attribute, and Relationship, each field is
+held in a column keyed by integer position: strings in a single UTF-8
+buffer, controlled vocabularies such as sources and term types as
+integer codes into a Vocabulary, and the elements of each concept as a
+contiguous range given by an offsets array.
+
+Concepts are accessed through lightweight views, which are created
+only when requested and support the read-only parts of the
+``idlib.data_elements`` API, e.g. ``get_atoms``, ``get_attributes``,
+``get_relationships``, and ``to_dict``.
+
+.. code-block:: python
+
+    kb = ColumnarKB.from_jsonl("concepts/concepts_merged.jsonl")
+    concept = kb.get("NMCD0000001")
+    for atom in concept.get_atoms():
+        print(atom.term, atom.src)
+    # Count atoms per source without creating any views.
+    counts = np.bincount(kb.atom_src, minlength=len(kb.vocab["src"]))
+"""
+
+import json
+import numpy as np
+from array import array
+from collections import OrderedDict
+
+from idlib import config
+from idlib.jsonl import open_jsonl
+
+
+# The fields of an atom. Any other fields are extra attributes.
+_ATOM_FIELDS = ("term", "src", "src_id", "term_type", "is_preferred")
+
+
+class Vocabulary(object):
+    """
+    A mapping between the strings of a controlled vocabulary, such as
+    the sources or the term types, and their integer codes.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def encode(self, value):
+        """
+        The code of value, adding it to this vocabulary if it is new.
+
+        :param str value: The string to encode.
+        :returns: The code.
+        :rtype: int
+        """
+        try:
+            return self._codes[value]
+        except KeyError:
+            code = len(self.values)
+            if code > np.iinfo(np.uint16).max:
+                raise ValueError("Vocabulary has too many values.")
+            self._codes[value] = code
+            self.values.append(value)
+            return code
+
+    def code(self, value):
+        """
+        The code of value.
+
+        :param str value: The string to look up.
+        :returns: The code.
+        :rtype: int
+        :raises KeyError: If value is not in this vocabulary.
+        """
+        return self._codes[value]
+
+
+class StringColumn(object):
+    """
+    An immutable column of strings stored as a single UTF-8 buffer
+    and an array of the offsets of each string into the buffer.
+
+    :param bytes buffer: The concatenated UTF-8 encoded strings.
+    :param numpy.ndarray offsets: int64 array of len(strings) + 1 offsets.
+    """
+
+    def __init__(self, buffer, offsets):
+        self._buffer = buffer
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._buffer[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.nbytes
+
+
+class _StringColumnBuilder(object):
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('q', [0])
+
+    def append(self, string):
+        self._buffer += string.encode("utf-8")
+        self._offsets.append(len(self._buffer))
+
+    def build(self):
+        offsets = np.array(self._offsets, dtype=np.int64)
+        return StringColumn(bytes(self._buffer), offsets)
+
+
+class _AttributeTable(object):
+    """
+    The columns of a set of attributes, grouped by the index of their
+    subject, a concept or a relationship. The attributes of subject i
+    are those from offsets[i] to offsets[i+1].
+    """
+
+    def __init__(self):
+        self._offsets = array('q', [0])
+        self._name = array('H')
+        self._src = array('H')
+        self._value = _StringColumnBuilder()
+        self.numbers = {}  # Values that are numbers rather than strings.
+
+    def append(self, attributes, vocab):
+        """
+        Add the attributes of the next subject. As in
+        ``idlib.data_elements``, duplicate attributes are dropped.
+
+        :param list attributes: The attributes in the iDISK JSON format.
+        :param dict vocab: The Vocabularies of the ColumnarKB.
+        """
+        seen = set()
+        for atr in attributes:
+            value = atr["atr_value"]
+            key = (atr["atr_name"], value, atr["src"])
+            if key in seen:
+                continue
+            seen.add(key)
+            if isinstance(value, str):
+                self._value.append(value)
+            else:
+                self.numbers[len(self._name)] = value
+                self._value.append('')
+            self._name.append(vocab["atr_name"].encode(atr["atr_name"]))
+            self._src.append(vocab["src"].encode(atr["src"]))
+        self._offsets.append(len(self._name))
+
+    def build(self):
+        self.offsets = np.array(self._offsets, dtype=np.int64)
+        self.name = np.array(self._name, dtype=np.uint16)
+        self.src = np.array(self._src, dtype=np.uint16)
+        self.value = self._value.build()
+        del self._offsets, self._name, self._src, self._value
+
+    def get_value(self, k):
+        try:
+            return self.numbers[k]
+        except KeyError:
+            return self.value[k]
+
+    @property
+    def nbytes(self):
+        return sum([self.offsets.nbytes, self.name.nbytes,
+                    self.src.nbytes, self.value.nbytes])
+
+
+class ColumnarKB(object):
+    """
+    The concepts of iDISK held in columns rather than as objects.
+    Use ``ColumnarKB.from_jsonl`` to load a concepts file.
+    Indexing or iterating over a ColumnarKB yields ConceptViews.
+
+    The columns are numpy arrays, where the atoms of concept i are
+    those from ``atom_offsets[i]`` to ``atom_offsets[i+1]``, and so
+    on for attributes and relationships.
+
+    * concept_ui, concept_type
+    * atom_offsets, atom_term, atom_src, atom_src_id, atom_term_type,
+      atom_is_preferred
+    * rel_offsets, rel_name, rel_object, rel_src
+
+    rel_object holds the index of the object concept, or -1 if it was
+    not found. Codes for concept_type, src, term_type, atr_name, and
+    rel_name are decoded with the Vocabularies in ``vocab``.
+    Attributes of concepts and of relationships are in
+    ``concept_attributes`` and ``rel_attributes``, respectively.
+    """
+
+    def __init__(self):
+        self.vocab = dict([(name, Vocabulary()) for name in
+                           ["concept_type", "src", "term_type",
+                            "atr_name", "rel_name"]])
+        self.atom_attrs = {}  # {atom index: extra attributes}
+        self.rel_unresolved = {}  # {relationship index: object UI}
+        self.concept_attributes = _AttributeTable()
+        self.rel_attributes = _AttributeTable()
+        self._ui2index = {}
+        self._built = False
+        self._concept_ui = _StringColumnBuilder()
+        self._concept_type = array('H')
+        self._atom_offsets = array('q', [0])
+        self._atom_term = _StringColumnBuilder()
+        self._atom_src = array('H')
+        self._atom_src_id = _StringColumnBuilder()
+        self._atom_term_type = array('H')
+        self._atom_is_preferred = array('b')
+        self._rel_offsets = array('q', [0])
+        self._rel_name = array('H')
+        self._rel_src = array('H')
+        self._rel_object_ui = []
+
+    def __len__(self):
+        if self._built is False:
+            return len(self._concept_type)
+        return len(self.concept_type)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ColumnarKB index out of range.")
+        return ConceptView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ConceptView(self, i)
+
+    @classmethod
+    def from_jsonl(cls, concepts_file):
+        """
+        Load a ColumnarKB from a JSON lines file of concepts.
+
+        :param str concepts_file: Path to the concepts file.
+        :rtype: ColumnarKB
+        """
+        kb = cls()
+        with open_jsonl(concepts_file, 'r') as inF:
+            for line in inF:
+                kb.add_concept(json.loads(line))
+        kb.build()
+        return kb
+
+    def add_concept(self, data):
+        """
+        Add a concept in the iDISK JSON format. See
+        ``Concept.from_dict``. Must be called before ``build``.
+        Duplicate atoms, attributes, and relationships are dropped,
+        with the same notion of equality as ``idlib.data_elements``.
+
+        :param dict data: The concept.
+        """
+        if self._built is True:
+            raise ValueError("Can't add concepts after build().")
+        vocab = self.vocab
+        # A duplicated UI refers to the first concept with that UI, in
+        # lookups and relationships, as in ``idlib.offset_index``.
+        self._ui2index.setdefault(data["ui"], len(self._concept_type))
+        self._concept_ui.append(data["ui"])
+        self._concept_type.append(
+            vocab["concept_type"].encode(data["concept_type"]))
+
+        seen = set()
+        for syn in data["synonyms"]:
+            attrs = attrs_key = None
+            if len(syn) > len(_ATOM_FIELDS):
+                attrs = dict([(k, v) for (k, v) in syn.items()
+                              if k not in _ATOM_FIELDS])
+                attrs_key = json.dumps(attrs, sort_keys=True)
+            key = (syn["term"].lower(), syn["src"], syn["src_id"],
+                   syn["term_type"], attrs_key)
+            if key in seen:
+                continue
+            seen.add(key)
+            if attrs is not None:
+                self.atom_attrs[len(self._atom_src)] = attrs
+            self._atom_term.append(syn["term"])
+            self._atom_src.append(vocab["src"].encode(syn["src"]))
+            self._atom_src_id.append(syn["src_id"])
+            self._atom_term_type.append(
+                vocab["term_type"].encode(syn["term_type"]))
+            self._atom_is_preferred.append(syn["is_preferred"])
+        self._atom_offsets.append(len(self._atom_src))
+
+        self.concept_attributes.append(data["attributes"], vocab)
+
+        seen = set()
+        for rel in data["relationships"]:
+            key = (rel["rel_name"], rel["object"], rel["src"])
+            if key in seen:
+                continue
+            seen.add(key)
+            self._rel_name.append(vocab["rel_name"].encode(rel["rel_name"]))
+            self._rel_src.append(vocab["src"].encode(rel["src"]))
+            self._rel_object_ui.append(rel["object"])
+            self.rel_attributes.append(rel["attributes"], vocab)
+        self._rel_offsets.append(len(self._rel_name))
+
+    def build(self):
+        """
+        Convert the added concepts to their final columns and resolve
+        the objects of relationships to concept indices.
+        """
+        self.concept_ui = self._concept_ui.build()
+        self.concept_type = np.array(self._concept_type, dtype=np.uint16)
+        self.atom_offsets = np.array(self._atom_offsets, dtype=np.int64)
+        self.atom_term = self._atom_term.build()
+        self.atom_src = np.array(self._atom_src, dtype=np.uint16)
+        self.atom_src_id = self._atom_src_id.build()
+        self.atom_term_type = np.array(self._atom_term_type, dtype=np.uint16)
+        self.atom_is_preferred = np.array(self._atom_is_preferred,
+                                          dtype=np.bool_)
+        self.rel_offsets = np.array(self._rel_offsets, dtype=np.int64)
+        self.rel_name = np.array(self._rel_name, dtype=np.uint16)
+        self.rel_src = np.array(self._rel_src, dtype=np.uint16)
+        self.rel_object = np.full(len(self._rel_object_ui), -1,
+                                  dtype=np.int32)
+        for (r, obj_ui) in enumerate(self._rel_object_ui):
+            try:
+                self.rel_object[r] = self._ui2index[obj_ui]
+            except KeyError:
+                self.rel_unresolved[r] = obj_ui
+        self.concept_attributes.build()
+        self.rel_attributes.build()
+        del (self._concept_ui, self._concept_type, self._atom_offsets,
+             self._atom_term, self._atom_src, self._atom_src_id,
+             self._atom_term_type, self._atom_is_preferred,
+             self._rel_offsets, self._rel_name, self._rel_src,
+             self._rel_object_ui)
+        self._built = True
+
+    def index(self, ui):
+        """
+        The index of the concept with the given UI. If the UI is
+        duplicated, that of the first concept with it.
+
+        :param str ui: The concept UI.
+        :rtype: int
+        :raises KeyError: If there is no such concept.
+        """
+        return self._ui2index[ui]
+
+    def get(self, ui):
+        """
+        The concept with the given UI, or the first one if the UI is
+        duplicated.
+
+        :param str ui: The concept UI.
+        :rtype: ConceptView
+        :raises KeyError: If there is no such concept.
+        """
+        return ConceptView(self, self._ui2index[ui])
+
+    @property
+    def nbytes(self):
+        """
+        The approximate size of the columns in bytes. Does not include
+        the UI index or any extra atom attributes.
+
+        :rtype: int
+        """
+        arrays = [self.concept_type, self.atom_offsets, self.atom_src,
+                  self.atom_term_type, self.atom_is_preferred,
+                  self.rel_offsets, self.rel_name, self.rel_src,
+                  self.rel_object]
+        columns = [self.concept_ui, self.atom_term, self.atom_src_id,
+                   self.concept_attributes, self.rel_attributes]
+        return sum([a.nbytes for a in arrays + columns])
+
+
+class ConceptView(object):
+    """
+    A read-only view of concept i of a ColumnarKB, with the same
+    accessors as ``idlib.data_elements.Concept``.
+    """
+
+    __slots__ = ("_kb", "_index")
+
+    def __init__(self, kb, index):
+        self._kb = kb
+        self._index = index
+
+    def __repr__(self):
+        return f"{self.preferred_atom} ({self.ui} {self.concept_type})"
+
+    def __str__(self):
+        return f"{self.ui}: {self.preferred_atom}"
+
+    def __eq__(self, other):
+        if not isinstance(other, ConceptView):
+            return False
+        return self._kb is other._kb and self._index == other._index
+
+    def __hash__(self):
+        return hash((id(self._kb), self._index))
+
+    @property
+    def ui(self):
+        return self._kb.concept_ui[self._index]
+
+    @property
+    def _prefix(self):
+        return self.ui[:-7]
+
+    @property
+    def concept_type(self):
+        code = self._kb.concept_type[self._index]
+        return self._kb.vocab["concept_type"][code]
+
+    @property
+    def num_atoms(self):
+        offsets = self._kb.atom_offsets
+        return int(offsets[self._index + 1] - offsets[self._index])
+
+    @property
+    def preferred_atom(self):
+        """
+        The preferred atom of this concept. See
+        ``Concept.preferred_atom``.
+
+        :rtype: AtomView
+        """
+        atoms = [a for a in self.get_atoms() if a.is_preferred is True]
+        if atoms == []:
+            atoms = list(self.get_atoms())
+        if atoms == []:
+            return None
+        # Read at call time, as the config may be loaded after import.
+        source_ranks = config.SOURCE_RANKS
+        if source_ranks is None:
+            return atoms[0]
+        return min(atoms, key=lambda atom: source_ranks[atom.src])
+
+    def get_atoms(self, atom_name=None, r_type="object"):
+        """
+        See ``DataElement.get_atoms``.
+
+        :returns: generator over AtomViews or dicts
+        :rtype: generator
+        """
+        if r_type.lower() not in ["object", "dict"]:
+            raise ValueError("rtype must be 'object' or 'dict'.")
+        offsets = self._kb.atom_offsets
+        for j in range(offsets[self._index], offsets[self._index + 1]):
+            atom = AtomView(self._kb, int(j))
+            if atom_name is not None and atom.term != atom_name:
+                continue
+            yield atom if r_type == "object" else atom.to_dict()
+
+    def get_attributes(self, atr_name=None, r_type="object"):
+        """
+        See ``DataElement.get_attributes``.
+
+        :returns: generator over AttributeViews or dicts
+        :rtype: generator
+        """
+        if r_type.lower() not in ["object", "dict"]:
+            raise ValueError("rtype must be 'object' or 'dict'.")
+        table = self._kb.concept_attributes
+        start, end = table.offsets[self._index], table.offsets[self._index + 1]
+        for k in range(start, end):
+            atr = AttributeView(self._kb, table, int(k), self)
+            if atr_name is not None and atr.atr_name != atr_name:
+                continue
+            yield atr if r_type == "object" else atr.to_dict()
+
+    def get_relationships(self, rel_name=None, r_type="object"):
+        """
+        See ``DataElement.get_relationships``.
+
+        :returns: generator over RelationshipViews or dicts
+        :rtype: generator
+        """
+        if r_type.lower() not in ["object", "dict"]:
+            raise ValueError("rtype must be 'object' or 'dict'.")
+        offsets = self._kb.rel_offsets
+        for r in range(offsets[self._index], offsets[self._index + 1]):
+            rel = RelationshipView(self._kb, int(r), self)
+            if rel_name is not None and rel.rel_name != rel_name:
+                continue
+            yield rel if r_type == "object" else rel.to_dict()
+
+    def to_dict(self):
+        """
+        This concept in the iDISK JSON format. See ``Concept.to_dict``.
+
+        :rtype: OrderedDict
+        """
+        return OrderedDict({"ui": self.ui,
+                            "concept_type": self.concept_type,
+                            "synonyms": list(self.get_atoms(r_type="dict")),
+                            "attributes": list(self.get_attributes(r_type="dict")),  # noqa
+                            "relationships": list(self.get_relationships(r_type="dict"))})  # noqa
+
+
+class AtomView(object):
+    """
+    A read-only view of atom j of a ColumnarKB, with the same
+    accessors as ``idlib.data_elements.Atom``. Atom UIs are not
+    stored in iDISK JSON files, so the UI of an AtomView is
+    derived from its position.
+    """
+
+    __slots__ = ("_kb", "_index")
+
+    def __init__(self, kb, index):
+        self._kb = kb
+        self._index = index
+
+    def __repr__(self):
+        template = "('{}' '{}' '{}' '{}' '{}' '{}')"
+        return template.format(self.ui, self.term, self.term_type,
+                               self.src, self.src_id, self.is_preferred)
+
+    def __str__(self):
+        return f"{self.term}"
+
+    @property
+    def ui(self):
+        return f"DA{self._index + 1:07}"
+
+    @property
+    def term(self):
+        return self._kb.atom_term[self._index]
+
+    @property
+    def term_key(self):
+        return self.term.lower()
+
+    @property
+    def src(self):
+        return self._kb.vocab["src"][self._kb.atom_src[self._index]]
+
+    @property
+    def src_id(self):
+        return self._kb.atom_src_id[self._index]
+
+    @property
+    def term_type(self):
+        code = self._kb.atom_term_type[self._index]
+        return self._kb.vocab["term_type"][code]
+
+    @property
+    def is_preferred(self):
+        return bool(self._kb.atom_is_preferred[self._index])
+
+    @property
+    def attrs(self):
+        return self._kb.atom_attrs.get(self._index, {})
+
+    def to_dict(self):
+        """
+        See ``Atom.to_dict``.
+
+        :rtype: dict
+        """
+        return {"term": self.term,
+                "src": self.src,
+                "src_id": self.src_id,
+                "term_type": self.term_type,
+                "is_preferred": self.is_preferred,
+                **self.attrs}
+
+
+class AttributeView(object):
+    """
+    A read-only view of an attribute of a concept or relationship
+    in a ColumnarKB, with the same accessors as
+    ``idlib.data_elements.Attribute``.
+    """
+
+    __slots__ = ("_kb", "_table", "_index", "subject")
+
+    def __init__(self, kb, table, index, subject):
+        self._kb = kb
+        self._table = table
+        self._index = index
+        self.subject = subject
+
+    def __str__(self):
+        return f"{self.subject} *{self.atr_name}* {self.atr_value}"
+
+    @property
+    def atr_name(self):
+        return self._kb.vocab["atr_name"][self._table.name[self._index]]
+
+    @property
+    def atr_value(self):
+        return self._table.get_value(self._index)
+
+    @property
+    def src(self):
+        return self._kb.vocab["src"][self._table.src[self._index]]
+
+    def to_dict(self, return_subject=False, verbose_subject=False):
+        """
+        See ``Attribute.to_dict``.
+
+        :rtype: OrderedDict
+        """
+        atr = OrderedDict({"atr_name": self.atr_name,
+                           "atr_value": self.atr_value,
+                           "src": self.src})
+        if return_subject is True:
+            if verbose_subject is True:
+                subj = str(self.subject)
+            else:
+                subj = self.subject.ui
+            atr.update({"subject": subj})
+            atr.move_to_end("subject", last=False)
+        return atr
+
+
+class RelationshipView(object):
+    """
+    A read-only view of relationship r of a ColumnarKB, with the same
+    accessors as ``idlib.data_elements.Relationship``. The object is
+    a ConceptView, or the object's UI if it was not found.
+    """
+
+    __slots__ = ("_kb", "_index", "subject")
+
+    def __init__(self, kb, index, subject):
+        self._kb = kb
+        self._index = index
+        self.subject = subject
+
+    def __str__(self):
+        return f"{self.subject} **{self.rel_name}** {self.object}"
+
+    @property
+    def ui(self):
+        return f"DR{self._index + 1:07}"
+
+    @property
+    def rel_name(self):
+        return self._kb.vocab["rel_name"][self._kb.rel_name[self._index]]
+
+    @property
+    def src(self):
+        return self._kb.vocab["src"][self._kb.rel_src[self._index]]
+
+    @property
+    def object(self):
+        obj = self._kb.rel_object[self._index]
+        if obj < 0:
+            return self._kb.rel_unresolved[self._index]
+        return ConceptView(self._kb, int(obj))
+
+    def get_attributes(self, r_type="object", return_subject=False):
+        """
+        See ``Relationship.get_attributes``.
+
+        :returns: generator over AttributeViews or dicts
+        :rtype: generator
+        """
+        table = self._kb.rel_attributes
+        start, end = table.offsets[self._index], table.offsets[self._index + 1]
+        for k in range(start, end):
+            atr = AttributeView(self._kb, table, int(k), self)
+            if r_type == "object":
+                yield atr
+            elif r_type == "dict":
+                yield atr.to_dict(return_subject=return_subject)
+
+    def to_dict(self, return_subject=False, verbose=False):
+        """
+        See ``Relationship.to_dict``.
+
+        :rtype: OrderedDict
+        """
+        obj = self.object
+        if verbose is True:
+            subj = str(self.subject)
+            obj = str(obj)
+        else:
+            subj = self.subject.ui
+            if isinstance(obj, ConceptView):
+                obj = obj.ui
+        atrs = list(self.get_attributes(r_type="dict"))
+        rel = OrderedDict({"rel_name": self.rel_name,
+                           "object": obj,
+                           "src": self.src,
+                           "attributes": atrs})
+        if return_subject is True:
+            rel.update({"subject": subj})
+            rel.move_to_end("subject", last=False)
+        return rel
@@ -0,0 +1,107 @@
+import json
+
+import idlib
+from idlib import config
+from idlib.columnar import ColumnarKB
+
+
+def _concept_dicts():
+    return [
+        {"ui": "NMCD0000001", "concept_type": "SDSI",
+         "synonyms": [{"term": "Vitamin C", "src": "NMCD", "src_id": "1",
+                       "term_type": "SY", "is_preferred": True},
+                      {"term": "ascorbic acid", "src": "NMCD", "src_id": "1",
+                       "term_type": "SY", "is_preferred": False,
+                       "linking_score": 0.9},
+                      {"term": "vitamin c", "src": "NMCD", "src_id": "1",
+                       "term_type": "SY", "is_preferred": True}],
+         "attributes": [{"atr_name": "background", "atr_value": "text",
+                         "src": "NMCD"},
+                        {"atr_name": "rank", "atr_value": 3, "src": "NMCD"},
+                        {"atr_name": "background", "atr_value": "text",
+                         "src": "NMCD"}],
+         "relationships": [{"rel_name": "interacts_with",
+                            "object": "DSLD0000002", "src": "NMCD",
+                            "attributes": [{"atr_name": "severity",
+                                            "atr_value": "High",
+                                            "src": "NMCD"}]},
+                           {"rel_name": "interacts_with",
+                            "object": "MISSING0000001", "src": "NMCD",
+                            "attributes": []}]},
+        {"ui": "DSLD0000002", "concept_type": "DSP",
+         "synonyms": [{"term": "Ginseng Plus", "src": "DSLD", "src_id": "2",
+                       "term_type": "SY", "is_preferred": True}],
+         "attributes": [],
+         "relationships": [{"rel_name": "has_ingredient",
+                            "object": "NMCD0000001", "src": "DSLD",
+                            "attributes": []}]},
+    ]
+
+
+def _write(tmp_path, dicts):
+    concepts_file = str(tmp_path / "concepts.jsonl")
+    with open(concepts_file, 'w') as outF:
+        for data in dicts:
+            outF.write(json.dumps(data) + '\n')
+    return concepts_file
+
+
+def _canonical(data):
+    def _sort(elems):
+        return sorted(elems, key=lambda e: json.dumps(e, sort_keys=True))
+
+    data = json.loads(json.dumps(data))
+    data["synonyms"] = _sort(data["synonyms"])
+    data["attributes"] = _sort(data["attributes"])
+    for rel in data["relationships"]:
+        rel["attributes"] = _sort(rel["attributes"])
+    data["relationships"] = _sort(data["relationships"])
+    return data
+
+
+def test_from_jsonl_matches_objects(tmp_path):
+    concepts_file = _write(tmp_path, _concept_dicts())
+    kb = ColumnarKB.from_jsonl(concepts_file)
+    concepts = idlib.read_jsonl_file(concepts_file)
+    assert len(kb) == len(concepts) == 2
+    for (view, concept) in zip(kb, concepts):
+        assert _canonical(view.to_dict()) == _canonical(concept.to_dict())
+        assert view.num_atoms == concept.num_atoms == len(concept._atoms)
+    nmcd = kb.get("NMCD0000001")
+    objects = [rel.object for rel in nmcd.get_relationships()]
+    assert kb.get("DSLD0000002") in objects
+    assert "MISSING0000001" in objects
+    assert list(kb.rel_unresolved.values()) == ["MISSING0000001"]
+
+
+def test_duplicate_uis(tmp_path):
+    dicts = _concept_dicts()
+    duplicate = dict(dicts[1], concept_type="SDSI", relationships=[])
+    after = dict(dicts[1], ui="NHPID0000003", relationships=[
+        {"rel_name": "has_ingredient", "object": "NHPID0000003",
+         "src": "DSLD", "attributes": []}])
+    kb = ColumnarKB.from_jsonl(_write(tmp_path, dicts + [duplicate, after]))
+    assert len(kb) == 4
+    assert [view.ui for view in kb] == ["NMCD0000001", "DSLD0000002",
+                                        "DSLD0000002", "NHPID0000003"]
+    # The UI refers to the first concept with it. Rows after the
+    # duplicate, and relationships to them, stay aligned.
+    assert kb.index("DSLD0000002") == 1
+    assert kb.get("DSLD0000002").concept_type == "DSP"
+    assert kb.index("NHPID0000003") == 3
+    assert kb.get("NHPID0000003").ui == "NHPID0000003"
+    assert kb[2].concept_type == "SDSI"
+    assert int(kb.rel_object[0]) == 1
+    assert int(kb.rel_object[2]) == 0
+    assert int(kb.rel_object[3]) == 3
+
+
+def test_preferred_atom_reads_config_at_call_time(tmp_path,
+                                                  monkeypatch):
+    dicts = _concept_dicts()
+    dicts[0]["synonyms"][2]["src"] = "DSLD"
+    kb = ColumnarKB.from_jsonl(_write(tmp_path, dicts))
+    monkeypatch.setattr(config, "SOURCE_RANKS", {"DSLD": 0, "NMCD": 1})
+    assert kb[0].preferred_atom.src == "DSLD"
+    monkeypatch.setattr(config, "SOURCE_RANKS", {"NMCD": 0, "DSLD": 1})
+    assert kb[0].preferred_atom.src == "NMCD"
@@ -3,6 +3,7 @@ from configparser import ConfigParser
 
 
 SOURCES = None
+SOURCE_RANKS = None  # {source: index in SOURCES}
 TERM_TYPES = None
 CONCEPT_TYPES = None
 
@@ -20,8 +21,10 @@ def gen_config(config_dir, version):
         configs = config[configs.get("refer_to")]
 
     global SOURCES
+    global SOURCE_RANKS
     global TERM_TYPES
     global CONCEPT_TYPES
     SOURCES = configs.get("sources").split()
+    SOURCE_RANKS = dict([(src, i) for (i, src) in enumerate(SOURCES)])
     TERM_TYPES = configs.get("term_types").split()
     CONCEPT_TYPES = configs.get("concept_types").split()
@@ -0,0 +1,228 @@
+"""
+Reading and writing connections files, i.e. pairs of indices of
+connected concepts in a concepts JSON lines file.
+
+Connections can be stored as two-column CSV or in a binary format
+consisting of a 64 byte header followed by the pairs as raw
+little-endian uint32, two per connection. The binary format can be
+memory-mapped with ``load_connections``. The header is
+
+.. code-block:: none
+
+    bytes 0-7    magic string b"IDCNX" and format version
+    bytes 8-15   number of connections, uint64
+    bytes 16-47  SHA-256 digest of the concepts file, or zeros if unknown
+    bytes 48-63  reserved
+"""
+
+import os
+import csv
+import struct
+import hashlib
+import numpy as np
+from itertools import islice
+
+
+MAGIC = b"IDCNX\x00\x00\x01"
+HEADER_SIZE = 64
+_HEADER_FORMAT = "<8sQ32s16x"
+_CHUNK_SIZE = 1 << 16  # Number of connections to read or write at once.
+
+
+def file_checksum(infile):
+    """
+    The SHA-256 digest of a file.
+
+    :param str infile: Path to the file.
+    :returns: The digest.
+    :rtype: bytes
+    """
+    sha = hashlib.sha256()
+    with open(infile, 'rb') as inF:
+        for block in iter(lambda: inF.read(1 << 20), b''):
+            sha.update(block)
+    return sha.digest()
+
+
+def is_binary_connections_file(infile):
+    """
+    Whether infile is a binary connections file.
+
+    :param str infile: Path to the connections file.
+    :rtype: bool
+    """
+    with open(infile, 'rb') as inF:
+        return inF.read(len(MAGIC)) == MAGIC
+
+
+def read_header(infile):
+    """
+    Read the header of a binary connections file.
+
+    :param str infile: Path to the binary connections file.
+    :returns: The number of connections and the checksum of the concepts
+              file, which is None if it was not recorded.
+    :rtype: tuple(int, bytes)
+    """
+    with open(infile, 'rb') as inF:
+        header = inF.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Truncated header in '{infile}'.")
+    magic, n_connections, checksum = struct.unpack(_HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError(f"'{infile}' is not a binary connections file.")
+    if checksum == bytes(32):
+        checksum = None
+    return n_connections, checksum
+
+
+def _check_concepts_file(infile, concepts_file):
+    _, checksum = read_header(infile)
+    if checksum is None:
+        return
+    if checksum != file_checksum(concepts_file):
+        msg = f"'{infile}' was not created from '{concepts_file}'."
+        raise ValueError(msg)
+
+
+def load_connections(infile, concepts_file=None):
+    """
+    Load connections as an array of shape (n, 2). Binary connections
+    files are memory-mapped, CSV files are read into memory.
+
+    :param str infile: Path to the connections file.
+    :param str concepts_file: Optional. If specified, check that the
+                              connections were computed from this file.
+    :returns: Array of connections.
+    :rtype: numpy.ndarray
+    """
+    if not is_binary_connections_file(infile):
+        cnxs = np.loadtxt(infile, dtype=np.uint32, delimiter=',', ndmin=2)
+        return cnxs.reshape(-1, 2)
+    if concepts_file is not None:
+        _check_concepts_file(infile, concepts_file)
+    n_connections, _ = read_header(infile)
+    if n_connections == 0:
+        return np.empty((0, 2), dtype=np.uint32)
+    return np.memmap(infile, dtype="<u4", mode='r', offset=HEADER_SIZE,
+                     shape=(n_connections, 2))
+
+
+def read_connections(infile, concepts_file=None):
+    """
+    Stream connections from a CSV or binary connections file.
+
+    :param str infile: Path to the connections file.
+    :param str concepts_file: Optional. If specified, check that the
+                              connections were computed from this file.
+    :returns: Generator over int tuples of connections.
+    :rtype: generator
+    """
+    if not is_binary_connections_file(infile):
+        with open(infile, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=',')
+            for (i, row) in enumerate(reader):
+                if len(row) != 2:
+                    raise ValueError(f"Improperly formatted CSV at line {i+1}.")  # noqa
+                yield (int(row[0]), int(row[1]))
+        return
+
+    cnxs = load_connections(infile, concepts_file=concepts_file)
+    for start in range(0, cnxs.shape[0], _CHUNK_SIZE):
+        for (i, j) in cnxs[start:start + _CHUNK_SIZE].tolist():
+            yield (i, j)
+
+
+def _connection_chunks(infile, concepts_file=None):
+    """
+    Stream connections as arrays of shape (k, 2) of up to _CHUNK_SIZE
+    connections each.
+    """
+    if is_binary_connections_file(infile):
+        cnxs = load_connections(infile, concepts_file=concepts_file)
+        for start in range(0, cnxs.shape[0], _CHUNK_SIZE):
+            yield cnxs[start:start + _CHUNK_SIZE]
+        return
+    with open(infile, 'r') as inF:
+        while True:
+            lines = list(islice(inF, _CHUNK_SIZE))
+            if len(lines) == 0:
+                return
+            chunk = np.loadtxt(lines, dtype=np.uint32, delimiter=',',
+                               ndmin=2)
+            if chunk.shape[1] != 2:
+                raise ValueError(f"Improperly formatted CSV in '{infile}'.")  # noqa
+            yield chunk
+
+
+def connection_indices(infile, concepts_file=None):
+    """
+    The indices of the concepts in any of the connections in infile,
+    found in one streaming pass over the file.
+
+    :param str infile: Path to the connections file.
+    :param str concepts_file: Optional. If specified, check that the
+                              connections were computed from this file.
+    :returns: Sorted array of unique indices.
+    :rtype: numpy.ndarray
+    """
+    # One flag per concept, grown as larger indices are seen.
+    seen = np.zeros(0, dtype=bool)
+    for chunk in _connection_chunks(infile, concepts_file=concepts_file):
+        top = int(chunk.max()) + 1
+        if top > len(seen):
+            grown = np.zeros(max(top, 2 * len(seen)), dtype=bool)
+            grown[:len(seen)] = seen
+            seen = grown
+        seen[chunk.ravel()] = True
+    return np.flatnonzero(seen).astype(np.uint32)
+
+
+def write_connections(connections, outfile, concepts_file=None, fmt=None):
+    """
+    Write connections to outfile.
+
+    :param iterable connections: int tuples of connections.
+    :param str outfile: Where to save the connections.
+    :param str concepts_file: Optional. The concepts file the connections
+                              index into. Its checksum is saved in the
+                              header of binary connections files.
+    :param str fmt: "csv" or "binary". Optional. If not specified,
+                    outfiles ending in ".csv" are written as CSV and
+                    all others as binary.
+    :returns: The number of connections written.
+    :rtype: int
+    """
+    if fmt is None:
+        fmt = "csv" if outfile.lower().endswith(".csv") else "binary"
+    if fmt not in ["csv", "binary"]:
+        raise ValueError("fmt must be 'csv' or 'binary'.")
+
+    n_connections = 0
+    if fmt == "csv":
+        with open(outfile, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter=',')
+            for cnx in connections:
+                writer.writerow(cnx)
+                n_connections += 1
+        return n_connections
+
+    checksum = bytes(32)
+    if concepts_file is not None:
+        checksum = file_checksum(concepts_file)
+    with open(outfile, 'wb') as outF:
+        # The number of connections is filled in once they are written.
+        outF.write(struct.pack(_HEADER_FORMAT, MAGIC, 0, checksum))
+        chunk = []
+        for cnx in connections:
+            chunk.append(cnx)
+            if len(chunk) == _CHUNK_SIZE:
+                outF.write(np.asarray(chunk, dtype="<u4").tobytes())
+                n_connections += len(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            outF.write(np.asarray(chunk, dtype="<u4").tobytes())
+            n_connections += len(chunk)
+        outF.seek(0, os.SEEK_SET)
+        outF.write(struct.pack(_HEADER_FORMAT, MAGIC, n_connections, checksum))
+    return n_connections
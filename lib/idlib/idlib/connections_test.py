@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+
+from idlib import connections
+
+
+CNXS = [(0, 1), (0, 5), (2, 3), (4, 70000), (3, 4)]
+
+
+@pytest.fixture
+def concepts_file(tmp_path):
+    path = tmp_path / "concepts.jsonl"
+    path.write_text('{"ui": "NMCD0000001"}\n{"ui": "NMCD0000002"}\n')
+    return str(path)
+
+
+def test_binary_round_trip(tmp_path, concepts_file):
+    outfile = str(tmp_path / "cnxs.cnx")
+    n = connections.write_connections(iter(CNXS), outfile,
+                                      concepts_file=concepts_file)
+    assert n == len(CNXS)
+    assert connections.is_binary_connections_file(outfile)
+    n_header, checksum = connections.read_header(outfile)
+    assert n_header == len(CNXS)
+    assert checksum == connections.file_checksum(concepts_file)
+
+    cnxs = connections.load_connections(outfile, concepts_file=concepts_file)
+    assert isinstance(cnxs, np.memmap)
+    assert cnxs.shape == (len(CNXS), 2)
+    assert [tuple(cnx) for cnx in cnxs.tolist()] == CNXS
+    assert list(connections.read_connections(outfile)) == CNXS
+
+
+def test_binary_empty(tmp_path):
+    outfile = str(tmp_path / "empty.cnx")
+    assert connections.write_connections([], outfile) == 0
+    assert connections.read_header(outfile) == (0, None)
+    assert connections.load_connections(outfile).shape == (0, 2)
+    assert list(connections.read_connections(outfile)) == []
+
+
+def test_csv_round_trip(tmp_path):
+    outfile = str(tmp_path / "cnxs.csv")
+    assert connections.write_connections(CNXS, outfile) == len(CNXS)
+    assert not connections.is_binary_connections_file(outfile)
+    assert open(outfile).read().splitlines()[:2] == ["0,1", "0,5"]
+    assert list(connections.read_connections(outfile)) == CNXS
+    cnxs = connections.load_connections(outfile)
+    assert cnxs.shape == (len(CNXS), 2)
+    assert [tuple(cnx) for cnx in cnxs.tolist()] == CNXS
+
+
+def test_csv_improperly_formatted(tmp_path):
+    infile = tmp_path / "bad.csv"
+    infile.write_text("0,1\n2,3,4\n")
+    with pytest.raises(ValueError):
+        list(connections.read_connections(str(infile)))
+
+
+def test_checksum_mismatch(tmp_path, concepts_file):
+    outfile = str(tmp_path / "cnxs.cnx")
+    connections.write_connections(CNXS, outfile, concepts_file=concepts_file)
+    with open(concepts_file, 'a') as outF:
+        outF.write('{"ui": "NMCD0000003"}\n')
+    with pytest.raises(ValueError):
+        connections.load_connections(outfile, concepts_file=concepts_file)
+    with pytest.raises(ValueError):
+        list(connections.read_connections(outfile,
+                                          concepts_file=concepts_file))
+    # Without a concepts file to check against, the connections load.
+    assert list(connections.read_connections(outfile)) == CNXS
+
+
+def test_write_connections_format_dispatch(tmp_path):
+    csv_file = str(tmp_path / "cnxs.CSV")
+    connections.write_connections(CNXS, csv_file)
+    assert not connections.is_binary_connections_file(csv_file)
+
+    binary_file = str(tmp_path / "cnxs.out")
+    connections.write_connections(CNXS, binary_file)
+    assert connections.is_binary_connections_file(binary_file)
+
+    forced_file = str(tmp_path / "forced.csv")
+    connections.write_connections(CNXS, forced_file, fmt="binary")
+    assert connections.is_binary_connections_file(forced_file)
+
+    with pytest.raises(ValueError):
+        connections.write_connections(CNXS, binary_file, fmt="tsv")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "binary"])
+def test_connection_indices(tmp_path, monkeypatch, concepts_file, fmt):
+    # Several chunks, with larger indices in later ones.
+    monkeypatch.setattr(connections, "_CHUNK_SIZE", 2)
+    outfile = str(tmp_path / "cnxs")
+    connections.write_connections(CNXS, outfile, fmt=fmt,
+                                  concepts_file=concepts_file)
+    indices = connections.connection_indices(outfile,
+                                             concepts_file=concepts_file)
+    assert indices.tolist() == [0, 1, 2, 3, 4, 5, 70000]
+
+    empty_file = str(tmp_path / "empty")
+    connections.write_connections([], empty_file, fmt=fmt)
+    assert connections.connection_indices(empty_file).tolist() == []
+
+
+def test_connection_indices_errors(tmp_path, concepts_file):
+    outfile = str(tmp_path / "cnxs.cnx")
+    connections.write_connections(CNXS, outfile, concepts_file=concepts_file)
+    with open(concepts_file, 'a') as outF:
+        outF.write('{"ui": "NMCD0000003"}\n')
+    with pytest.raises(ValueError):
+        connections.connection_indices(outfile, concepts_file=concepts_file)
+
+    infile = tmp_path / "bad.csv"
+    infile.write_text("0,1\n2,3,4\n")
+    with pytest.raises(ValueError):
+        connections.connection_indices(str(infile))
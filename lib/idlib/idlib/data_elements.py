@@ -1,62 +1,159 @@
-import re
+import sys
 import weakref
-import logging
 import numbers
 import warnings
-import numpy as np
 
 from copy import deepcopy
+from operator import attrgetter
+from types import MappingProxyType
 from collections import OrderedDict, defaultdict
 
 warnings.simplefilter("always", DeprecationWarning)
 warnings.simplefilter("always", UserWarning)
 
-from idlib.config import SOURCES, TERM_TYPES, CONCEPT_TYPES  # noqa
+from idlib.config import SOURCES, SOURCE_RANKS, TERM_TYPES, CONCEPT_TYPES  # noqa
 if SOURCES is None or TERM_TYPES is None or CONCEPT_TYPES is None:
     warnings.warn("No config specified. Loading defaults.", UserWarning)
 
 
+_EMPTY_ATTRS = MappingProxyType({})  # Atom.attrs for atoms without any.
+
+# Attribute values at least this long are shared between Attributes
+# when loading with a value pool. See Attribute.from_dict.
+LARGE_VALUE_LENGTH = 64
+
+
+def _intern(value):
+    """
+    Intern a string from a controlled vocabulary, such as a source,
+    term type, or attribute name. These are repeated across millions
+    of data elements, so a single copy of each is kept.
+    Non-string values are returned as is.
+
+    :param str value: The string to intern.
+    :rtype: str
+    """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+def _pool_value(value, value_pool):
+    """
+    Look up a large attribute value in value_pool, so that equal
+    values share a single string. See ``Attribute.from_dict``.
+
+    :param value: The attribute value.
+    :param dict value_pool: {value: value} of large values seen so far.
+                            If None, value is returned as is.
+    """
+    if (value_pool is not None and type(value) is str and
+            len(value) >= LARGE_VALUE_LENGTH):
+        return value_pool.setdefault(value, value)
+    return value
+
+
+def _hashed_field(name, doc=None):
+    """
+    A property for an Atom field that is part of the Atom's hash.
+    Setting the field resets the cached hash and term key.
+
+    :param str name: The name of the field.
+    :param str doc: The docstring of the property.
+    :rtype: property
+    """
+    slot = '_' + name
+
+    def fset(self, value):
+        setattr(self, slot, value)
+        self._term_key = None
+        self._hash = None
+
+    return property(attrgetter(slot), fset, doc=doc)
+
+
 class DataElement(object):
     """
     The base class for all data elements in iDISK.
 
+    Atoms, Attributes, and Relationships are created in the millions
+    when loading iDISK, so they define ``__slots__`` rather than
+    carrying an instance ``__dict__``.
+
     :param str ui: The unique identifier for this data element (Optional).
     """
 
+    # _ui_number is distinct from _counter, as it holds the number of this
+    # data element rather than the number of all data elements.
+    # _ui_prefix is set per instance from the UI. _ui caches the
+    # formatted UI and is reset whenever either of them changes.
+    __slots__ = ("_ui_number", "_ui_prefix", "_ui", "__weakref__")
+
     __refs__ = defaultdict(list)  # Holds all instances of each class
-    _prefix = ""
+    _use_global_registry = True  # Whether to add new instances to __refs__
+    _registries = []  # The Registry instances currently in scope.
+    _default_prefix = ""
     _counter = 0
     _ui_template = "{0}{1:07}"  # {_prefix}{_counter}
 
+    # Containers. None means that it is not implemented for
+    # this data element. Subclasses that implement a container
+    # set it on the instance.
+    _atoms = None
+    _attributes = None
+    _relationships = None
+    # Maps each type of element to the name of its container.
+    # Filled in once all the classes are defined.
+    _container_names = {}
+
     def __init__(self, ui=None):
-        # This is distinct from _counter, as it holds the number of this
-        # data element rather than the number of all data elements.
-        self._number = 0
-        # Containers. None means that it is not implemented for
-        # this data element.
-        self._atoms = None
-        self._attributes = None
-        self._relationships = None
         if ui is None:
+            # The UI is only formatted if it is requested.
             self._increment_counter()
-            self.ui = self._ui_template.format(self._prefix, self._counter)
+            self._ui_number = self._counter
+            self._ui_prefix = self._default_prefix
+            self._ui = None
         else:
             self.ui = ui
-            self.init_counter(int(ui.replace(self._prefix, "")))
+            self.init_counter(self._ui_number)
 
     def _register(self):
         """
-        Add this instance to __refs__. To be called at the end of __init__
-        in any class that inherits from DataElement.
+        Add this instance to __refs__, if the global registry is in use,
+        and to any Registry currently in scope. To be called at the end
+        of __init__ in any class that inherits from DataElement.
         """
-        self.__refs__[self.__class__].append(weakref.ref(self))
+        if DataElement._use_global_registry is True:
+            self.__refs__[self.__class__].append(weakref.ref(self))
+        for registry in DataElement._registries:
+            registry.add(self)
 
     def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
-        result.__dict__.update(self.__dict__)
+        for name in cls._slot_names():
+            try:
+                setattr(result, name, getattr(self, name))
+            except AttributeError:  # Slot was never set.
+                continue
+        if hasattr(self, "__dict__"):
+            result.__dict__.update(self.__dict__)
         return result
 
+    @classmethod
+    def _slot_names(cls):
+        """
+        The names of all the slots of this class and its parents.
+
+        :rtype: list
+        """
+        names = []
+        for klass in cls.__mro__:
+            for name in getattr(klass, "__slots__", ()):
+                if name not in ("__weakref__", "__dict__"):
+                    names.append(name)
+        return names
+
     # TODO: Handle recursive copying with Relationships.
     def __deepcopy__(self, memo):
         raise NotImplementedError()
@@ -70,16 +167,45 @@ class DataElement(object):
     @classmethod
     def get_instances(cls):
         """
-        Get all instances of the Concept class.
+        Get all live instances of this class from the global registry.
+        References to instances that have since been garbage collected
+        are dropped from the registry.
 
-        :returns: Generator over Concept instances.
+        :returns: Generator over instances of this class.
         :rtype: generator
         """
-        for inst_ref in cls.__refs__[cls]:
+        if DataElement._use_global_registry is False:
+            msg = "The global registry is disabled. Use a Registry instead."
+            raise RuntimeError(msg)
+        refs = [ref for ref in cls.__refs__[cls] if ref() is not None]
+        cls.__refs__[cls] = refs
+        for inst_ref in refs:
             inst = inst_ref()
             if inst is not None:
                 yield inst
 
+    @classmethod
+    def use_global_registry(cls, use=True):
+        """
+        Set whether new instances of all data elements are added to the
+        global registry ``DataElement.__refs__``. Turning the global
+        registry off keeps long running processes and repeated loads
+        from accumulating references. Use a Registry to track the
+        instances created within a given scope instead.
+
+        :param bool use: Whether to use the global registry. Default True.
+        """
+        DataElement._use_global_registry = use
+        if use is False:
+            DataElement.__refs__.clear()
+
+    @classmethod
+    def clear_instances(cls):
+        """
+        Remove all instances of this class from the global registry.
+        """
+        cls.__refs__.pop(cls, None)
+
     @classmethod
     def set_ui_prefix(cls, prefix):
         """
@@ -87,7 +213,7 @@ class DataElement(object):
 
         :param str prefix: The prefix to set.
         """
-        cls._prefix = prefix
+        cls._default_prefix = sys.intern(prefix)
 
     @classmethod
     def init_counter(cls, num):
@@ -105,100 +231,150 @@ class DataElement(object):
         """
         cls._counter += 1
 
+    @property
+    def _prefix(self):
+        """
+        The prefix of the unique identifier of this data element.
+        Prefixes are interned, as they are shared by many data elements.
+        """
+        return self._ui_prefix
+
+    @_prefix.setter
+    def _prefix(self, value):
+        self._ui_prefix = sys.intern(value)
+        self._ui = None
+
+    @property
+    def _number(self):
+        """
+        The number of the unique identifier of this data element.
+        """
+        return self._ui_number
+
+    @_number.setter
+    def _number(self, value):
+        self._ui_number = value
+        self._ui = None
+
     @property
     def ui(self):
         """
-        The unique identifier is always dynamically determined by the
-        values of self._prefix and self._number.
+        The unique identifier is always determined by the values of
+        self._prefix and self._number. It is formatted once and cached
+        until either of them changes.
         """
-        return self._ui_template.format(self._prefix, self._number)
+        ui = self._ui
+        if ui is None:
+            ui = self._ui_template.format(self._ui_prefix, self._ui_number)
+            self._ui = ui
+        return ui
 
     @ui.setter
     def ui(self, value):
         """
-        The unique identifier is always dynamically determined by the
-        values of self._prefix and self._number. However, the values of these
+        The unique identifier is always determined by the values of
+        self._prefix and self._number. However, the values of these
         hidden variables can be modified by using the UI setter.
 
         :param str value: The new unique identifier.
         """
-        if not re.match(r'.+[0-9]{7}', value):
-            msg = "UI must match the regex '.+[0-9]{7}'. E.g. DC0000001."
+        number = value[-7:]
+        if len(value) < 8 or not (number.isascii() and number.isdigit()):
+            msg = "UI must be a prefix followed by 7 digits. E.g. DC0000001."
             raise ValueError(msg)
-        self._number = int(value[-7:])
-        self._prefix = value[:-7]
+        self._ui_number = int(number)
+        self._ui_prefix = sys.intern(value[:-7])
+        self._ui = value
 
     def add_elements(self, elements):
         """
         Add a collection of elements to this data element if it does not
         already belong to it. Each element must be an Atom, Attribute,
-        or Relationship.
+        or Relationship. The elements are grouped by type and each group
+        is added to its container at once. If any element is not of one
+        of these types, none are added.
 
         :param iterable elements: The elements to add.
         """
-        if not hasattr(elements, "__iter__"):
-            elements = [elements]
-        for e in elements:
-            self._add_single_element(e)
+        batches = self._get_batches(elements, "add")
+        for (element_type, (container, batch)) in batches.items():
+            # Like set.add, set.update keeps any equal element already there.
+            container.update(batch)
+            if element_type is Atom:
+                self._atoms_changed()
 
     def rm_elements(self, elements):
         """
         Remove a collection of elements from this data element.
         Each element must be an Atom, Attribute, or Relationship.
+        If any element is not found, none are removed.
 
         :param iterable elements: The elements to remove.
         """
+        batches = self._get_batches(elements, "remove")
+        for (container, batch) in batches.values():
+            for element in batch:
+                if element not in container:
+                    msg = f"{element} not found in {self}"
+                    raise AttributeError(msg)
+        for (element_type, (container, batch)) in batches.items():
+            container.difference_update(batch)
+            if element_type is Atom:
+                self._atoms_changed()
+
+    def _get_batches(self, elements, action):
+        """
+        Group elements by type, along with the container of this
+        data element that each type belongs in.
+
+        :param iterable elements: Atoms, Attributes, or Relationships,
+                                  or a single one of them.
+        :param str action: "add" or "remove". Used in error messages.
+        :returns: {element_type: (container, [elements])}
+        :rtype: dict
+        """
         if not hasattr(elements, "__iter__"):
             elements = [elements]
-        for e in elements:
-            self._rm_single_element(e)
+        batches = {}
+        for element in elements:
+            element_type = type(element)
+            try:
+                batches[element_type][1].append(element)
+            except KeyError:
+                container = self._get_container(element_type, action)
+                batches[element_type] = (container, [element])
+        return batches
 
-    def _add_single_element(self, element):
+    def _get_container(self, element_type, action="add"):
         """
-        Add a single Atom, Attribute, or Relationship to this data element
-        if it does not already belong to it.
+        Get the container of this data element for the given type of
+        element, using the ``_container_names`` dispatch table.
 
-        :param element: Element to add. Must be of type Atom,
-                        Attribute, or Relationship.
+        :param type element_type: Atom, Attribute, or Relationship.
+        :param str action: "add" or "remove". Used in error messages.
+        :returns: The container.
+        :rtype: set
         """
-        # Maps element types to their containers.
-        container_map = {Atom: self._atoms,
-                         Attribute: self._attributes,
-                         Relationship: self._relationships}
-        element_type = type(element)
-        if element_type not in [Atom, Attribute, Relationship]:
-            raise TypeError(f"Can't add element of type '{element_type}'.")
-        container = container_map[element_type]
+        try:
+            container_name = self._container_names[element_type]
+        except KeyError:
+            if action == "add":
+                msg = f"Can't add element of type '{element_type}'."
+            else:
+                msg = f"Unknown element of type '{element_type}'."
+            raise TypeError(msg)
+        container = getattr(self, container_name)
         if container is None:
             msg = f"{element_type} not implemented for {type(self).__name__}."
             raise AttributeError(msg)
+        return container
 
-        if element not in container:
-            container.add(element)
-
-    def _rm_single_element(self, element):
+    def _atoms_changed(self):
         """
-        Remove a single Atom, Attribute, or Relationship from this
-        data element.
-
-        :param element: The element to remove. Must be of type Atom,
-                        Attribute, or Relationship.
+        Called whenever Atoms are added to or removed from this data
+        element, so that any values cached from them can be reset.
         """
-        # Maps element types to their containers.
-        container_map = {Atom: self._atoms,
-                         Attribute: self._attributes,
-                         Relationship: self._relationships}
-        element_type = type(element)
-        if element_type not in [Atom, Attribute, Relationship]:
-            raise TypeError(f"Unknown element of type '{element_type}'.")
-        container = container_map[element_type]
-        if container is None:
-            msg = f"{element_type} not implemented for {type(self).__name__}."
-            raise AttributeError(msg)
-        if element not in container:
-            msg = f"{element} not found in {self}"
-            raise AttributeError(msg)
-        container.discard(element)
+        pass
 
     @property
     def num_atoms(self):
@@ -300,17 +476,29 @@ class Atom(DataElement):
     :param str ui: The iDISK unique identifier of this atom. Optional.
     """
 
-    _prefix = "DA"
+    __slots__ = ("_term", "_src", "_src_id", "_term_type", "is_preferred",
+                 "_attrs", "_term_key", "_hash")
+
+    _default_prefix = "DA"
+
+    term = _hashed_field("term", "The string of this atom.")
+    src = _hashed_field("src", "The source of this atom.")
+    src_id = _hashed_field("src_id", "The ID of this atom in its source.")
+    term_type = _hashed_field("term_type", "The type of term.")
 
     def __init__(self, term, src, src_id, term_type, is_preferred,
                  ui=None, **attrs):
         super().__init__(ui=ui)
-        self.term = term  # 5-HTP
-        self.src = src  # NMCD
-        self.src_id = src_id  # 1234
-        self.term_type = term_type  # SN
+        self._term = term  # 5-HTP
+        self._src = src  # NMCD
+        self._src_id = src_id  # 1234
+        self._term_type = term_type  # SN
         self.is_preferred = is_preferred  # True
-        self._attrs = attrs
+        # The lowercased term and the hash are computed when first needed.
+        self._term_key = None
+        self._hash = None
+        # Most atoms have no extra attributes, so don't keep a dict for them.
+        self._attrs = attrs if len(attrs) > 0 else None
         self._check_params()
         self._register()
 
@@ -324,10 +512,12 @@ class Atom(DataElement):
         return f"{self.term}"
 
     def __hash__(self):
-        return hash((self.term.lower(),
-                     self.src,
-                     self.src_id,
-                     self.term_type))
+        if self._hash is None:
+            self._hash = hash((self.term_key,
+                               self._src,
+                               self._src_id,
+                               self._term_type))
+        return self._hash
 
     def __eq__(self, other):
         """
@@ -342,31 +532,55 @@ class Atom(DataElement):
         :param Atom other: The atom to test equivalence to.
         :rtype: bool
         """
+        if self is other:
+            return True
         if not isinstance(other, Atom):
             return False
-        return all([self.term.lower() == other.term.lower(),
-                    self.src == other.src,
-                    self.src_id == other.src_id,
-                    self.term_type == other.term_type,
-                    self.attrs == other.attrs])
+        if hash(self) != hash(other):
+            return False
+        # Hashing computed the term keys.
+        return (self._term_key == other._term_key and
+                self._src == other._src and
+                self._src_id == other._src_id and
+                self._term_type == other._term_type and
+                self.attrs == other.attrs)
 
     def _check_params(self):
         assert isinstance(self.term, str)
         assert isinstance(self.src_id, str)
         assert isinstance(self.is_preferred, bool)
-        assert isinstance(self.ui, (type(None), str))
+        assert isinstance(self._prefix, str)
         if SOURCES is not None:
             assert self.src.upper() in SOURCES
         if TERM_TYPES is not None:
             assert self.term_type.upper() in TERM_TYPES
 
+    @property
+    def term_key(self):
+        """
+        The lowercased term, which is what Atoms are compared on.
+        Computed once and cached.
+
+        :rtype: str
+        """
+        key = self._term_key
+        if key is None:
+            key = self._term.lower()
+            if key == self._term:
+                key = self._term  # Don't keep two copies of the same string.
+            self._term_key = key
+        return key
+
     @property
     def attrs(self):
         """
-        Returns the Attributes of this Atom.
+        Returns the Attributes of this Atom. If this Atom has no
+        attributes, the returned mapping is read-only.
 
-        :rtype: Attribute
+        :rtype: dict
         """
+        if self._attrs is None:
+            return _EMPTY_ATTRS
         return self._attrs
 
     def to_dict(self):
@@ -407,11 +621,17 @@ class Atom(DataElement):
              "is_preferred": bool,
              **attrs}
 
+        The src and term_type strings are interned.
+
         :param dict data: The JSON data to load.
         :returns: Atom instance of data.
         :rtype: Atom
         """
-        return cls(**data)
+        kwargs = dict(data)
+        for field in ("src", "term_type"):
+            if field in kwargs:
+                kwargs[field] = _intern(kwargs[field])
+        return cls(**kwargs)
 
 
 class Concept(DataElement):
@@ -425,12 +645,20 @@ class Concept(DataElement):
     :param str ui: the iDISK CUI for this concept. Optional.
     """
 
-    _prefix = "DC"  # The default prefix. Can be changed for each instance.
+    _default_prefix = "DC"  # Can be changed for each instance.
+
+    # Raw attribute and relationship data not yet made into objects,
+    # when loaded with Concept.from_dict(..., lazy=True).
+    _lazy_attributes = None
+    _lazy_relationships = None
+    _value_pool = None
+    _ui_index = None  # For resolving lazy relationships. {UI: Concept}
 
     def __init__(self, concept_type, atoms=None, ui=None):
         super().__init__(ui=ui)
         self.concept_type = concept_type
         self._preferred_atom = None
+        self._hash = None  # Computed when first needed.
         self._atoms = set(atoms) if atoms is not None else set()
         self._attributes = set()
         self._relationships = set()
@@ -444,24 +672,87 @@ class Concept(DataElement):
         return f"{self.ui}: {self.preferred_atom}"
 
     def __hash__(self):
-        return hash((self.concept_type,
-                     tuple(self._atoms)))
+        if self._hash is None:
+            self._hash = hash((self.concept_type,
+                               frozenset(self._atoms)))
+        return self._hash
 
     def __eq__(self, other):
         """
         Concept equivalence does not consider attributes or relationships.
         """
+        if self is other:
+            return True
         if not isinstance(other, Concept):
             return False
-        return all([self.concept_type == other.concept_type,
-                    self._atoms == other._atoms])
+        if hash(self) != hash(other):
+            return False
+        return (self.concept_type == other.concept_type and
+                self._atoms == other._atoms)
+
+    def _atoms_changed(self):
+        self._hash = None
+        self._preferred_atom = None
+
+    # The attribute and relationship containers are properties so that
+    # lazily loaded data is made into objects on first access, however
+    # the containers are accessed.
+    @property
+    def _attributes(self):
+        if self._lazy_attributes is not None:
+            self._hydrate_attributes()
+        return self.__dict__["_attributes"]
+
+    @_attributes.setter
+    def _attributes(self, value):
+        self.__dict__["_attributes"] = value
+
+    @property
+    def _relationships(self):
+        if self._lazy_relationships is not None:
+            self._hydrate_relationships()
+        return self.__dict__["_relationships"]
+
+    @_relationships.setter
+    def _relationships(self, value):
+        self.__dict__["_relationships"] = value
+
+    def _hydrate_attributes(self):
+        """
+        Create the Attributes of this concept from the raw data kept
+        by ``Concept.from_dict(..., lazy=True)``.
+        """
+        data = self._lazy_attributes
+        self._lazy_attributes = None
+        atrs = [Attribute.from_dict(atr, subject=self,
+                                    value_pool=self._value_pool)
+                for atr in data]
+        self.__dict__["_attributes"].update(atrs)
+
+    def _hydrate_relationships(self):
+        """
+        Create the Relationships of this concept from the raw data kept
+        by ``Concept.from_dict(..., lazy=True)``. If
+        ``Concept.resolve_relationships`` has already been run, their
+        objects are resolved with the same UI index.
+        """
+        data = self._lazy_relationships
+        self._lazy_relationships = None
+        rels = [Relationship.from_dict(rel, subject=self,
+                                       value_pool=self._value_pool)
+                for rel in data]
+        if self._ui_index is not None:
+            for rel in rels:
+                rel.object = self._ui_index.get(rel.object, rel.object)
+            self._ui_index = None
+        self.__dict__["_relationships"].update(rels)
 
     def _check_params(self):
         if self._atoms == set():
             raise AssertionError("Concept must have at least one Atom.")
         assert all([isinstance(atom, Atom) for atom in self._atoms])
         assert isinstance(self.concept_type, str)
-        assert isinstance(self.ui, (type(None), str))
+        assert isinstance(self._prefix, str)
         if CONCEPT_TYPES is not None:
             assert self.concept_type in CONCEPT_TYPES
 
@@ -478,18 +769,18 @@ class Concept(DataElement):
 
         :rtype: Atom
         """
-        if self._atoms == []:
+        if len(self._atoms) == 0:
             return None
         if self._preferred_atom is None:
             atoms = [atom for atom in self._atoms if atom.is_preferred is True]
             if atoms == []:
-                atoms = list(self.get_atoms())
+                atoms = list(self._atoms)
 
-            if SOURCES is None:
+            if SOURCE_RANKS is None:
                 self._preferred_atom = atoms[0]
             else:
-                atom_rank = [SOURCES.index(atom.src) for atom in atoms]
-                pref = atoms[np.argmin(atom_rank)]
+                # Ties go to the first of the tied atoms.
+                pref = min(atoms, key=lambda atom: SOURCE_RANKS[atom.src])
                 self._preferred_atom = pref
         return self._preferred_atom
 
@@ -560,7 +851,7 @@ class Concept(DataElement):
         return new_concept
 
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, value_pool=None, lazy=False):
         """
         Creates a concept from a JSON object. The JSON object must have
         the format:
@@ -591,47 +882,102 @@ class Concept(DataElement):
         Concept.resolve_relationships() after all Concepts have
         been created.
 
+        If lazy is True, the "attributes" and "relationships" data
+        are kept as is and only made into Attribute and Relationship
+        instances the first time they are accessed, e.g. by
+        ``get_attributes()`` or ``get_relationships()``. This speeds up
+        loading when only the atoms are needed.
+
         :param dict data: Input JSON data.
+        :param dict value_pool: Optional. Shared by the attributes of
+                                this concept and its relationships.
+                                See ``Attribute.from_dict``.
+        :param bool lazy: Whether to delay creating attributes and
+                          relationships until they are accessed.
+                          Default False.
         :returns: Concept instance built from data.
         :rtype: Concept
         """
         atoms = [Atom.from_dict(syn) for syn in data["synonyms"]]
-        concept = cls(concept_type=data["concept_type"],
+        concept = cls(concept_type=_intern(data["concept_type"]),
                       atoms=atoms,
                       ui=data["ui"])
-        concept.add_elements(atoms)
-        atrs = [Attribute.from_dict(atr, subject=concept)
+        if lazy is True:
+            if len(data["attributes"]) > 0:
+                concept._lazy_attributes = data["attributes"]
+            if len(data["relationships"]) > 0:
+                concept._lazy_relationships = data["relationships"]
+            if value_pool is not None:
+                concept._value_pool = value_pool
+            return concept
+        atrs = [Attribute.from_dict(atr, subject=concept,
+                                    value_pool=value_pool)
                 for atr in data["attributes"]]
-        concept.add_elements(atrs)
         # Because we do not have a concept mapping yet, these relationships
         # will have concept UIs as their objects. This can be resolved via
         # Concept.resolve_relationships()
-        rels = [Relationship.from_dict(rel, subject=concept)
+        rels = [Relationship.from_dict(rel, subject=concept,
+                                       value_pool=value_pool)
                 for rel in data["relationships"]]
-        concept.add_elements(rels)
+        concept.add_elements(atrs + rels)
         return concept
 
     @classmethod
-    def resolve_relationships(cls):
+    def resolve_relationships(cls, registry=None):
         """
         When multiple Concept instances are created from a JSON lines file
         and contain relationships that reference each other, we have to wait
         until all concepts are created before the objects of the relationships
         resolved into Relationship instances from their UIs. When this is the
         case, this method should be run after creating all concept instances.
+
+        With a registry, the UI index and the relationships that are
+        still unresolved are kept in the registry between calls. Each
+        call then only indexes the concepts added since the last one,
+        e.g. those of the file just read, and retries only the
+        unresolved relationships. This keeps loading several files into
+        one registry linear in the total number of concepts.
+
+        The relationships of concepts loaded with
+        ``Concept.from_dict(..., lazy=True)`` are resolved when they are
+        first accessed instead, and so are not included in the report.
+
+        :param Registry registry: If specified, resolve only among the
+                                  concepts in this registry. Otherwise,
+                                  all concepts in the global registry.
+        :returns: The relationships whose objects are still unresolved,
+                  as {object UI: [Relationship]}.
+        :rtype: dict
         """
-        concepts = cls.get_instances()
-        ui2concepts = dict([(c.ui, c) for c in concepts])
-        for c in ui2concepts.values():
+        if registry is None:
+            concepts = cls.get_instances()
+            ui2concepts = {}
+            pending = []
+        else:
+            concepts = registry._new_instances(cls)
+            ui2concepts = registry.ui_index
+            pending = registry.unresolved
+
+        for c in concepts:
+            ui2concepts[c.ui] = c
+            if c._lazy_relationships is not None:
+                c._ui_index = ui2concepts
+                continue
             for rel in c._relationships:
                 if isinstance(rel.object, str):
-                    try:
-                        obj_concept = ui2concepts[rel.object]
-                    except KeyError:
-                        msg = f"Object of {rel.rel_name} '{rel.object}' not found"  # noqa
-                        logging.warning(msg)
-                        continue
-                    rel.object = obj_concept
+                    pending.append(rel)
+
+        unresolved = []
+        report = defaultdict(list)
+        for rel in pending:
+            try:
+                rel.object = ui2concepts[rel.object]
+            except KeyError:
+                unresolved.append(rel)
+                report[rel.object].append(rel)
+        if registry is not None:
+            registry.unresolved = unresolved
+        return dict(report)
 
 
 class Attribute(DataElement):
@@ -644,7 +990,9 @@ class Attribute(DataElement):
     :param str src: The source code of where this attribute was found.
     """
 
-    _prefix = "DAT"
+    __slots__ = ("subject", "atr_name", "atr_value", "src")
+
+    _default_prefix = "DAT"
 
     def __init__(self, subject, atr_name, atr_value, src, ui=None):
         super().__init__(ui=ui)
@@ -757,7 +1105,7 @@ class Attribute(DataElement):
         return new_atr
 
     @classmethod
-    def from_dict(cls, data, subject):
+    def from_dict(cls, data, subject, value_pool=None):
         """
         Create an Attribute instance from data.
         data must be a dict with the following format:
@@ -768,15 +1116,23 @@ class Attribute(DataElement):
              "atr_value": str,
              "src": str}
 
+        The atr_name and src strings are interned. Long values,
+        such as monograph text, are often repeated across concepts.
+        If value_pool is given, string values of at least
+        ``LARGE_VALUE_LENGTH`` characters are looked up in it, so that
+        Attributes with equal values share a single string.
+
         :param dict data: Input dictionary
         :param Concept/Relationship subject: Subject of this attribute.
+        :param dict value_pool: Optional. {value: value} of large values
+                                seen so far, e.g. within one load.
         :returns: Attribute instance
         :rtype: Attribute
         """
         atr = cls(subject=subject,
-                  atr_name=data["atr_name"],
-                  atr_value=data["atr_value"],
-                  src=data["src"])
+                  atr_name=_intern(data["atr_name"]),
+                  atr_value=_pool_value(data["atr_value"], value_pool),
+                  src=_intern(data["src"]))
         return atr
 
 
@@ -792,7 +1148,9 @@ class Relationship(DataElement):
     :param list(Attribute) attributes: Any attributes of this relationship.
     """
 
-    _prefix = "DR"
+    __slots__ = ("subject", "rel_name", "object", "src", "_attributes")
+
+    _default_prefix = "DR"
 
     # TODO: Make sure it's really okay to use 'object' here.
     def __init__(self, subject, rel_name, object, src, ui=None):
@@ -962,7 +1320,7 @@ class Relationship(DataElement):
         return new_rel
 
     @classmethod
-    def from_dict(cls, data, subject, concept_mapping=None):
+    def from_dict(cls, data, subject, concept_mapping=None, value_pool=None):
         """
         Create an Relationship instance from data.
         data must be a dict with the following format:
@@ -984,6 +1342,7 @@ class Relationship(DataElement):
                                      is equal to data["object"]. Optional.
                                      If None, the object UI is used instead
                                      of a Concept instance.
+        :param dict value_pool: Optional. See ``Attribute.from_dict``.
         :returns: Relationship instance
         :rtype: Relationship
         """
@@ -996,11 +1355,98 @@ class Relationship(DataElement):
                 raise KeyError(msg)
 
         rel = cls(subject=subject,
-                  rel_name=data["rel_name"],
+                  rel_name=_intern(data["rel_name"]),
                   object=obj,
-                  src=data["src"])
-        atrs = [Attribute.from_dict(atr, subject=rel)
+                  src=_intern(data["src"]))
+        atrs = [Attribute.from_dict(atr, subject=rel, value_pool=value_pool)
                 for atr in data["attributes"]]
         rel.add_elements(atrs)
 
         return rel
+
+
+DataElement._container_names.update({Atom: "_atoms",
+                                     Attribute: "_attributes",
+                                     Relationship: "_relationships"})
+
+
+class Registry(object):
+    """
+    Keeps track of the data elements created while it is in scope,
+    e.g. the concepts of a single load of iDISK. Unlike the global
+    registry, ``DataElement.__refs__``, a Registry holds its elements
+    directly and is discarded along with them.
+
+    .. code-block:: python
+
+        with Registry(classes=[Concept]) as registry:
+            concepts = [Concept.from_dict(data) for data in lines]
+        Concept.resolve_relationships(registry=registry)
+
+    :param list classes: The data element classes to keep track of.
+                         Optional. If None, all data elements are kept.
+    """
+
+    def __init__(self, classes=None):
+        self.classes = tuple(classes) if classes is not None else None
+        self._instances = defaultdict(list)
+        # Used by Concept.resolve_relationships.
+        self.ui_index = {}  # {UI: Concept}
+        self.unresolved = []  # Relationships with a UI as their object.
+        self._num_seen = defaultdict(int)
+
+    def __enter__(self):
+        DataElement._registries.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        DataElement._registries.remove(self)
+        return False
+
+    def __len__(self):
+        return sum([len(insts) for insts in self._instances.values()])
+
+    def add(self, element):
+        """
+        Add a data element to this registry.
+
+        :param DataElement element: The element to add.
+        """
+        if self.classes is None or isinstance(element, self.classes):
+            self._instances[type(element)].append(element)
+
+    def get_instances(self, cls):
+        """
+        Get the instances of cls in this registry.
+
+        :param type cls: The data element class, e.g. Concept.
+        :returns: Generator over instances of cls.
+        :rtype: generator
+        """
+        for inst in self._instances[cls]:
+            yield inst
+
+    def _new_instances(self, cls):
+        """
+        The instances of cls added since the last call to this method.
+
+        :param type cls: The data element class, e.g. Concept.
+        :rtype: list
+        """
+        insts = self._instances[cls]
+        start = self._num_seen[cls]
+        self._num_seen[cls] = len(insts)
+        return insts[start:]
+
+    def unresolved_report(self):
+        """
+        The relationships in this registry whose objects are unresolved.
+        See ``Concept.resolve_relationships``.
+
+        :returns: {object UI: [Relationship]}
+        :rtype: dict
+        """
+        report = defaultdict(list)
+        for rel in self.unresolved:
+            report[rel.object].append(rel)
+        return dict(report)
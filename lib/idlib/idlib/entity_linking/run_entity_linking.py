@@ -378,7 +378,4 @@ if __name__ == "__main__":
     # belonging to the existing Concepts, and update the Relationship
     # objects accordingly.
     logging.info(f"Saving concepts to {args.outfile}")
-    with open(args.outfile, 'w') as outF:
-        for concept in concepts:
-            json.dump(concept.to_dict(), outF)
-            outF.write('\n')
+    idlib.write_jsonl_file(concepts, args.outfile)
@@ -25,6 +25,10 @@ def parse_args():
                         help="Neo4j username for this graph.")
     parser.add_argument("--password", type=str, default="password",
                         help="Neo4j password for this graph.")
+    parser.add_argument("--snapshot", action="store_true", default=False,
+                        help="""Save a snapshot of the concepts on the first
+                                load and restore from it afterwards.
+                                See idlib.snapshot.""")
     args = parser.parse_args()
     return args
 
@@ -118,7 +122,10 @@ if __name__ == "__main__":
     graph.begin()
     logging.info("<neo4j>  Success.")
 
-    concepts = idlib.load_kb(args.idisk_version_dir)
+    # The graph is built from Concept objects, so don't use the
+    # columnar backend that snapshots otherwise default to.
+    concepts = idlib.load_kb(args.idisk_version_dir, backend="objects",
+                             snapshot=args.snapshot)
 
     logging.info(f"<neo4j> Populating graph.")
     populate_neo4j_graph(graph, concepts)
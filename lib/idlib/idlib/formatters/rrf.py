@@ -26,6 +26,10 @@ def parse_args():
                         help="iDISK version to load")
     parser.add_argument("--outdir", type=str, required=True,
                         help="Where to write the RRF files.")
+    parser.add_argument("--snapshot", action="store_true", default=False,
+                        help="""Save a snapshot of the concepts on the first
+                                load and restore from it afterwards.
+                                See idlib.snapshot.""")
     args = parser.parse_args()
     return args
 
@@ -103,7 +107,8 @@ def create_metathesaurus_files(concepts, output_dir):
 
 if __name__ == "__main__":
     args = parse_args()
-    concepts = idlib.load_kb(args.idisk_version_dir)
+    concepts = idlib.load_kb(args.idisk_version_dir, backend="objects",
+                             snapshot=args.snapshot)
     # concepts = Concept.read_jsonl_file(args.concepts_file)
     logging.info(f"<rrf> Populating Metathesaurus files.")
     create_metathesaurus_files(concepts, args.outdir)
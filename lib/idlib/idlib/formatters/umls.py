@@ -31,6 +31,10 @@ def parse_args():
     parser.add_argument("--use_semtypes", type=str, default=None,
                         help="""File of semantic types to use (long names),
                                 one per line.""")
+    parser.add_argument("--snapshot", action="store_true", default=False,
+                        help="""Save a snapshot of the concepts on the first
+                                load and restore from it afterwards.
+                                See idlib.snapshot.""")
     return parser.parse_args()
 
 
@@ -72,8 +76,11 @@ def main(args):
                      for sublist in mrsty.values() for row in sublist])
     atr_count += 1
 
-    # Load iDISK
-    idisk = idlib.load_kb(args.idisk_version_dir)
+    # Load iDISK. Only the SDSI concepts are linked to the UMLS. Their
+    # atoms get the same AUIs as in the full load of rrf.py.
+    idisk = idlib.load_kb(args.idisk_version_dir, concept_types=["SDSI"],
+                          include_relationships=False,
+                          snapshot=args.snapshot)
 
     # UMLS CUI to list(iDISK concepts)
     umls2idisk = find_umls_links(idisk, mrconso)
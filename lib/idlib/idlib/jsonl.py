@@ -0,0 +1,164 @@
+"""
+Reading and writing JSON lines files of concepts, optionally compressed.
+Files ending in ".gz" are gzip compressed and files ending in ".zst"
+are Zstandard compressed, which requires the zstandard package.
+Compression is otherwise transparent: ``idlib.read_jsonl_file`` and
+``idlib.load_kb`` read compressed files just like plain ones.
+
+``JSONLWriter`` serializes concepts in batches, which is much faster
+than ``json.dump`` followed by ``outF.write('\\n')`` for each concept.
+
+.. code-block:: python
+
+    with JSONLWriter("concepts.jsonl.gz") as writer:
+        for concept in concepts:
+            writer.write(concept)
+"""
+
+import io
+import json
+import gzip
+
+
+# File extensions of the supported compression formats.
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+
+def get_compression(path):
+    """
+    The compression format of path, from its extension.
+
+    :param str path: Path to the file.
+    :returns: "gzip", "zstd", or None if path is not compressed.
+    :rtype: str
+    """
+    for (ext, compression) in COMPRESSIONS.items():
+        if path.endswith(ext):
+            return compression
+    return None
+
+
+def _open(path, mode, compression):
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        import zstandard  # Optional dependency.
+        return zstandard.open(path, mode)
+    raise ValueError("compression must be 'gzip', 'zstd', or None.")
+
+
+def open_jsonl(path, mode='r', compression=None):
+    """
+    Open a possibly compressed JSON lines file as UTF-8 text.
+
+    :param str path: Path to the file.
+    :param str mode: 'r', 'w', or 'a'. Default 'r'.
+    :param str compression: "gzip" or "zstd". Optional. If not specified,
+                            it is determined from the extension of path.
+    :returns: File object.
+    """
+    if compression is None:
+        compression = get_compression(path)
+    if compression is None:
+        return open(path, mode, encoding="utf-8")
+    # The compressed file objects are binary, so wrap them in text.
+    return io.TextIOWrapper(_open(path, mode + 'b', compression),
+                            encoding="utf-8")
+
+
+class JSONLWriter(object):
+    """
+    Write concepts, or any other JSON serializable dicts, to a JSON
+    lines file, one per line. Lines are serialized and written in
+    batches of batch_size. Use as a context manager, or call ``close``
+    when done.
+
+    :param str outfile: Where to write the JSON lines.
+    :param int batch_size: Number of lines to write at once. Default 1000.
+    :param str json_backend: "json" (default) or "orjson". orjson, if
+                             installed, is much faster. Its output is
+                             compact and UTF-8 encoded rather than
+                             ASCII, but loads to the same data.
+    :param str compression: "gzip" or "zstd". Optional. If not specified,
+                            it is determined from the extension of
+                            outfile. See ``get_compression``.
+    :param str mode: 'w' (default) to overwrite outfile or 'a' to
+                     append to it.
+    """
+    def __init__(self, outfile, batch_size=1000, json_backend="json",
+                 compression=None, mode='w'):
+        if json_backend == "json":
+            self._dumps = json.dumps
+            self._newline = '\n'
+        elif json_backend == "orjson":
+            import orjson  # Optional dependency.
+            self._dumps = orjson.dumps
+            self._newline = b'\n'
+        else:
+            raise ValueError("json_backend must be 'json' or 'orjson'.")
+        if mode not in ['w', 'a']:
+            raise ValueError("mode must be 'w' or 'a'.")
+        if compression is None:
+            compression = get_compression(outfile)
+        self.outfile = outfile
+        self.batch_size = batch_size
+        self.n_written = 0  # Including those not yet flushed.
+        self._batch = []
+        self._outF = _open(outfile, mode + 'b', compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, obj):
+        """
+        Add obj to the file.
+
+        :param Concept/dict obj: A Concept, or any other object with a
+                                 ``to_dict`` method, or a dict.
+        """
+        if hasattr(obj, "to_dict"):
+            obj = obj.to_dict()
+        self._batch.append(self._dumps(obj))
+        self.n_written += 1
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, objs):
+        """
+        Add each of objs to the file.
+
+        :param iterable objs: Concepts or dicts.
+        :returns: The number of objects written.
+        :rtype: int
+        """
+        start = self.n_written
+        for obj in objs:
+            self.write(obj)
+        return self.n_written - start
+
+    def flush(self):
+        """
+        Write the current batch to the file.
+        """
+        if len(self._batch) == 0:
+            return
+        data = self._newline.join(self._batch) + self._newline
+        if type(data) is str:
+            data = data.encode("utf-8")
+        self._outF.write(data)
+        self._batch = []
+
+    def close(self):
+        """
+        Write any remaining lines and close the file.
+        """
+        if self._outF is None:
+            return
+        self.flush()
+        self._outF.close()
+        self._outF = None
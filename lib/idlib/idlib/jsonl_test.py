@@ -0,0 +1,86 @@
+import gzip
+import json
+
+import pytest
+
+import idlib
+from idlib import jsonl
+from idlib.data_elements import Atom, Concept
+
+
+def _dicts(n=25):
+    return [{"ui": f"NMCD{i:07}", "concept_type": "SDSI",
+             "synonyms": [{"term": f"term {i} é", "src": "NMCD",
+                           "src_id": str(i), "term_type": "SY",
+                           "is_preferred": True}],
+             "attributes": [{"atr_name": "rank", "atr_value": i,
+                             "src": "NMCD"}],
+             "relationships": []}
+            for i in range(n)]
+
+
+def _read_lines(path):
+    with jsonl.open_jsonl(path) as inF:
+        return [json.loads(line) for line in inF]
+
+
+def test_get_compression():
+    assert jsonl.get_compression("concepts.jsonl") is None
+    assert jsonl.get_compression("concepts.jsonl.gz") == "gzip"
+    assert jsonl.get_compression("concepts.jsonl.zst") == "zstd"
+
+
+def test_json_backend_matches_json_dumps(tmp_path):
+    outfile = str(tmp_path / "concepts.jsonl")
+    # A small batch size so the lines are written in several batches.
+    with jsonl.JSONLWriter(outfile, batch_size=4) as writer:
+        assert writer.write_all(_dicts()) == 25
+    expected = ''.join([json.dumps(data) + '\n' for data in _dicts()])
+    with open(outfile, 'r') as inF:
+        assert inF.read() == expected
+
+
+def test_orjson_backend_matches_json_backend(tmp_path):
+    pytest.importorskip("orjson")
+    json_file = str(tmp_path / "json.jsonl")
+    orjson_file = str(tmp_path / "orjson.jsonl")
+    with jsonl.JSONLWriter(json_file) as writer:
+        writer.write_all(_dicts())
+    with jsonl.JSONLWriter(orjson_file, batch_size=7,
+                           json_backend="orjson") as writer:
+        writer.write_all(_dicts())
+    assert _read_lines(orjson_file) == _read_lines(json_file) == _dicts()
+
+
+@pytest.mark.parametrize("ext", [".gz", ".zst"])
+def test_compressed_round_trip(tmp_path, ext):
+    if ext == ".zst":
+        pytest.importorskip("zstandard")
+    outfile = str(tmp_path / ("concepts.jsonl" + ext))
+    with jsonl.JSONLWriter(outfile, batch_size=10) as writer:
+        writer.write_all(_dicts())
+    assert _read_lines(outfile) == _dicts()
+    if ext == ".gz":
+        with gzip.open(outfile, 'rt') as inF:
+            assert json.loads(inF.readline()) == _dicts()[0]
+    concepts = idlib.read_jsonl_file(outfile)
+    assert [c.ui for c in concepts] == [d["ui"] for d in _dicts()]
+
+
+def test_write_concepts_and_append(tmp_path):
+    outfile = str(tmp_path / "concepts.jsonl.gz")
+    concept = Concept(concept_type="SDSI",
+                      atoms=[Atom("vitamin c", src="NMCD", src_id="1",
+                                  term_type="SY", is_preferred=True)])
+    idlib.write_jsonl_file([concept], outfile)
+    with jsonl.JSONLWriter(outfile, mode='a') as writer:
+        writer.write(_dicts()[0])
+    assert _read_lines(outfile) == [concept.to_dict(), _dicts()[0]]
+
+
+def test_invalid_arguments(tmp_path):
+    outfile = str(tmp_path / "concepts.jsonl")
+    with pytest.raises(ValueError):
+        jsonl.JSONLWriter(outfile, json_backend="pickle")
+    with pytest.raises(ValueError):
+        jsonl.JSONLWriter(outfile, mode='r')
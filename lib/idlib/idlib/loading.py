@@ -0,0 +1,409 @@
+"""
+Parallel loading of concepts JSON lines files. The file is split into
+byte ranges that end on line boundaries and each range is parsed in a
+separate process into compact records, which are rebuilt into Concept
+instances in the parent process, in file order. Parsing the JSON is
+thus spread over the workers, while the objects, their UIs, and the
+resolution of relationships stay in a single process.
+
+A record is a tuple of
+
+.. code-block:: none
+
+    (ui, concept_type,
+     ((term, src, src_id, term_type, is_preferred, attrs or None), ...),
+     ((atr_name, atr_value, src), ...),
+     ((rel_name, object, src, ((atr_name, atr_value, src), ...)), ...))
+
+which is both smaller and faster to pass between processes than the
+dicts from ``json.loads``. Usually these functions are used through
+``idlib.read_jsonl_file(..., workers=N)``.
+"""
+
+import os
+import re
+import json
+import multiprocessing
+from copy import copy
+
+from idlib.jsonl import open_jsonl, get_compression
+from idlib.data_elements import (Concept, Atom, Attribute, Relationship,
+                                 _intern, _pool_value)
+
+
+# The fields of an atom. Any other fields are extra attributes.
+_ATOM_FIELDS = ("term", "src", "src_id", "term_type", "is_preferred")
+
+
+def chunk_ranges(infile, n_chunks):
+    """
+    Split infile into at most n_chunks byte ranges of roughly equal size,
+    each of which starts at the beginning of a line and ends just after
+    a newline or at the end of the file.
+
+    :param str infile: Path to the file.
+    :param int n_chunks: The number of ranges to split the file into.
+    :returns: List of (start, end) byte offsets.
+    :rtype: list
+    """
+    size = os.path.getsize(infile)
+    bounds = [0]
+    with open(infile, 'rb') as inF:
+        for k in range(1, n_chunks):
+            offset = max(size * k // n_chunks, bounds[-1])
+            if offset > 0:
+                # Move to the start of the line after offset - 1.
+                inF.seek(offset - 1)
+                inF.readline()
+            bounds.append(inF.tell())
+    bounds.append(size)
+    return [(start, end) for (start, end) in zip(bounds, bounds[1:])
+            if end > start]
+
+
+def to_record(data, memo=None):
+    """
+    Convert the JSON data of a concept into a record.
+    See the module docstring for the format.
+
+    :param dict data: The JSON data of a concept. See ``Concept.from_dict``.
+    :param dict memo: Optional. {string: string} used to share the
+                      strings of controlled vocabularies, such as the
+                      sources, between records.
+    :returns: The record.
+    :rtype: tuple
+    """
+    if memo is None:
+        memo = {}
+    share = memo.setdefault
+
+    def atr_record(atr):
+        return (share(atr["atr_name"], atr["atr_name"]),
+                atr["atr_value"],
+                share(atr["src"], atr["src"]))
+
+    atoms = []
+    for syn in data["synonyms"]:
+        attrs = {key: val for (key, val) in syn.items()
+                 if key not in _ATOM_FIELDS}
+        atoms.append((syn["term"],
+                      share(syn["src"], syn["src"]),
+                      syn["src_id"],
+                      share(syn["term_type"], syn["term_type"]),
+                      syn["is_preferred"],
+                      attrs or None))
+    atrs = tuple([atr_record(atr) for atr in data["attributes"]])
+    rels = tuple([(share(rel["rel_name"], rel["rel_name"]),
+                   rel["object"],
+                   share(rel["src"], rel["src"]),
+                   tuple([atr_record(atr) for atr in rel["attributes"]]))
+                  for rel in data["relationships"]])
+    return (data["ui"], share(data["concept_type"], data["concept_type"]),
+            tuple(atoms), atrs, rels)
+
+
+def _attribute_dict(atr_record):
+    (atr_name, atr_value, src) = atr_record
+    return {"atr_name": atr_name, "atr_value": atr_value, "src": src}
+
+
+def _relationship_dict(rel_record):
+    (rel_name, obj, src, atrs) = rel_record
+    return {"rel_name": rel_name, "object": obj, "src": src,
+            "attributes": [_attribute_dict(atr) for atr in atrs]}
+
+
+def from_record(record, value_pool=None, lazy=False):
+    """
+    Create a Concept from a record. The result is the same as
+    ``Concept.from_dict`` on the JSON data the record was made from,
+    including that the objects of its relationships are still UIs
+    until ``Concept.resolve_relationships`` is run.
+
+    :param tuple record: The record. See ``to_record``.
+    :param dict value_pool: Optional. See ``Concept.from_dict``.
+    :param bool lazy: Optional. See ``Concept.from_dict``.
+    :returns: Concept instance built from record.
+    :rtype: Concept
+    """
+    (ui, concept_type, atom_records, atr_records, rel_records) = record
+    atoms = [Atom(term, _intern(src), src_id, _intern(term_type),
+                  is_preferred, **(attrs or {}))
+             for (term, src, src_id, term_type, is_preferred, attrs)
+             in atom_records]
+    concept = Concept(concept_type=_intern(concept_type), atoms=atoms, ui=ui)
+    if lazy is True:
+        if len(atr_records) > 0:
+            concept._lazy_attributes = [_attribute_dict(atr)
+                                        for atr in atr_records]
+        if len(rel_records) > 0:
+            concept._lazy_relationships = [_relationship_dict(rel)
+                                           for rel in rel_records]
+        if value_pool is not None:
+            concept._value_pool = value_pool
+        return concept
+
+    def make_attributes(subject, atrs):
+        return [Attribute(subject, _intern(atr_name),
+                          _pool_value(atr_value, value_pool), _intern(src))
+                for (atr_name, atr_value, src) in atrs]
+
+    elements = make_attributes(concept, atr_records)
+    for (rel_name, obj, src, atrs) in rel_records:
+        rel = Relationship(concept, _intern(rel_name), obj, _intern(src))
+        rel.add_elements(make_attributes(rel, atrs))
+        elements.append(rel)
+    concept.add_elements(elements)
+    return concept
+
+
+class ConceptFilter(object):
+    """
+    Selects which concepts to load, and which of their parts.
+    Lines of a concepts file that can't match are rejected by looking
+    for the "concept_type" and "src" fields in the raw line, before it
+    is parsed, so that excluded concepts cost little to skip.
+
+    The UIs of the excluded concepts are kept in ``self.excluded``.
+    Relationships to them are not resolved and keep the object UI.
+    The number of their atoms is kept in ``self.skipped_atoms`` until
+    ``skip_atoms`` is called, so that the atoms that are loaded get the
+    same UIs as when all concepts are loaded.
+
+    :param list concept_types: Optional. Only load concepts of these
+                               types, e.g. ["SDSI"].
+    :param list sources: Optional. Only load concepts with at least one
+                         atom from one of these sources.
+    :param bool include_relationships: If False, the relationships of
+                                       the loaded concepts are dropped.
+                                       Default True.
+    """
+    def __init__(self, concept_types=None, sources=None,
+                 include_relationships=True):
+        self.concept_types = None
+        self.sources = None
+        if concept_types is not None:
+            self.concept_types = set([ct.upper() for ct in concept_types])
+        if sources is not None:
+            self.sources = set([src.upper() for src in sources])
+        self.include_relationships = include_relationships
+        self.excluded = set()
+        self.skipped_atoms = 0
+        self._patterns = {}
+
+    def _pattern(self, field, line):
+        # Matches the field in the raw line but not within strings,
+        # where the quotes would be escaped.
+        key = (field, type(line))
+        if key not in self._patterns:
+            regex = r'"%s":\s*"([^"\\]*)"' % field
+            if type(line) is bytes:
+                regex = regex.encode("utf-8")
+            self._patterns[key] = re.compile(regex)
+        return self._patterns[key]
+
+    def _rejects_line(self, line):
+        if self.concept_types is not None:
+            match = self._pattern("concept_type", line).search(line)
+            if match is not None:
+                concept_type = match.group(1)
+                if type(concept_type) is bytes:
+                    concept_type = concept_type.decode("utf-8")
+                if concept_type.upper() not in self.concept_types:
+                    return True
+        if self.sources is not None:
+            srcs = self._pattern("src", line).findall(line)
+            if type(line) is bytes:
+                srcs = [src.decode("utf-8") for src in srcs]
+            # Atoms, attributes, and relationships all have a "src".
+            if len(self.sources.intersection([s.upper() for s in srcs])) == 0:  # noqa
+                return True
+        return False
+
+    def _exclude_line(self, line):
+        match = self._pattern("ui", line).search(line)
+        if match is None:  # Can't tell without parsing it.
+            data = json.loads(line)
+            return self._exclude(data["ui"], len(data["synonyms"]))
+        ui = match.group(1)
+        if type(ui) is bytes:
+            ui = ui.decode("utf-8")
+        # Every atom, and nothing else, has a "term_type". As with
+        # _pattern, the key can't match within a string.
+        key = '"term_type":'
+        if type(line) is bytes:
+            key = key.encode("utf-8")
+        n_atoms = line.count(key)
+        return self._exclude(ui, n_atoms)
+
+    def _exclude(self, ui, n_atoms):
+        self.excluded.add(ui)
+        self.skipped_atoms += n_atoms
+        return None
+
+    def skip_atoms(self):
+        """
+        Advance the UI counter of Atom past the atoms of the concepts
+        excluded since the last call. Called before loading each
+        selected concept, in file order, this numbers its atoms as if
+        all the concepts had been loaded.
+        """
+        if self.skipped_atoms > 0:
+            Atom.init_counter(Atom._counter + self.skipped_atoms)
+            self.skipped_atoms = 0
+
+    def parse(self, line):
+        """
+        Parse a line of a concepts file, if it is selected.
+
+        :param str/bytes line: The line.
+        :returns: The JSON data of the concept, or None if it is excluded.
+        :rtype: dict
+        """
+        if self._rejects_line(line):
+            return self._exclude_line(line)
+        data = json.loads(line)
+        if self.concept_types is not None:
+            if data["concept_type"].upper() not in self.concept_types:
+                return self._exclude(data["ui"], len(data["synonyms"]))
+        if self.sources is not None:
+            srcs = set([syn["src"].upper() for syn in data["synonyms"]])
+            if len(self.sources.intersection(srcs)) == 0:
+                return self._exclude(data["ui"], len(data["synonyms"]))
+        if self.include_relationships is False:
+            data["relationships"] = []
+        return data
+
+    def filter_record(self, record):
+        """
+        As ``parse``, but for a record. See ``to_record``.
+
+        :param tuple record: The record.
+        :returns: The record, or None if it is excluded.
+        :rtype: tuple
+        """
+        (ui, concept_type, atoms, atrs, rels) = record
+        if self.concept_types is not None:
+            if concept_type.upper() not in self.concept_types:
+                return self._exclude(ui, len(atoms))
+        if self.sources is not None:
+            srcs = set([atom[1].upper() for atom in atoms])
+            if len(self.sources.intersection(srcs)) == 0:
+                return self._exclude(ui, len(atoms))
+        if self.include_relationships is False and len(rels) > 0:
+            record = (ui, concept_type, atoms, atrs, ())
+        return record
+
+    def filter_records(self, records):
+        """
+        Filter an iterable of records. The Atom UI counter is advanced
+        past the atoms of the excluded records. See ``skip_atoms``.
+
+        :param iterable records: The records.
+        :returns: Generator over the selected records.
+        :rtype: generator
+        """
+        for record in records:
+            record = self.filter_record(record)
+            self.skip_atoms()
+            if record is not None:
+                yield record
+
+
+def _read_chunk(args):
+    """
+    Parse the lines in a byte range of a concepts file into records.
+    Run in the worker processes. With a concept_filter, the number of
+    atoms of each run of excluded concepts is put in their place among
+    the records, for ``read_records`` to skip in the parent process.
+    """
+    (infile, start, end, concept_filter) = args
+    if concept_filter is not None:
+        concept_filter.excluded = set()  # Only those in this chunk.
+        concept_filter.skipped_atoms = 0
+    with open(infile, 'rb') as inF:
+        inF.seek(start)
+        lines = inF.read(end - start).splitlines()
+    memo = {}
+    if concept_filter is None:
+        records = [to_record(json.loads(line.strip()), memo)
+                   for line in lines]
+        return (records, set())
+    records = []
+    for line in lines:
+        data = concept_filter.parse(line.strip())
+        if data is not None:
+            if concept_filter.skipped_atoms > 0:
+                records.append(concept_filter.skipped_atoms)
+                concept_filter.skipped_atoms = 0
+            records.append(to_record(data, memo))
+    if concept_filter.skipped_atoms > 0:
+        records.append(concept_filter.skipped_atoms)
+    return (records, concept_filter.excluded)
+
+
+def _read_compressed(infile, concept_filter=None):
+    memo = {}
+    with open_jsonl(infile, 'r') as inF:
+        for line in inF:
+            if concept_filter is None:
+                data = json.loads(line.strip())
+            else:
+                data = concept_filter.parse(line.strip())
+                concept_filter.skip_atoms()
+                if data is None:
+                    continue
+            yield to_record(data, memo)
+
+
+def read_records(infile, workers=1, concept_filter=None):
+    """
+    Read the concepts in a JSON lines file as records, parsing the file
+    in workers processes. Compressed files are read in this process.
+
+    :param str infile: Path to the JSON lines file of concepts.
+    :param int workers: Number of processes to use. Default 1.
+    :param ConceptFilter concept_filter: Optional. Only read the
+                                         concepts it selects. The
+                                         records must be loaded as
+                                         they are generated for their
+                                         atoms to get the same UIs as
+                                         in a full load. See
+                                         ``ConceptFilter.skip_atoms``.
+    :returns: Generator over records, in the order of the file.
+    :rtype: generator
+    """
+    if get_compression(infile) is not None:
+        # Compressed files can't be split, so read them here.
+        yield from _read_compressed(infile, concept_filter)
+        return
+    # More chunks than workers to even out the load.
+    ranges = chunk_ranges(infile, max(workers, 1) * 4)
+    task_filter = None
+    if concept_filter is not None:
+        # The tasks get their own filter, as concept_filter.excluded
+        # is updated while they are sent to the workers.
+        task_filter = copy(concept_filter)
+        task_filter.excluded = set()
+    tasks = [(infile, start, end, task_filter) for (start, end) in ranges]
+    if workers <= 1:
+        results = map(_read_chunk, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_read_chunk, tasks)
+    try:
+        for (records, excluded) in results:
+            if concept_filter is None:
+                yield from records
+                continue
+            concept_filter.excluded.update(excluded)
+            for record in records:
+                if type(record) is int:  # Atoms of excluded concepts.
+                    concept_filter.skipped_atoms += record
+                    concept_filter.skip_atoms()
+                else:
+                    yield record
+    finally:
+        if pool is not None:
+            pool.terminate()
@@ -0,0 +1,189 @@
+import json
+import logging
+
+import pytest
+
+import idlib
+from idlib import loading
+from idlib.data_elements import Atom, Concept
+
+
+def _concept_dicts(n=30):
+    srcs = ["NMCD", "DSLD", "NHPID"]
+    uis = [f"{srcs[i % 3]}{i + 1:07}" for i in range(n)]
+    dicts = []
+    for i in range(n):
+        src = srcs[i % 3]
+        synonyms = [{"term": f"term {i}", "src": src, "src_id": str(i),
+                     "term_type": "SY", "is_preferred": True},
+                    {"term": f"synonym {i % 7}", "src": src,
+                     "src_id": str(i), "term_type": "SY",
+                     "is_preferred": False, "linking_score": 0.5}]
+        attributes = [{"atr_name": "background", "atr_value": "text " * i,
+                       "src": src},
+                      {"atr_name": "rank", "atr_value": i, "src": src}]
+        relationships = [{"rel_name": "has_ingredient",
+                          "object": uis[(i * 7 + 1) % n], "src": src,
+                          "attributes": [{"atr_name": "amount",
+                                          "atr_value": str(i),
+                                          "src": src}]}]
+        dicts.append({"ui": uis[i],
+                      "concept_type": "DSP" if i % 4 == 0 else "SDSI",
+                      "synonyms": synonyms, "attributes": attributes,
+                      "relationships": relationships})
+    return dicts
+
+
+@pytest.fixture
+def concepts_file(tmp_path):
+    path = str(tmp_path / "concepts.jsonl")
+    with open(path, 'w') as outF:
+        for data in _concept_dicts():
+            outF.write(json.dumps(data) + '\n')
+    return path
+
+
+def _canonical(concept):
+    def _sort(elems):
+        return sorted(elems, key=lambda e: json.dumps(e, sort_keys=True))
+
+    data = json.loads(json.dumps(concept.to_dict()))
+    data["synonyms"] = _sort(data["synonyms"])
+    data["attributes"] = _sort(data["attributes"])
+    for rel in data["relationships"]:
+        rel["attributes"] = _sort(rel["attributes"])
+    data["relationships"] = _sort(data["relationships"])
+    return json.dumps(data, sort_keys=True)
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_chunk_ranges(tmp_path, trailing_newline):
+    lines = [b'{"ui": "A"}', b'{"ui": "BB"}', b'', b'{"ui": "' + b'C' * 500 +
+             b'"}', b'{"ui": "D"}']
+    data = b'\n'.join(lines) + (b'\n' if trailing_newline else b'')
+    infile = tmp_path / "lines.jsonl"
+    infile.write_bytes(data)
+    for n_chunks in [1, 2, 3, 4, 5, 10, 100]:
+        ranges = loading.chunk_ranges(str(infile), n_chunks)
+        assert 0 < len(ranges) <= n_chunks
+        # The ranges cover the file without gaps or overlaps.
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == len(data)
+        for ((_, end), (start, _)) in zip(ranges, ranges[1:]):
+            assert end == start
+        # No line is split between ranges.
+        for (start, end) in ranges:
+            assert start < end
+            assert start == 0 or data[start - 1:start] == b'\n'
+        chunks = [data[start:end] for (start, end) in ranges]
+        assert b''.join(chunks) == data
+        assert [line for chunk in chunks
+                for line in chunk.splitlines()] == lines
+
+
+def test_chunk_ranges_empty_file(tmp_path):
+    infile = tmp_path / "empty.jsonl"
+    infile.write_bytes(b'')
+    assert loading.chunk_ranges(str(infile), 4) == []
+
+
+def test_record_round_trip():
+    for data in _concept_dicts():
+        record = loading.to_record(json.loads(json.dumps(data)))
+        from_record = loading.from_record(record)
+        from_dict = Concept.from_dict(data)
+        assert _canonical(from_record) == _canonical(from_dict)
+        lazy = loading.from_record(record, lazy=True)
+        assert _canonical(lazy) == _canonical(from_dict)
+
+
+def test_parallel_load_matches_serial(concepts_file):
+    serial = idlib.read_jsonl_file(concepts_file)
+    parallel = idlib.read_jsonl_file(concepts_file, workers=3)
+    assert [c.ui for c in parallel] == [c.ui for c in serial]
+    assert ([_canonical(c) for c in parallel] ==
+            [_canonical(c) for c in serial])
+    # Relationships are resolved among the loaded concepts.
+    uis = dict([(c.ui, c) for c in parallel])
+    for concept in parallel:
+        for rel in concept.get_relationships():
+            assert rel.object is uis[rel.object.ui]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_filtered_load(concepts_file, caplog, workers):
+    caplog.set_level(logging.WARNING)
+    concepts = idlib.read_jsonl_file(concepts_file, concept_types=["dsp"],
+                                     workers=workers)
+    expected = [data for data in _concept_dicts()
+                if data["concept_type"] == "DSP"]
+    assert [c.ui for c in concepts] == [data["ui"] for data in expected]
+    loaded = set([c.ui for c in concepts])
+    n_excluded = 0
+    for concept in concepts:
+        for rel in concept.get_relationships():
+            if isinstance(rel.object, str):
+                # Relationships to excluded concepts keep the UI.
+                assert rel.object not in loaded
+                n_excluded += 1
+            else:
+                assert rel.object.ui in loaded
+    assert n_excluded > 0
+    assert [r for r in caplog.records if r.levelno >= logging.WARNING] == []
+
+
+def test_filtered_load_sources_and_relationships(concepts_file):
+    concepts = idlib.read_jsonl_file(concepts_file, sources=["NHPID"],
+                                     include_relationships=False)
+    assert len(concepts) == 10
+    assert all([c.ui.startswith("NHPID") for c in concepts])
+    assert all([len(c._relationships) == 0 for c in concepts])
+
+
+def _atom_uis(concepts):
+    return dict([((c.ui, a.term, a.src_id), a.ui)
+                 for c in concepts for a in c.get_atoms()])
+
+
+@pytest.mark.parametrize("load", ["serial", "workers", "gzip", "records"])
+def test_filtered_load_atom_uis(tmp_path, load):
+    # Concepts with different numbers of atoms.
+    dicts = _concept_dicts()
+    for (i, data) in enumerate(dicts):
+        data["synonyms"] = [dict(syn, src_id=f"{syn['src_id']}.{k}")
+                            for k in range(i % 3 + 1)
+                            for syn in data["synonyms"]]
+    concepts_file = str(tmp_path / "concepts.jsonl")
+    if load == "gzip":
+        concepts_file += ".gz"
+    idlib.write_jsonl_file(dicts, concepts_file)
+
+    def read(**kwargs):
+        Atom.init_counter(0)
+        if load == "records":
+            concept_filter = idlib._get_concept_filter(
+                kwargs.get("concept_types"), kwargs.get("sources"), True)
+            records = loading.read_records(concepts_file)
+            return idlib._read_records(records, concept_filter=concept_filter)
+        workers = 3 if load == "workers" else 1
+        return idlib.read_jsonl_file(concepts_file, workers=workers, **kwargs)
+
+    full = _atom_uis(read())
+    for kwargs in [{"concept_types": ["dsp"]}, {"sources": ["DSLD"]}]:
+        filtered = _atom_uis(read(**kwargs))
+        assert 0 < len(filtered) < len(full)
+        assert filtered == dict([(key, full[key]) for key in filtered])
+
+
+def test_concept_filter_prefilter():
+    concept_filter = loading.ConceptFilter(sources=["DSLD"])
+    data = _concept_dicts()[0]  # From NMCD.
+    # "src": "DSLD" within a string is escaped and doesn't match.
+    data["attributes"][0]["atr_value"] = 'text "src": "DSLD"'
+    line = json.dumps(data)
+    assert concept_filter.parse(line) is None
+    assert concept_filter.parse(line.encode("utf-8")) is None
+    assert concept_filter.excluded == set([data["ui"]])
+
+    data["synonyms"][0]["src"] = "dsld"
+    assert concept_filter.parse(json.dumps(data))["ui"] == data["ui"]
@@ -0,0 +1,197 @@
+"""
+MinHash signatures and banded locality sensitive hashing (LSH) for
+finding pairs of strings whose character n-gram sets have a high Jaccard
+similarity, without comparing all pairs of strings.
+"""
+
+import re
+import zlib
+import numpy as np
+
+
+_PRIME = (1 << 31) - 1  # Modulus of the MinHash permutations.
+_NON_ALNUM = re.compile(r"[\W_]+")
+_BLOCK_SIZE = 1 << 20  # Bucket comparisons to make at once.
+
+
+def normalize(term):
+    """
+    Normalize a term for approximate matching: lowercase it,
+    replace punctuation with whitespace, and sort its tokens. E.g.
+    "Panax ginseng" and "ginseng, panax" both become "ginseng panax".
+
+    :param str term: The term to normalize.
+    :returns: The normalized term.
+    :rtype: str
+    """
+    tokens = _NON_ALNUM.sub(' ', term.lower()).split()
+    return ' '.join(sorted(tokens))
+
+
+def shingles(text, n=3):
+    """
+    The set of character n-grams of text. Strings shorter than n
+    are their own single shingle.
+
+    :param str text: The string to shingle.
+    :param int n: The n-gram size. Default 3.
+    :rtype: set
+    """
+    if len(text) <= n:
+        return set([text])
+    return set([text[k:k+n] for k in range(len(text) - n + 1)])
+
+
+def jaccard(set1, set2):
+    """
+    The Jaccard similarity of two sets.
+
+    :rtype: float
+    """
+    if len(set1) == 0 and len(set2) == 0:
+        return 1.0
+    return len(set1 & set2) / len(set1 | set2)
+
+
+def optimal_bands(threshold, num_perm, recall=0.95):
+    """
+    Choose the number of bands b and rows per band r, with b * r equal
+    to num_perm so that every permutation is used, such that a pair of
+    strings with Jaccard similarity equal to threshold becomes a
+    candidate with probability at least recall. Of those, the choice
+    with the most rows per band, and therefore the fewest false
+    candidates, is returned.
+
+    :param float threshold: Target Jaccard similarity threshold.
+    :param int num_perm: The number of MinHash permutations.
+    :param float recall: Minimum probability of finding a pair with
+                         similarity threshold. Default 0.95.
+    :returns: (bands, rows)
+    :rtype: tuple(int, int)
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows != 0:
+            continue
+        bands = num_perm // rows
+        prob = 1 - (1 - threshold ** rows) ** bands
+        if prob >= recall:
+            best = (bands, rows)
+    return best
+
+
+class MinHashLSH(object):
+    """
+    A banded MinHash LSH index over strings. Strings are added with an
+    integer key and ``similar_pairs`` yields the pairs of keys whose
+    shingle sets have a Jaccard similarity of at least threshold.
+    Since candidates are only generated from strings that share an
+    LSH bucket, a small fraction of similar pairs may be missed.
+
+    :param float threshold: Jaccard similarity threshold in (0, 1].
+    :param int num_perm: Number of MinHash permutations. Default 128.
+    :param int ngram: Size of the character n-gram shingles. Default 3.
+    :param int seed: Seed for the MinHash permutations. Default 1.
+    """
+    def __init__(self, threshold=0.8, num_perm=128, ngram=3, seed=1):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1].")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.int64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.int64)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        # Bucket IDs by (band, band signature), and the band and keys
+        # of each bucket.
+        self._bucket_ids = {}
+        self._bucket_bands = []
+        self._bucket_keys = []
+        # The bucket IDs of each key, one per band.
+        self._key_buckets = {}
+        self._shingles = {}
+
+    def signature(self, shingle_set):
+        """
+        The MinHash signature of a set of shingles.
+
+        :param set shingle_set: The shingles.
+        :returns: Array of num_perm minimum hash values.
+        :rtype: numpy.ndarray
+        """
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME
+                              for s in shingle_set),
+                             dtype=np.int64, count=len(shingle_set))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+
+    def add(self, key, text):
+        """
+        Add text to the index under key.
+
+        :param int key: The key of this string.
+        :param str text: The string to index.
+        """
+        shingle_set = shingles(text, self.ngram)
+        self._shingles[key] = shingle_set
+        sig = self.signature(shingle_set)
+        key_buckets = np.empty(self.bands, dtype=np.int64)
+        for band in range(self.bands):
+            band_sig = sig[band * self.rows:(band + 1) * self.rows]
+            bucket = self._bucket_ids.setdefault((band, band_sig.tobytes()),
+                                                 len(self._bucket_ids))
+            if bucket == len(self._bucket_keys):
+                self._bucket_bands.append(band)
+                self._bucket_keys.append([])
+            self._bucket_keys[bucket].append(key)
+            key_buckets[band] = bucket
+        self._key_buckets[key] = key_buckets
+
+    def candidates(self):
+        """
+        The pairs of keys that share at least one LSH bucket, bucket by
+        bucket. Each pair is generated once, from the first band in
+        which its keys share a bucket, so no set of the pairs seen so
+        far is kept.
+
+        :returns: Generator over (key, key) tuples, with the smaller
+                  key first.
+        :rtype: generator
+        """
+        for (band, keys) in zip(self._bucket_bands, self._bucket_keys):
+            if len(keys) < 2:
+                continue
+            keys = sorted(keys)
+            n_keys = len(keys)
+            # The buckets of the keys in the earlier bands.
+            earlier = np.stack([self._key_buckets[key][:band]
+                                for key in keys])
+            # Compare blocks of rows with all keys at once, keeping
+            # the comparisons of each block to about _BLOCK_SIZE.
+            n_rows = max(1, _BLOCK_SIZE // (n_keys * max(band, 1)))
+            for start in range(0, n_keys - 1, n_rows):
+                rows = earlier[start:start + n_rows]
+                # Pairs that share a bucket in an earlier band were
+                # generated from that band.
+                seen = (rows[:, None, :] == earlier[None, :, :]).any(axis=2)
+                # Only pairs with the smaller key first.
+                seen |= (np.arange(n_keys)[None, :] <=
+                         np.arange(start, start + len(rows))[:, None])
+                (ks, ms) = np.nonzero(~seen)
+                for (k, m) in zip(ks.tolist(), ms.tolist()):
+                    yield (keys[start + k], keys[m])
+
+    def similar_pairs(self):
+        """
+        The candidate pairs whose Jaccard similarity is at least
+        ``self.threshold``.
+
+        :returns: Generator over (key, key, similarity) tuples, in the
+                  order of ``candidates``.
+        :rtype: generator
+        """
+        for (key1, key2) in self.candidates():
+            score = jaccard(self._shingles[key1], self._shingles[key2])
+            if score >= self.threshold:
+                yield (key1, key2, score)
@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+
+from idlib import lsh
+
+
+def test_normalize():
+    assert lsh.normalize("Panax ginseng") == "ginseng panax"
+    assert lsh.normalize("ginseng, PANAX") == "ginseng panax"
+    assert lsh.normalize("  --  ") == ''
+
+
+def test_shingles():
+    assert lsh.shingles("abcd") == set(["abc", "bcd"])
+    assert lsh.shingles("ab") == set(["ab"])
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 0.8, 0.9, 1.0])
+@pytest.mark.parametrize("num_perm", [7, 64, 100, 128])
+def test_optimal_bands(threshold, num_perm):
+    bands, rows = lsh.optimal_bands(threshold, num_perm)
+    assert bands * rows == num_perm
+    prob = 1 - (1 - threshold ** rows) ** bands
+    if (bands, rows) != (num_perm, 1):
+        assert prob >= 0.95
+
+
+def test_near_duplicates_share_a_bucket():
+    index = lsh.MinHashLSH(threshold=0.8)
+    terms = ["ascorbic acid vitamin c supplement",
+             "ascorbic acid vitamin c supplements",
+             "melatonin",
+             "panax ginseng root extract"]
+    for (key, term) in enumerate(terms):
+        index.add(key, term)
+    assert list(index.candidates()) == [(0, 1)]
+    pairs = list(index.similar_pairs())
+    assert [(key1, key2) for (key1, key2, _) in pairs] == [(0, 1)]
+    score = lsh.jaccard(lsh.shingles(terms[0]), lsh.shingles(terms[1]))
+    assert pairs[0][2] == score >= 0.8
+
+
+def test_fixed_seed_is_deterministic():
+    text = "ascorbic acid vitamin c supplement"
+    index1 = lsh.MinHashLSH(seed=1)
+    index2 = lsh.MinHashLSH(seed=1)
+    sig = index1.signature(lsh.shingles(text))
+    assert sig.shape == (128,)
+    assert np.array_equal(sig, index2.signature(lsh.shingles(text)))
+    index1.add(0, text)
+    index2.add(0, text)
+    assert set(index1._bucket_ids) == set(index2._bucket_ids)
+
+    index3 = lsh.MinHashLSH(seed=2)
+    assert not np.array_equal(sig, index3.signature(lsh.shingles(text)))
+
+
+@pytest.mark.parametrize("block_size", [1, 1 << 20])
+def test_candidates_once_per_pair(monkeypatch, block_size):
+    monkeypatch.setattr(lsh, "_BLOCK_SIZE", block_size)
+    # Low threshold, few rows per band, so pairs share many buckets.
+    index = lsh.MinHashLSH(threshold=0.3, num_perm=32)
+    terms = ["vitamin c", "vitamin c tablet", "vitamin d", "vitamin d3",
+             "vitamins", "ginseng", "ginseng root", "panax ginseng",
+             "melatonin", "vitamin c", "ascorbic acid"]
+    for (key, term) in enumerate(terms):
+        index.add(key, term)
+    candidates = list(index.candidates())
+    assert len(candidates) == len(set(candidates))
+    expected = set()
+    for key1 in range(len(terms)):
+        for key2 in range(key1 + 1, len(terms)):
+            buckets1 = index._key_buckets[key1]
+            buckets2 = index._key_buckets[key2]
+            if (buckets1 == buckets2).any():
+                expected.add((key1, key2))
+    assert set(candidates) == expected
+    assert (0, 9) in expected
+    similar = [(key1, key2) for (key1, key2, score) in index.similar_pairs()]
+    assert similar == [(key1, key2) for (key1, key2) in candidates
+                       if lsh.jaccard(index._shingles[key1],
+                                      index._shingles[key2]) >= 0.3]
+
+
+def test_invalid_threshold():
+    with pytest.raises(ValueError):
+        lsh.MinHashLSH(threshold=0)
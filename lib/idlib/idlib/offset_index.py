@@ -0,0 +1,356 @@
+"""
+Random access to the concepts in a JSON lines file, without reading
+the whole file. A sidecar offset index, saved next to the concepts
+file as "<concepts_file>.idx", maps each line number and each concept
+UI to the position of its line. The concepts file is memory-mapped and
+individual concepts are decoded on demand.
+
+.. code-block:: python
+
+    with ConceptIndex("concepts/concepts_merged.jsonl") as index:
+        data = index.get("NMCD0000001")  # The concept's JSON data.
+        concept = index.get_concept("NMCD0000001")  # A Concept.
+        data = index[42]  # The concept on line 42, counting from 0.
+
+The index is built the first time a file is opened and rebuilt if the
+size or modification time of the file changes. If it can't be saved,
+e.g. next to a concepts file in a read-only directory, it is kept in
+memory instead. Its format is a 64 byte header followed by three
+little-endian arrays
+
+.. code-block:: none
+
+    bytes 0-7    magic string b"IDIDX" and format version
+    bytes 8-15   number of lines n, uint64
+    bytes 16-23  width w of the longest UI in bytes, uint64
+    bytes 24-31  size of the concepts file, uint64
+    bytes 32-39  modification time of the concepts file in ns, int64
+    bytes 40-63  reserved
+
+    n + 1 uint64    byte offset of each line, then the size of the file
+    n uint32        line numbers of the UIs below
+    n w-byte str    the UIs, sorted
+"""
+
+import os
+import re
+import json
+import logging
+import mmap
+import struct
+import numpy as np
+
+from idlib.jsonl import open_jsonl, get_compression
+
+
+MAGIC = b"IDIDX\x00\x00\x01"
+HEADER_SIZE = 64
+_HEADER_FORMAT = "<8sQQQq24x"
+# The UI of a concept written by Concept.to_dict, which comes first.
+_UI_PATTERN = re.compile(rb'^\s*\{\s*"ui":\s*"([^"\\]*)"')
+
+
+def index_path(concepts_file):
+    """
+    The path of the offset index of concepts_file.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :rtype: str
+    """
+    return f"{concepts_file}.idx"
+
+
+def _file_stat(concepts_file):
+    stat = os.stat(concepts_file)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def read_header(index_file):
+    """
+    Read the header of an offset index.
+
+    :param str index_file: Path to the index.
+    :returns: The number of lines, the width of the UIs, and the size
+              and modification time of the indexed concepts file.
+    :rtype: tuple(int, int, int, int)
+    """
+    with open(index_file, 'rb') as inF:
+        header = inF.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        raise ValueError(f"Truncated header in '{index_file}'.")
+    magic, n_lines, width, size, mtime_ns = struct.unpack(_HEADER_FORMAT,
+                                                          header)
+    if magic != MAGIC:
+        raise ValueError(f"'{index_file}' is not an offset index.")
+    return n_lines, width, size, mtime_ns
+
+
+def is_up_to_date(index_file, concepts_file):
+    """
+    Whether index_file exists and indexes concepts_file as it is now.
+
+    :param str index_file: Path to the index.
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :rtype: bool
+    """
+    if not os.path.exists(index_file):
+        return False
+    try:
+        _, _, size, mtime_ns = read_header(index_file)
+    except (ValueError, OSError):
+        return False
+    return (size, mtime_ns) == _file_stat(concepts_file)
+
+
+def _scan(concepts_file):
+    """
+    Find the offset of each line of concepts_file and the UI on it.
+
+    :returns: The offsets of the lines followed by the size of the file,
+              the line number of each UI below, and the sorted UIs.
+    :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    if get_compression(concepts_file) is not None:
+        raise ValueError("Compressed concepts files can't be indexed.")
+    offsets = [0]
+    uis = []
+    with open(concepts_file, 'rb') as inF:
+        for line in inF:
+            match = _UI_PATTERN.match(line)
+            if match is not None:
+                uis.append(match.group(1))
+            else:
+                uis.append(json.loads(line)["ui"].encode("utf-8"))
+            offsets.append(offsets[-1] + len(line))
+    width = max([len(ui) for ui in uis] + [1])
+    uis = np.array(uis, dtype=f"S{width}")
+    # Stable, so that the first of any duplicate UIs is found.
+    order = np.argsort(uis, kind="stable")
+    return (np.asarray(offsets, dtype="<u8"), order.astype("<u4"),
+            uis[order])
+
+
+def _write_index(index_file, stat, offsets, ui_lines, uis):
+    size, mtime_ns = stat
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as outF:
+            outF.write(struct.pack(_HEADER_FORMAT, MAGIC, len(uis),
+                                   uis.dtype.itemsize, size, mtime_ns))
+            outF.write(offsets.tobytes())
+            outF.write(ui_lines.tobytes())
+            outF.write(uis.tobytes())
+        os.replace(tmp_file, index_file)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def build_index(concepts_file, index_file=None):
+    """
+    Build the offset index of concepts_file. The UI of each concept is
+    taken from the start of its line, which is only parsed if the UI
+    is not found there.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+                              Must not be compressed.
+    :param str index_file: Where to save the index. Optional. Defaults
+                           to ``index_path(concepts_file)``.
+    :returns: The number of lines indexed.
+    :rtype: int
+    :raises OSError: If the index can't be saved.
+    """
+    if index_file is None:
+        index_file = index_path(concepts_file)
+    stat = _file_stat(concepts_file)
+    offsets, ui_lines, uis = _scan(concepts_file)
+    _write_index(index_file, stat, offsets, ui_lines, uis)
+    return len(uis)
+
+
+class ConceptIndex(object):
+    """
+    Random access to the concepts in a JSON lines file by line number
+    or by UI. See the module docstring. Use as a context manager, or
+    call ``close`` when done.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+                              Must not be compressed.
+    :param str index_file: Path to the offset index. Optional. Defaults
+                           to ``index_path(concepts_file)``. If the index
+                           has to be built but can't be saved there, e.g.
+                           because the directory is read-only, it is kept
+                           in memory and ``self.index_file`` is None.
+    :param bool build: Whether to build the index if it is missing or
+                       out of date. If False, a ValueError is raised
+                       instead. Default True.
+    """
+    def __init__(self, concepts_file, index_file=None, build=True):
+        if index_file is None:
+            index_file = index_path(concepts_file)
+        self.concepts_file = concepts_file
+        self.index_file = index_file
+        if is_up_to_date(index_file, concepts_file):
+            self._load(index_file)
+        elif build is False:
+            raise ValueError(f"No up to date index '{index_file}'.")
+        else:
+            stat = _file_stat(concepts_file)
+            self.offsets, self._ui_lines, self._uis = _scan(concepts_file)
+            try:
+                _write_index(index_file, stat, self.offsets,
+                             self._ui_lines, self._uis)
+            except OSError as e:
+                # E.g. a read-only directory. Keep the index in memory.
+                logging.info(f"Could not save offset index '{index_file}': {e}")  # noqa
+                self.index_file = None
+        self._n_lines = len(self._uis)
+
+        self._file = open(concepts_file, 'rb')
+        self._mmap = None
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def _load(self, index_file):
+        n_lines, width, _, _ = read_header(index_file)
+        start = HEADER_SIZE
+        self.offsets = np.memmap(index_file, dtype="<u8", mode='r',
+                                 offset=start, shape=(n_lines + 1,))
+        start += 8 * (n_lines + 1)
+        if n_lines == 0:
+            self._ui_lines = np.empty(0, dtype="<u4")
+            self._uis = np.empty(0, dtype=f"S{width}")
+            return
+        self._ui_lines = np.memmap(index_file, dtype="<u4", mode='r',
+                                   offset=start, shape=(n_lines,))
+        start += 4 * n_lines
+        self._uis = np.memmap(index_file, dtype=f"S{width}", mode='r',
+                              offset=start, shape=(n_lines,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._n_lines
+
+    def __getitem__(self, i):
+        return json.loads(self.read_line(i))
+
+    def __contains__(self, ui):
+        try:
+            self.line_number(ui)
+        except KeyError:
+            return False
+        return True
+
+    def close(self):
+        """
+        Close the concepts file.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def line_number(self, ui):
+        """
+        The line of the concept with the given UI, counting from 0.
+        This is its index in connections files. If the UI is
+        duplicated, that of the first concept with it, as in
+        ``idlib.columnar.ColumnarKB``.
+
+        :param str ui: The concept UI.
+        :rtype: int
+        :raises KeyError: If there is no such concept.
+        """
+        key = ui.encode("utf-8")
+        k = int(np.searchsorted(self._uis, key))
+        if k == self._n_lines or self._uis[k] != key:
+            raise KeyError(ui)
+        return int(self._ui_lines[k])
+
+    def offset(self, ui):
+        """
+        The position of the line of the concept with the given UI.
+
+        :param str ui: The concept UI.
+        :returns: The byte offset and length of the line.
+        :rtype: tuple(int, int)
+        :raises KeyError: If there is no such concept.
+        """
+        i = self.line_number(ui)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return (start, end - start)
+
+    def read_line(self, i):
+        """
+        The raw line i of the concepts file, counting from 0.
+
+        :param int i: The line number.
+        :rtype: bytes
+        """
+        if not 0 <= i < self._n_lines:
+            raise IndexError("ConceptIndex line out of range.")
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self._mmap[start:end].rstrip()
+
+    def get(self, ui):
+        """
+        The JSON data of the concept with the given UI.
+
+        :param str ui: The concept UI.
+        :rtype: dict
+        :raises KeyError: If there is no such concept.
+        """
+        return self[self.line_number(ui)]
+
+    def get_concept(self, ui, lazy=True):
+        """
+        The concept with the given UI. The objects of its relationships
+        are not resolved and are UIs.
+
+        :param str ui: The concept UI.
+        :param bool lazy: See ``Concept.from_dict``. Default True.
+        :rtype: Concept
+        :raises KeyError: If there is no such concept.
+        """
+        from idlib.data_elements import Concept
+        return Concept.from_dict(self.get(ui), lazy=lazy)
+
+
+def load_concepts(concepts_file, indices, lazy=True):
+    """
+    Load only the concepts on the given lines of concepts_file, e.g.
+    those referenced by a connections file. Uses the offset index if
+    concepts_file is not compressed, and otherwise only parses the
+    lines that are needed.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :param iterable indices: Line numbers of the concepts to load.
+    :param bool lazy: See ``Concept.from_dict``. Default True.
+    :returns: List with a Concept at each of indices and None elsewhere,
+              with one element per line of concepts_file. The objects
+              of the relationships of the concepts are not resolved.
+    :rtype: list
+    """
+    from idlib.data_elements import Concept
+    indices = set([int(i) for i in indices])
+    if get_compression(concepts_file) is None:
+        with ConceptIndex(concepts_file) as index:
+            concepts = [None] * len(index)
+            for i in sorted(indices):
+                concepts[i] = Concept.from_dict(index[i], lazy=lazy)
+        return concepts
+    concepts = []
+    with open_jsonl(concepts_file, 'r') as inF:
+        for (i, line) in enumerate(inF):
+            concept = None
+            if i in indices:
+                concept = Concept.from_dict(json.loads(line), lazy=lazy)
+            concepts.append(concept)
+    return concepts
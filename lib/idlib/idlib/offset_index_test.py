@@ -0,0 +1,130 @@
+import os
+import gzip
+import json
+
+import pytest
+
+from idlib import offset_index
+from idlib.columnar import ColumnarKB
+from idlib.offset_index import ConceptIndex
+
+
+def _concept_dicts(n=20):
+    dicts = []
+    for i in range(n):
+        dicts.append({"ui": f"NMCD{(i * 7919) % 10007:07}",
+                      "concept_type": "SDSI",
+                      "synonyms": [{"term": f"term {i} é" + "x" * (i % 5),
+                                    "src": "NMCD", "src_id": str(i),
+                                    "term_type": "SY",
+                                    "is_preferred": True}],
+                      "attributes": [], "relationships": []})
+    return dicts
+
+
+def _write(path, dicts):
+    with open(path, 'w') as outF:
+        for (i, data) in enumerate(dicts):
+            if i % 3 == 0:
+                # The UI is not at the start of the line.
+                data = dict(reversed(list(data.items())))
+            outF.write(json.dumps(data) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def concepts_file(tmp_path):
+    return _write(tmp_path / "concepts.jsonl", _concept_dicts())
+
+
+def _sequential(concepts_file):
+    with open(concepts_file, 'r') as inF:
+        return [json.loads(line) for line in inF]
+
+
+def test_lookup_matches_sequential_parse(concepts_file):
+    expected = _sequential(concepts_file)
+    with ConceptIndex(concepts_file) as index:
+        assert index.index_file == offset_index.index_path(concepts_file)
+        assert len(index) == len(expected)
+        assert [index[i] for i in range(len(index))] == expected
+        for (i, data) in enumerate(expected):
+            assert data["ui"] in index
+            assert index.line_number(data["ui"]) == i
+            assert index.get(data["ui"]) == data
+            assert index.get_concept(data["ui"]).ui == data["ui"]
+        assert "NMCD9999999" not in index
+        with pytest.raises(KeyError):
+            index.get("NMCD9999999")
+        with pytest.raises(IndexError):
+            index[len(expected)]
+    # Opening again uses the saved index.
+    with ConceptIndex(concepts_file, build=False) as index:
+        assert [index[i] for i in range(len(index))] == expected
+
+
+def test_rebuilt_when_concepts_file_changes(concepts_file):
+    index_file = offset_index.index_path(concepts_file)
+    with ConceptIndex(concepts_file) as index:
+        assert len(index) == 20
+    assert offset_index.is_up_to_date(index_file, concepts_file)
+
+    dicts = _concept_dicts(25)[5:]
+    _write(concepts_file, dicts)
+    # Force a different modification time on coarse filesystems.
+    stat = os.stat(concepts_file)
+    os.utime(concepts_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not offset_index.is_up_to_date(index_file, concepts_file)
+    with pytest.raises(ValueError):
+        ConceptIndex(concepts_file, build=False)
+    with ConceptIndex(concepts_file) as index:
+        assert [index[i] for i in range(len(index))] == \
+            _sequential(concepts_file)
+        assert index.line_number(dicts[0]["ui"]) == 0
+    assert offset_index.is_up_to_date(index_file, concepts_file)
+
+
+def test_in_memory_when_index_not_writable(tmp_path, concepts_file):
+    index_file = str(tmp_path / "read_only" / "concepts.jsonl.idx")
+    with ConceptIndex(concepts_file, index_file=index_file) as index:
+        assert index.index_file is None
+        assert [index[i] for i in range(len(index))] == \
+            _sequential(concepts_file)
+    assert not os.path.exists(index_file)
+
+
+def test_duplicate_ui_matches_columnar(tmp_path):
+    dicts = _concept_dicts(5)
+    dicts.insert(3, dict(dicts[1], concept_type="DSP"))
+    concepts_file = _write(tmp_path / "concepts.jsonl", dicts)
+    kb = ColumnarKB.from_jsonl(concepts_file)
+    with ConceptIndex(concepts_file) as index:
+        # Both find the first concept with the UI.
+        assert index.line_number(dicts[1]["ui"]) == kb.index(dicts[1]["ui"]) == 1  # noqa
+        assert index.get(dicts[1]["ui"])["concept_type"] == "SDSI"
+        for data in dicts:
+            assert index.line_number(data["ui"]) == kb.index(data["ui"])
+
+
+def test_empty_file(tmp_path):
+    concepts_file = _write(tmp_path / "empty.jsonl", [])
+    with ConceptIndex(concepts_file) as index:
+        assert len(index) == 0
+        assert "NMCD0000001" not in index
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_load_concepts(tmp_path, concepts_file, compressed):
+    if compressed:
+        gz_file = str(tmp_path / "concepts.jsonl.gz")
+        with open(concepts_file, 'rb') as inF, gzip.open(gz_file, 'wb') as outF:  # noqa
+            outF.write(inF.read())
+        concepts_file = gz_file
+    expected = _concept_dicts()
+    concepts = offset_index.load_concepts(concepts_file, [3, 0, 17, 3])
+    assert len(concepts) == len(expected)
+    for (i, concept) in enumerate(concepts):
+        if i in [0, 3, 17]:
+            assert concept.ui == expected[i]["ui"]
+        else:
+            assert concept is None
@@ -1,15 +1,30 @@
+import os
 import argparse
 import logging
 import json
 import csv
 import copy
-from itertools import combinations
+import heapq
+import zlib
+import tempfile
+import multiprocessing
+from bisect import bisect_right
+from itertools import combinations, islice
+from collections import defaultdict
+import numpy as np
 from tqdm import tqdm  # Progress bar
 
 import idlib
+from idlib.data_elements import Concept, Registry
+from idlib.connections import read_connections, write_connections
+from idlib.lsh import MinHashLSH, normalize
 
 logging.getLogger().setLevel(logging.INFO)
 
+# The most connections a find_connections worker holds in memory
+# before spilling them to disk.
+_SPILL_SIZE = 1000000
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -21,67 +36,149 @@ def parse_args():
                         help="""JSON lines files containing
                                 the lists of concepts.""")
     parser.add_argument("--outfile", type=str, required=True,
-                        help="Where to save the result.")
+                        help="""Where to save the result. For
+                                find_connections, outfiles ending in .csv
+                                are written as CSV, all others in the
+                                binary connections format.""")
     parser.add_argument("--connections_file", type=str, default=None,
-                        help="""CSV file containing pairs of indices of
-                                connected concepts in the input, one pair
-                                per line. Assumes that the concepts have
-                                already been concatenated and thus there
-                                is only one infile.""")
+                        help="""CSV or binary file containing pairs of
+                                indices of connected concepts in the input,
+                                one pair per line. Assumes that the concepts
+                                have already been concatenated and thus
+                                there is only one infile.""")
     parser.add_argument("--ignore_concept_types", type=str, nargs="*",
                         help="""A list of concept types to ignore when
                                 checking for a match.""")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="""Number of processes to use when finding
+                                connections. Default 1.""")
+    parser.add_argument("--approximate_outfile", type=str, default=None,
+                        help="""If specified, also find approximate matches
+                                between concepts using MinHash LSH over
+                                their atom terms and save them here as
+                                CSV rows of (i, j, similarity).""")
+    parser.add_argument("--approximate_threshold", type=float, default=0.8,
+                        help="""Jaccard similarity threshold for approximate
+                                matches. Default 0.8.""")
+    parser.add_argument("--term_index", type=str, default=None,
+                        help="""Term index saved from a previous run of
+                                find_connections. If specified, run
+                                find_connections incrementally: only the
+                                concepts in infiles are compared against
+                                the index and outfile contains the added
+                                and removed connections.""")
+    parser.add_argument("--save_term_index", type=str, default=None,
+                        help="""Where to save the term index for use in a
+                                later incremental find_connections.""")
     args = parser.parse_args()
     return args
 
 
-def read_concepts_files(*infiles):
+def read_concepts_files(*infiles, lazy=False):
     """
     Read in the Concepts from the infiles.
 
     :param list infiles: A list of paths to the concept files.
+    :param bool lazy: If True, only create attributes and relationships
+                      when they are first accessed. See
+                      ``Concept.from_dict``. Default False.
     :returns: List of Concepts.
     :rtype: list
     """
+    # Relationships may reference concepts in any of the infiles.
+    registry = Registry(classes=[Concept])
     all_concepts = []
     for fpath in infiles:
-        concepts = idlib.read_jsonl_file(fpath)
+        concepts = idlib.read_jsonl_file(fpath, registry=registry,
+                                         lazy=lazy)
         all_concepts.extend(concepts)
+    unresolved = registry.unresolved_report()
+    if len(unresolved) > 0:
+        logging.warning(f"{len(registry.unresolved)} relationship objects not found among {len(unresolved)} UIs, e.g. '{next(iter(unresolved))}'.")  # noqa
     return all_concepts
 
 
-def read_connections_file(infile):
+def read_connections_file(infile, concepts_file=None):
     """
-    Reads a two-column CSV file of integers into a list of tuples
-    corresponding to indices of connected concepts.
-
-    :param str infile: Path to the CSV file.
-    :returns: List of int tuples of connections.
-    :rtype: list
+    Reads a two-column CSV file of integers, or a binary connections file,
+    as a stream of tuples corresponding to indices of connected concepts.
+    See ``idlib.connections``.
+
+    :param str infile: Path to the connections file.
+    :param str concepts_file: Optional. If specified, check that the
+                              connections were computed from this file.
+    :returns: Generator over int tuples of connections.
+    :rtype: generator
     """
-    connections = []
-    with open(infile, 'r', newline='') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',')
-        for row in reader:
-            assert(len(row) == 2)
-            row = [int(i) for i in row]
-            connections.append(tuple(row))
-    return connections
+    return read_connections(infile, concepts_file=concepts_file)
 
 
-def perform_find_connections(concepts, outfile, ignore_concept_types=[]):
+def perform_find_connections(concepts, outfile, ignore_concept_types=[],
+                             workers=1, concepts_file=None):
     """
     Run find_connections without the set function and write the result
-    outfile.
+    outfile, as CSV if it ends in ".csv" and in the binary connections
+    format otherwise.
 
     :param list concepts: A list of Concepts to run over.
     :param list outfile: Where to save the output.
+    :param int workers: Number of processes to use. Default 1.
+    :param str concepts_file: The file concepts were read from. Optional.
+                              Its checksum is saved in binary outfiles.
     """
     cnxs = Union(concepts, run_union=False,
-                 ignore_concept_types=ignore_concept_types).connections
+                 ignore_concept_types=ignore_concept_types,
+                 workers=workers).connections
+    write_connections(cnxs, outfile, concepts_file=concepts_file)
+    logging.info("Done")
+
+
+def perform_find_approximate_connections(concepts, outfile, threshold=0.8,
+                                         ignore_concept_types=[]):
+    """
+    Run find_approximate_connections and write the result to outfile
+    as CSV rows of (i, j, similarity).
+
+    :param list concepts: A list of Concepts to run over.
+    :param str outfile: Where to save the output.
+    :param float threshold: Jaccard similarity threshold. Default 0.8.
+    :param list ignore_concept_types: Concept types to exclude.
+    """
+    union = Union(concepts, run_union=False,
+                  ignore_concept_types=ignore_concept_types)
+    cnxs = union.find_approximate_connections(threshold=threshold)
     with open(outfile, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile, delimiter=',')
-        writer.writerows(cnxs)
+        for (i, j, score) in cnxs:
+            writer.writerow((i, j, f"{score:.3f}"))
+    logging.info("Done")
+
+
+def perform_incremental_find_connections(concepts, term_index_file, outfile,
+                                         ignore_concept_types=[],
+                                         save_term_index=None):
+    """
+    Update the term index saved at term_index_file with the refreshed
+    concepts and write the resulting change in connections to outfile
+    as CSV rows of (+/-, UI, UI).
+
+    :param list concepts: The new or refreshed Concepts.
+    :param str term_index_file: The term index saved by a previous run.
+    :param str outfile: Where to save the connection delta.
+    :param list ignore_concept_types: Concept types to exclude.
+    :param str save_term_index: Where to save the updated term index.
+                                Optional.
+    """
+    term_index = TermIndex.load(term_index_file)
+    added, removed = term_index.update(
+        concepts, ignore_concept_types=ignore_concept_types)
+    logging.info(f"# cnxs added {len(added)}, removed {len(removed)}")
+    with open(outfile, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        writer.writerows([('+', ui_i, ui_j) for (ui_i, ui_j) in added])
+        writer.writerows([('-', ui_i, ui_j) for (ui_i, ui_j) in removed])
+    if save_term_index is not None:
+        term_index.save(save_term_index)
     logging.info("Done")
 
 
@@ -94,47 +191,260 @@ def perform_set_function(func, concepts, outfile, connections=None,
     :param Union func: The set function to run.
     :param list concepts: A list of Concepts to run over.
     :param str outfile: The path to the outfile.
-    :param list connections: List of int tuples specifying connections.
+    :param iterable connections: int tuples specifying connections.
     """
     result = func(concepts, connections=connections,
                   ignore_concept_types=ignore_concept_types).result
     logging.info(f"Number of resulting concepts: {len(result)}")
-    with open(outfile, 'w') as outF:
-        for concept in result:
-            json.dump(concept.to_dict(), outF)
-            outF.write('\n')
+    idlib.write_jsonl_file(result, outfile)
 
 
-def _get_prefix(concept1, concept2):
+def _get_prefix(*concepts):
     """
     Build a  Concept UI prefix as the combination of the
-    UI prefixes of two concepts.
+    UI prefixes of two or more concepts.
 
-    :param Concept concept1: The first concept.
-    :param Concept concept2: The second concept.
+    :param Concept concepts: The concepts.
     :returns: New prefix
     :rtype: str
     """
     # ["NMCD_NMCD", "DSLD_NHP"]
-    prefixes = [concept1._prefix, concept2._prefix]
+    prefixes = [concept._prefix for concept in concepts]
     # "NMCD_NMCD_DSLD_NHP"
     prefixes = '_'.join(prefixes)
-    # {"NMCD", "DSLD", "NHP"}
-    srcs = set([src for src in prefixes.split('_')])
-    # "NMCD_DSLD_NHP"
+    # ["DSLD", "NHP", "NMCD"]
+    srcs = sorted(set([src for src in prefixes.split('_')]))
+    # "DSLD_NHP_NMCD"
     merged_prefix = '_'.join(srcs)
     return merged_prefix
 
 
+def build_term_index(concepts, ignore_concept_types=None):
+    """
+    Build an inverted index from lowercased atom terms to the indices
+    of the concepts that contain them. The index is partitioned by
+    concept type, as concepts of different types are never connected.
+
+    :param list concepts: A list of Concepts to index.
+    :param list(str) ignore_concept_types: Optional. Don't index Concepts
+                                           with type belonging to this list.
+    :returns: The index as {concept_type: {term: [int]}}, with each list
+              of indices sorted, and the terms of each indexed concept
+              as {int: set(str)}.
+    :rtype: tuple(dict, dict)
+    """
+    ignore_concept_types = ignore_concept_types or []
+    index = defaultdict(lambda: defaultdict(list))
+    terms = {}
+    for (i, concept) in enumerate(concepts):
+        if concept.concept_type in ignore_concept_types:
+            continue
+        i_terms = set([a.term_key for a in concept.get_atoms()])
+        postings = index[concept.concept_type]
+        for term in i_terms:
+            postings[term].append(i)
+        terms[i] = i_terms
+    return index, terms
+
+
+def _find_connections_shard(args):
+    """
+    Find all pairs of concept indices that share a posting list in one
+    shard of the term index and write them, sorted and deduplicated,
+    to spill files. At most spill_size pairs are held in memory at once,
+    so large posting lists are spilled in several sorted runs.
+
+    :param tuple args: (shard number, list of posting lists,
+                        spill directory, spill size)
+    :returns: Paths to the spill files.
+    :rtype: list(str)
+    """
+    shard, postings, spill_dir, spill_size = args
+    spill_files = []
+    pairs = set()
+
+    def _spill():
+        spill_file = os.path.join(spill_dir,
+                                  f"shard_{shard}_{len(spill_files)}.cnx")
+        write_connections(sorted(pairs), spill_file, fmt="binary")
+        spill_files.append(spill_file)
+        pairs.clear()
+
+    for idxs in postings:
+        cnxs = combinations(idxs, 2)
+        while True:
+            batch = list(islice(cnxs, spill_size - len(pairs)))
+            if len(batch) == 0:
+                break
+            pairs.update(batch)
+            if len(pairs) >= spill_size:
+                _spill()
+    if len(pairs) > 0 or len(spill_files) == 0:
+        _spill()
+    return spill_files
+
+
+def _merge_spill_files(spill_files):
+    """
+    k-way merge of sorted spill files of connections, dropping pairs
+    that were found in more than one shard.
+
+    :param list(str) spill_files: Paths to the sorted spill files.
+    :returns: Generator over connections (i, j), sorted by i then j.
+    :rtype: generator
+    """
+    prev = None
+    streams = [read_connections(fpath) for fpath in spill_files]
+    for cnx in heapq.merge(*streams):
+        if cnx != prev:
+            yield cnx
+        prev = cnx
+
+
+class TermIndex(object):
+    """
+    An inverted index from lowercased atom terms to concept UIs that
+    can be saved to disk and updated when the concepts from a single
+    source are refreshed. Unlike ``build_term_index``, concepts are
+    keyed by UI rather than by their index in a particular file, so
+    the index remains valid across versions of the input.
+
+    :param list concepts: Concepts to index. Optional.
+    :param list(str) ignore_concept_types: Optional. Don't index Concepts
+                                           with type belonging to this list.
+    """
+    def __init__(self, concepts=None, ignore_concept_types=None):
+        # {ui: (concept_type, frozenset(terms))}
+        self.concepts = {}
+        # {concept_type: {term: set(ui)}}
+        self.postings = defaultdict(lambda: defaultdict(set))
+        for concept in concepts or []:
+            if concept.concept_type in (ignore_concept_types or []):
+                continue
+            self._add(concept.ui, concept.concept_type,
+                      [a.term_key for a in concept.get_atoms()])
+
+    def _add(self, ui, concept_type, terms):
+        terms = frozenset(terms)
+        self.concepts[ui] = (concept_type, terms)
+        for term in terms:
+            self.postings[concept_type][term].add(ui)
+
+    def _remove(self, ui):
+        concept_type, terms = self.concepts.pop(ui)
+        postings = self.postings[concept_type]
+        for term in terms:
+            postings[term].discard(ui)
+            if len(postings[term]) == 0:
+                del postings[term]
+
+    def neighbors(self, ui):
+        """
+        The UIs of all other indexed concepts of the same type that
+        share one or more terms with the concept with this UI.
+
+        :param str ui: The UI of an indexed concept.
+        :returns: UIs of connected concepts.
+        :rtype: set
+        """
+        if ui not in self.concepts:
+            return set()
+        concept_type, terms = self.concepts[ui]
+        postings = self.postings[concept_type]
+        connected = set()
+        for term in terms:
+            connected.update(postings[term])
+        connected.discard(ui)
+        return connected
+
+    def update(self, concepts, ignore_concept_types=None):
+        """
+        Replace the indexed concepts from the source(s) of concepts with
+        concepts. Indexed concepts whose UI prefix matches that of any of
+        the given concepts, but which are not themselves given, are
+        considered deleted from the source.
+
+        Only the concepts that were added, changed, or deleted are
+        compared against the index.
+
+        :param list concepts: The refreshed Concepts.
+        :param list(str) ignore_concept_types: Optional. Don't index
+                                               Concepts with type belonging
+                                               to this list.
+        :returns: The added and removed connections as sorted lists of
+                  (UI, UI) tuples.
+        :rtype: tuple(list, list)
+        """
+        ignore_concept_types = ignore_concept_types or []
+        new = {}
+        for concept in concepts:
+            if concept.concept_type in ignore_concept_types:
+                continue
+            terms = frozenset([a.term_key for a in concept.get_atoms()])
+            new[concept.ui] = (concept.concept_type, terms)
+
+        prefixes = set([c._prefix for c in concepts])
+        deleted = [ui for ui in self.concepts
+                   if ui[:-7] in prefixes and ui not in new]
+        changed = [ui for (ui, entry) in new.items()
+                   if self.concepts.get(ui) != entry]
+        touched = deleted + changed
+        logging.info(f"Updating term index: {len(deleted)} deleted, {len(changed)} new or changed concepts.")  # noqa
+
+        def _pairs(uis):
+            return set([tuple(sorted((ui, other)))
+                        for ui in uis for other in self.neighbors(ui)])
+
+        old_pairs = _pairs(touched)
+        for ui in touched:
+            if ui in self.concepts:
+                self._remove(ui)
+        for ui in changed:
+            concept_type, terms = new[ui]
+            self._add(ui, concept_type, terms)
+        new_pairs = _pairs(touched)
+        added = sorted(new_pairs - old_pairs)
+        removed = sorted(old_pairs - new_pairs)
+        return added, removed
+
+    def save(self, outfile):
+        """
+        Save this index as JSON.
+
+        :param str outfile: Where to save the index.
+        """
+        data = {ui: [concept_type, sorted(terms)]
+                for (ui, (concept_type, terms)) in self.concepts.items()}
+        with open(outfile, 'w') as outF:
+            json.dump(data, outF)
+
+    @classmethod
+    def load(cls, infile):
+        """
+        Load an index saved by ``TermIndex.save``.
+
+        :param str infile: Path to the saved index.
+        :returns: The loaded index.
+        :rtype: TermIndex
+        """
+        index = cls()
+        with open(infile, 'r') as inF:
+            data = json.load(inF)
+        for (ui, (concept_type, terms)) in data.items():
+            index._add(ui, concept_type, terms)
+        return index
+
+
 class Union(object):
     """
     An implementation of the union-find data structure specific for
     iDISK Concepts.
 
     The routine starts by finding connections between pairs of concepts
-    in the input using ``Union.find_connections()``. It then merges the
-    connected concepts, always merging the concept with fewer of atoms
-    into the concept with more atoms.
+    in the input using ``Union.find_connections()``. It then resolves the
+    connected components and merges the concepts in each component,
+    always merging the concepts with fewer atoms into the concept
+    with the most atoms.
 
     This class can be used to generate a list of candidate connections,
     which can then be filtered, by passing ``run_union=False`` and then
@@ -152,22 +462,27 @@ class Union(object):
     See the idlib README for more example usage.
 
     :param list concepts: One or more lists of Concept instances.
-    :param list connections: A list of int tuples specifying connections
-                             between pairs of concepts, where each int
-                             in a given tuple is the index of the concept
-                             in the concepts argument. Optional. If not
-                             provided, pairs of concepts are connected if
-                             they share one or more atom terms.
+    :param iterable connections: int tuples specifying connections
+                                 between pairs of concepts, where each int
+                                 in a given tuple is the index of the
+                                 concept in the concepts argument. May be
+                                 a generator, in which case it is consumed
+                                 once by ``union_find``. Optional. If not
+                                 provided, pairs of concepts are connected
+                                 if they share one or more atom terms.
     :param bool run_union: If True (default) run union-find on the input.
                            Otherwise, just run find_connections.
     :param list(str) ignore_concept_types: Optional. Don't include Concepts
                                            with type belonging to this list.
+    :param int workers: Number of processes to use in find_connections.
+                        Default 1.
     """
     def __init__(self, concepts, connections=None, run_union=True,
-                 ignore_concept_types=None):
+                 ignore_concept_types=None, workers=1):
         self.concepts = concepts
-        self.connections = connections or []
+        self.connections = connections if connections is not None else []
         self.ignore_concept_types = ignore_concept_types or []
+        self.workers = workers
         self._check_params(self.concepts, self.connections,
                            self.ignore_concept_types)
 
@@ -175,8 +490,9 @@ class Union(object):
             logging.info(f"Ignoring types: {self.ignore_concept_types}.")
 
         self.ui2index = {c.ui: i for (i, c) in enumerate(self.concepts)}
-        self.parents = list(range(len(self.concepts)))
-        if self.connections == []:
+        self.parents = np.arange(len(self.concepts), dtype=np.int32)
+        self.sizes = np.ones(len(self.concepts), dtype=np.int32)
+        if isinstance(self.connections, list) and self.connections == []:
             logging.info("Finding connections...")
             self.connections = self.find_connections()
             """The result of ``self.find_connections()``"""
@@ -188,8 +504,9 @@ class Union(object):
     def _check_params(self, concepts, connections, ignore_types):
         assert(all([isinstance(c, idlib.data_elements.Concept)
                     for c in concepts]))
-        assert(isinstance(connections, list))
-        if len(connections) > 0:
+        assert(hasattr(connections, "__iter__"))
+        # Streams of connections are not checked so as not to consume them.
+        if isinstance(connections, list) and len(connections) > 0:
             assert(all([isinstance(elem, tuple) for elem in connections]))
             assert(all([isinstance(i, int) for elem in connections
                         for i in elem]))
@@ -202,156 +519,301 @@ class Union(object):
         Finds all pairs of concepts that share one or more atom
         terms. Returns connections as a generator over int tuples.
 
+        Rather than comparing all pairs of concepts, candidates for
+        concept i are taken from the postings of its terms in an inverted
+        index (see ``build_term_index``), so the cost scales with the
+        number of overlapping terms. Connections are yielded in the same
+        order as ``itertools.combinations``, i.e. sorted by i then j.
+
+        If ``self.workers`` is greater than 1, the posting lists are
+        sharded across a pool of processes instead. See
+        ``Union._find_connections_parallel``.
+
         :returns: A generator over connections [i, j]
         :rtype: Generator
         """
-
-        def _cache_atoms(indices):
-            # Cache the atoms of each concept to speed things up.
-            cache = {i: set([a.term.lower()
-                             for a in self.concepts[i].get_atoms()])
-                     for i in indices}
-            return cache
-
-        def _cache_concept_types(indices):
-            # Cache the types of each concept to speed things up.
-            cache = {i: self.concepts[i].concept_type for i in indices}
-            return cache
-
-        def _filter_indices(idxs):
-            # Remove indices of concepts that should be ignored.
-            filtered_idxs = []
-            for i in idxs:
-                if _type_cache[i] in self.ignore_concept_types:
-                    continue
-                filtered_idxs.append(i)
-            return filtered_idxs
-
-        def _connected(i, j):
-            # Two concepts are connected if their atoms overlap.
-            ci_type = _type_cache[i]
-            cj_type = _type_cache[j]
-            if ci_type != cj_type:
-                return False
-            ci_terms = _atom_cache[i]
-            cj_terms = _atom_cache[j]
-            overlap = ci_terms.intersection(cj_terms)
-            return bool(overlap)
-
-        idxs = list(range(len(self.concepts)))
-        _type_cache = _cache_concept_types(idxs)
-        idxs = _filter_indices(idxs)
-        _atom_cache = _cache_atoms(idxs)
-
-        combos = combinations(idxs, 2)
-        # This is a quick approximation as the factorials get large.
-        n_combos = (len(idxs)**2 // 2) - len(idxs)
+        index, terms = build_term_index(self.concepts,
+                                        self.ignore_concept_types)
+        if self.workers > 1:
+            yield from self._find_connections_parallel(index)
+            return
+        n_concepts = len(terms)
         n_connections = 0
-        for (count, (i, j)) in enumerate(combos):
-            if count % 1000000 == 0:
-                logging.info(f"{count}/{n_combos} : # cnxs {n_connections}")
-            if _connected(i, j) is True:
+        for (count, (i, i_terms)) in enumerate(sorted(terms.items())):
+            if count % 100000 == 0:
+                logging.info(f"{count}/{n_concepts} : # cnxs {n_connections}")  # noqa
+            postings = index[self.concepts[i].concept_type]
+            candidates = set()
+            for term in i_terms:
+                idxs = postings[term]
+                # Postings are sorted, so only look at those after i.
+                candidates.update(idxs[bisect_right(idxs, i):])
+            for j in sorted(candidates):
                 n_connections += 1
                 yield (i, j)
 
         logging.info(f"# cnxs {n_connections}")
 
-    def _merge(self, concept_i, concept_j):
+    def find_approximate_connections(self, threshold=0.8, num_perm=128,
+                                     ngram=3):
         """
-        Merges the second Concepts into the first by merging their Atoms,
-        Attributes, and Relationships.
+        Finds pairs of concepts with similar, but not identical, atom
+        terms, e.g. "ginseng panax" and "Panax ginseng". Terms are
+        normalized with ``idlib.lsh.normalize`` and compared by the
+        Jaccard similarity of their character n-grams. Candidate pairs
+        of terms are generated with MinHash LSH, so not all pairs of
+        terms are compared.
+
+        Pairs of concepts that share an atom term, i.e. those found by
+        ``Union.find_connections``, are not included.
+
+        :param float threshold: Jaccard similarity threshold. Default 0.8.
+        :param int num_perm: Number of MinHash permutations. Default 128.
+        :param int ngram: Size of the character n-grams. Default 3.
+        :returns: Generator over (i, j, similarity), sorted by i then j,
+                  where similarity is that of the most similar pair of
+                  terms of concepts i and j.
+        :rtype: Generator
+        """
+        lsh = MinHashLSH(threshold=threshold, num_perm=num_perm,
+                         ngram=ngram)
+        exact_terms = {}
+        term_ids = {}
+        term_concepts = defaultdict(list)
+        for (i, concept) in enumerate(self.concepts):
+            if concept.concept_type in self.ignore_concept_types:
+                continue
+            exact_terms[i] = set([a.term_key for a in concept.get_atoms()])
+            for norm in set([normalize(t) for t in exact_terms[i]]):
+                if norm == '':
+                    continue
+                if norm not in term_ids:
+                    term_ids[norm] = len(term_ids)
+                    lsh.add(term_ids[norm], norm)
+                term_concepts[term_ids[norm]].append(i)
+        logging.info(f"Indexed {len(term_ids)} normalized terms with {lsh.bands} bands of {lsh.rows} rows.")  # noqa
+
+        scores = {}
+
+        def _connect(term1, term2, score):
+            for idx1 in term_concepts[term1]:
+                for idx2 in term_concepts[term2]:
+                    if idx1 == idx2:
+                        continue
+                    (i, j) = (min(idx1, idx2), max(idx1, idx2))
+                    if self.concepts[i].concept_type != self.concepts[j].concept_type:  # noqa
+                        continue
+                    if not exact_terms[i].isdisjoint(exact_terms[j]):
+                        continue
+                    if score > scores.get((i, j), 0.0):
+                        scores[(i, j)] = score
+
+        # Concepts with identical normalized terms.
+        for (term, idxs) in term_concepts.items():
+            if len(idxs) > 1:
+                _connect(term, term, 1.0)
+        for (term1, term2, score) in lsh.similar_pairs():
+            _connect(term1, term2, score)
+
+        logging.info(f"# approximate cnxs {len(scores)}")
+        for (i, j) in sorted(scores):
+            yield (i, j, scores[(i, j)])
+
+    def _find_connections_parallel(self, index):
+        """
+        Shards the posting lists of the term index by term hash across
+        ``self.workers`` processes. Each process writes its connections
+        to a sorted spill file and the spill files are then merged.
 
-        :param Concept concept_i: The first concept.
-        :param Concept concept_j: The second concept.
-        :returns: Merged concept.
-        :rtype: Concept
+        :param dict index: The term index from ``build_term_index``.
+        :returns: A generator over connections [i, j]
+        :rtype: Generator
         """
-        merged = copy.copy(concept_i)
-        # Replace the prefix
-        new_prefix = _get_prefix(concept_i, concept_j)
-        merged._prefix = new_prefix
+        # More shards than workers to even out the load.
+        n_shards = self.workers * 4
+        shards = [[] for _ in range(n_shards)]
+        for postings in index.values():
+            for (term, idxs) in postings.items():
+                if len(idxs) < 2:
+                    continue
+                shard = zlib.crc32(term.encode("utf-8")) % n_shards
+                shards[shard].append(idxs)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            tasks = [(n, postings, spill_dir, _SPILL_SIZE)
+                     for (n, postings) in enumerate(shards)]
+            logging.info(f"Finding connections over {n_shards} shards with {self.workers} workers.")  # noqa
+            with multiprocessing.Pool(self.workers) as pool:
+                spill_files = [fpath for fpaths in tqdm(
+                    pool.imap_unordered(_find_connections_shard, tasks),
+                    total=n_shards) for fpath in fpaths]
+            n_connections = 0
+            for cnx in _merge_spill_files(spill_files):
+                n_connections += 1
+                yield cnx
+        logging.info(f"# cnxs {n_connections}")
 
-        # Merge atoms.
-        merged.add_elements(concept_j.get_atoms())
+    def _merge_component(self, members):
+        """
+        Merges all the concepts in a connected component into a copy of
+        the concept with the most atoms, by merging their Atoms,
+        Attributes, and Relationships. The copy is made and its prefix
+        computed only once per component.
 
-        # Merge attributes, changing the subject.
-        for atr in concept_j.get_attributes():
+        :param list(Concept) members: The concepts to merge.
+        :returns: Merged concept.
+        :rtype: Concept
+        """
+        base = max(members, key=lambda c: len(c._atoms))
+        others = [c for c in members if c is not base]
+
+        # The merged concept gets its own containers, so that base,
+        # which keeps its UI and cached hash, is left unchanged.
+        base_atoms = set(base._atoms)
+        base_atrs = set(base._attributes)
+        base_rels = set(base._relationships)
+        merged = copy.copy(base)
+        merged._atoms = base_atoms
+        merged._attributes = base_atrs
+        merged._relationships = base_rels
+        merged._atoms_changed()
+        merged._prefix = _get_prefix(*members)
+        atoms = []
+        atrs = []
+        rels = []
+        for concept in others:
+            atoms.extend(concept._atoms)
+            atrs.extend(concept._attributes)
+            rels.extend(concept._relationships)
+
+        # Change the subjects of the merged attributes and relationships.
+        for atr in atrs:
             atr.subject = merged
-            merged.add_elements(atr)
-
-        # Merge relationships, removing duplicates and changing the subject.
-        for rel in concept_j.get_relationships():
+        for rel in rels:
             rel.subject = merged
-            for a in rel.get_attributes():
+            for a in rel._attributes:
                 a.subject = merged
-            merged.add_elements(rel)
+
+        # Elements already in the merged concept are kept.
+        merged.add_elements(atoms + atrs + rels)
         return merged
 
     def _find(self, i):
         """
-        The find operation of union-find with path compression.
+        The find operation of union-find with path halving.
 
         :param int i: The index of the concept whose root to find.
         :returns: The root of concept i
         :rtype: int
         """
-        if i != self.parents[i]:  # If this is not a root node
-            self.parents[i] = self._find(self.parents[i])
-        return self.parents[i]
+        parents = self.parents
+        while parents[i] != i:  # While this is not a root node
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return int(i)
 
     def _union(self, i, j):
         """
-        The union operation of union-find. Merges concepts with fewer
-        atoms into those with more.
+        The union operation of union-find, using union by size.
+        The concepts themselves are merged later in
+        ``Union._resolve_components``.
 
-        :param int i: The index of the first concept to merge.
-        :param int j: The index of the second concept to merge.
+        :param int i: The index of the first concept to join.
+        :param int j: The index of the second concept to join.
         """
         pi = self._find(i)
         pj = self._find(j)
         if pi == pj:
             return
-        concept_i = self.concepts[pi]
-        concept_j = self.concepts[pj]
-        # Merge the smaller concept into the bigger.
-        if len(concept_i._atoms) < len(concept_j._atoms):
+        # Attach the smaller tree to the bigger.
+        if self.sizes[pi] < self.sizes[pj]:
             pi, pj = pj, pi
-            concept_i, concept_j = concept_j, concept_i
-        # Merge concept_j into concept_i
-        merged = self._merge(concept_i, concept_j)
-        self.concepts[pi] = merged
-        self.ui2index[merged.ui] = pi
         self.parents[pj] = pi
+        self.sizes[pi] += self.sizes[pj]
+
+    def _resolve_components(self):
+        """
+        Point every concept directly at the root of its component and
+        merge the concepts of each component once, storing the result
+        at the index of the root.
+        """
+        # Pointer jumping until every parent is a root.
+        while True:
+            grandparents = self.parents[self.parents]
+            if np.array_equal(grandparents, self.parents):
+                break
+            self.parents = grandparents
+        order = np.argsort(self.parents, kind="stable")
+        bounds = np.flatnonzero(np.diff(self.parents[order])) + 1
+        for idxs in np.split(order, bounds):
+            if len(idxs) < 2:
+                continue
+            root = int(self.parents[idxs[0]])
+            merged = self._merge_component(
+                [self.concepts[i] for i in idxs])
+            self.concepts[root] = merged
+            self.ui2index[merged.ui] = root
 
     def union_find(self):
         """
-        The union-find routine. Given a list of connections, merges them.
+        The union-find routine. Given a list of connections, finds the
+        connected components and merges them.
+        """
+        # Path halving reads and writes single elements, which is much
+        # faster on lists than on NumPy arrays, so the arrays are only
+        # used to store the parents and sizes between the steps.
+        self.parents = self.parents.tolist()
+        self.sizes = self.sizes.tolist()
+        try:
+            for (i, j) in tqdm(self.connections):
+                self._union(i, j)
+        finally:
+            self.parents = np.array(self.parents, dtype=np.int32)
+            self.sizes = np.array(self.sizes, dtype=np.int32)
+        self._resolve_components()
+        self.ui2root = self._build_ui2root()
+        """Maps the UI of each input concept to its merged concept."""
+
+    def _build_ui2root(self):
         """
-        for (i, j) in tqdm(self.connections):
-            self._union(i, j)
+        Map the UI of every input concept, and of every merged concept,
+        to the concept at the root of its component.
+
+        :returns: {UI: Concept}
+        :rtype: dict
+        """
+        idxs = np.fromiter(self.ui2index.values(), dtype=np.int32,
+                           count=len(self.ui2index))
+        roots = self.parents[idxs].tolist()
+        return {ui: self.concepts[root]
+                for (ui, root) in zip(self.ui2index.keys(), roots)}
 
     def update_relationships(self):
         """
         For each Concept that was merged into another by ``self.union_find``
-        update the subject of its Relationships to be the Concept it was 
-        merged into.
+        update the object of each Relationship that points to it to be the
+        Concept it was merged into.
+
+        Relationships whose object is not a Concept in the input, e.g.
+        a UI that was never resolved, are left as they are and counted in
+        ``self.num_dangling``.
 
         :returns: Concepts with updated Relationships.
         :rtype: list(Concept)
         """
-        # Make sure we find the parent of any concepts we did not
-        # update in _union.
-        _ = [self._find(i) for i in range(len(self.concepts))]
-        concepts = [self.concepts[i] for i in set(self.parents)]
+        ui2root = self.ui2root
+        concepts = [self.concepts[i] for i in np.unique(self.parents)]
+        num_dangling = 0
         for concept in concepts:
-            for rel in concept.get_relationships():
+            for rel in concept._relationships:
                 try:
-                    object_idx = self.ui2index[rel.object.ui]
-                except AttributeError:
-                    continue
-                parent_idx = self.parents[object_idx]
-                parent_concept = self.concepts[parent_idx]
-                rel.object = parent_concept
+                    rel.object = ui2root[rel.object.ui]
+                except (AttributeError, KeyError):
+                    num_dangling += 1
+        self.num_dangling = num_dangling
+        """The number of Relationships whose object could not be updated."""
+        if num_dangling > 0:
+            logging.info(f"Skipped {num_dangling} dangling relationship objects.")  # noqa
         return concepts
 
 
@@ -408,17 +870,38 @@ if __name__ == "__main__":
     args = parse_args()
 
     logging.info("Loading concepts.")
-    concepts = read_concepts_files(*args.infiles)
+    # Finding connections only looks at the atoms.
+    lazy = args.function == "find_connections"
+    concepts = read_concepts_files(*args.infiles, lazy=lazy)
     logging.info(f"Number of starting concepts: {len(concepts)}")
 
-    cnxs = []
+    # Connections index into a single concatenated concepts file.
+    concepts_file = args.infiles[0] if len(args.infiles) == 1 else None
+    cnxs = None
     if args.connections_file is not None:
-        cnxs = read_connections_file(args.connections_file)
-
-    if args.function == "find_connections":
+        cnxs = read_connections_file(args.connections_file,
+                                     concepts_file=concepts_file)
+
+    if args.function == "find_connections" and args.term_index is not None:
+        # Only compare the given concepts to those already indexed.
+        perform_incremental_find_connections(
+            concepts, args.term_index, args.outfile,
+            ignore_concept_types=args.ignore_concept_types,
+            save_term_index=args.save_term_index)
+    elif args.function == "find_connections":
         # Just find connections, don't compute the union.
         perform_find_connections(concepts, args.outfile,
-                                 ignore_concept_types=args.ignore_concept_types)  # noqa
+                                 ignore_concept_types=args.ignore_concept_types,  # noqa
+                                 workers=args.workers,
+                                 concepts_file=concepts_file)
+        if args.save_term_index is not None:
+            TermIndex(concepts, args.ignore_concept_types).save(
+                args.save_term_index)
+        if args.approximate_outfile is not None:
+            perform_find_approximate_connections(
+                concepts, args.approximate_outfile,
+                threshold=args.approximate_threshold,
+                ignore_concept_types=args.ignore_concept_types)
     else:
         func = func_table[args.function]
         perform_set_function(func, concepts, args.outfile, connections=cnxs,
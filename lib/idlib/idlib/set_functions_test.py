@@ -0,0 +1,224 @@
+import json
+from itertools import combinations
+from collections import defaultdict
+
+from idlib.data_elements import Atom, Concept, Registry
+from idlib.connections import read_connections
+from idlib import set_functions
+
+
+def make_concept(terms, src="NMCD", concept_type="SDSI", ui=None):
+    atoms = [Atom(term, src=src, src_id=str(i), term_type="SY",
+                  is_preferred=(i == 0))
+             for (i, term) in enumerate(terms)]
+    return Concept(concept_type=concept_type, atoms=atoms, ui=ui)
+
+
+def test_find_connections_shard_spills_in_batches(tmp_path):
+    postings = [list(range(30)), [2, 5, 40, 41], [40, 41]]
+    expected = sorted(set([cnx for idxs in postings
+                           for cnx in combinations(idxs, 2)]))
+    spill_files = set_functions._find_connections_shard(
+        (0, postings, str(tmp_path), 50))
+    assert len(spill_files) > 1
+    for fpath in spill_files:
+        cnxs = list(read_connections(fpath))
+        assert len(cnxs) <= 50
+        assert cnxs == sorted(set(cnxs))
+    merged = list(set_functions._merge_spill_files(spill_files))
+    assert merged == expected
+
+
+def test_find_connections_parallel_matches_serial():
+    concepts = [make_concept(["vitamin c", "ascorbic acid"]),
+                make_concept(["Vitamin C"]),
+                make_concept(["ginseng"]),
+                make_concept(["ascorbic acid", "ginseng"]),
+                make_concept(["ginseng"], concept_type="DSP"),
+                make_concept(["melatonin"])]
+    serial = list(set_functions.Union(concepts, run_union=False).connections)
+    parallel = list(set_functions.Union(concepts, run_union=False,
+                                        workers=2).connections)
+    assert serial == [(0, 1), (0, 3), (2, 3)]
+    assert parallel == serial
+
+
+def _index_connections(index):
+    return set([tuple(sorted((ui, other))) for ui in index.concepts
+                for other in index.neighbors(ui)])
+
+
+def test_term_index_update_matches_rebuild(tmp_path):
+    nmcd = [make_concept(["vitamin c", "ascorbic acid"], ui="NMCD0000001"),
+            make_concept(["ginseng"], ui="NMCD0000002"),
+            make_concept(["melatonin"], ui="NMCD0000003")]
+    dsld = [make_concept(["Vitamin C"], src="DSLD", ui="DSLD0000001"),
+            make_concept(["Melatonin"], src="DSLD", ui="DSLD0000002"),
+            make_concept(["panax ginseng"], src="DSLD", ui="DSLD0000003")]
+    index_file = str(tmp_path / "term_index.json")
+    old_index = set_functions.TermIndex(nmcd + dsld)
+    old_index.save(index_file)
+    old_cnxs = _index_connections(old_index)
+
+    # NMCD0000003 is removed, NMCD0000002 changed, and NMCD0000004 added.
+    new_nmcd = [make_concept(["vitamin c", "ascorbic acid"],
+                             ui="NMCD0000001"),
+                make_concept(["ginseng", "panax ginseng"], ui="NMCD0000002"),
+                make_concept(["melatonin"], ui="NMCD0000004")]
+    index = set_functions.TermIndex.load(index_file)
+    added, removed = index.update(new_nmcd)
+
+    rebuilt = set_functions.TermIndex(new_nmcd + dsld)
+    assert index.concepts == rebuilt.concepts
+    new_cnxs = _index_connections(rebuilt)
+    assert _index_connections(index) == new_cnxs
+    assert added == sorted(new_cnxs - old_cnxs)
+    assert removed == sorted(old_cnxs - new_cnxs)
+    assert added == [("DSLD0000002", "NMCD0000004"),
+                     ("DSLD0000003", "NMCD0000002")]
+    assert removed == [("DSLD0000002", "NMCD0000003")]
+
+
+def _concept_dicts(n=40):
+    """
+    n concepts from several sources with overlapping terms,
+    attributes, and relationships between them.
+    """
+    srcs = ["NMCD", "DSLD", "NHPID", "MSKCC"]
+    uis = [f"{srcs[i % 4]}{i + 1:07}" for i in range(n)]
+    dicts = []
+    for i in range(n):
+        src = srcs[i % 4]
+        terms = [f"term{i % 13}", f"term{(i * 7) % 17 + 13}"]
+        synonyms = [{"term": term, "src": src, "src_id": str(i),
+                     "term_type": "SY", "is_preferred": k == 0}
+                    for (k, term) in enumerate(terms)]
+        attributes = [{"atr_name": "background", "atr_value": f"text {i}",
+                       "src": src}]
+        relationships = [{"rel_name": "has_ingredient",
+                          "object": uis[(i * 11 + 3) % n], "src": src,
+                          "attributes": [{"atr_name": "amount",
+                                          "atr_value": str(i),
+                                          "src": src}]}]
+        dicts.append({"ui": uis[i],
+                      "concept_type": "DSP" if i % 5 == 0 else "SDSI",
+                      "synonyms": synonyms, "attributes": attributes,
+                      "relationships": relationships})
+    return dicts
+
+
+def _load(dicts):
+    with Registry(classes=[Concept]) as registry:
+        concepts = [Concept.from_dict(data) for data in dicts]
+    Concept.resolve_relationships(registry=registry)
+    return concepts
+
+
+def _canonical(concepts):
+    def _sort(elems):
+        return sorted(elems, key=lambda e: json.dumps(e, sort_keys=True))
+
+    out = []
+    for concept in concepts:
+        data = concept.to_dict()
+        data["synonyms"] = _sort(data["synonyms"])
+        data["attributes"] = _sort(data["attributes"])
+        for rel in data["relationships"]:
+            rel["attributes"] = _sort(rel["attributes"])
+        data["relationships"] = _sort(data["relationships"])
+        out.append(json.dumps(data, sort_keys=True))
+    return sorted(out)
+
+
+def test_union_find_components():
+    concepts = [make_concept([f"term {i}"]) for i in range(10)]
+    # A long chain, joined from both ends, and a separate pair.
+    connections = ([(i, i + 1) for i in range(0, 6, 2)] +
+                   [(i, i + 1) for i in range(5, 0, -2)] + [(7, 8)])
+    union = set_functions.Union(concepts, connections=connections)
+    assert union.parents.dtype.name == "int32"
+    assert union.sizes.dtype.name == "int32"
+    roots = union.parents.tolist()
+    assert len(set(roots[:7])) == 1
+    assert roots[7] == roots[8] != roots[0]
+    assert roots[9] == 9
+    assert all([roots[root] == root for root in roots])
+    assert len(union.result) == 3
+
+
+def test_merge_component_leaves_members_unchanged():
+    concept_i = make_concept(["vitamin c", "ascorbic acid"],
+                             ui="NMCD0000001")
+    concept_j = make_concept(["Vitamin C"], src="DSLD", ui="DSLD0000002")
+    hash_i = hash(concept_i)
+    preferred_i = concept_i.preferred_atom
+    union = set_functions.Union([concept_i, concept_j], run_union=False)
+    merged = union._merge_component([concept_i, concept_j])
+    assert merged is not concept_i
+    assert merged._atoms is not concept_i._atoms
+    assert len(merged._atoms) == 3
+    assert merged._prefix == "DSLD_NMCD"
+    assert hash(concept_i) == hash_i
+    assert len(concept_i._atoms) == 2
+    assert concept_i.preferred_atom is preferred_i
+
+
+def _merge_pairwise(concepts, connections):
+    """
+    Union by merging the concepts of each component pairwise
+    with ``Union._merge_component``.
+    """
+    parents = list(range(len(concepts)))
+
+    def _find(i):
+        while parents[i] != i:
+            i = parents[i]
+        return i
+
+    for (i, j) in connections:
+        parents[_find(j)] = _find(i)
+    components = defaultdict(list)
+    for i in range(len(concepts)):
+        components[_find(i)].append(i)
+
+    union = set_functions.Union(concepts, run_union=False)
+    ui2merged = {}
+    result = []
+    for idxs in components.values():
+        members = [concepts[i] for i in idxs]
+        merged = max(members, key=lambda c: len(c._atoms))
+        for concept in members:
+            if concept is not merged:
+                merged = union._merge_component([merged, concept])
+        for concept in members:
+            ui2merged[concept.ui] = merged
+        result.append(merged)
+    for concept in result:
+        for rel in concept.get_relationships():
+            rel.object = ui2merged[rel.object.ui]
+    return result
+
+
+def test_union_matches_pairwise_merge():
+    concepts = _load(_concept_dicts())
+
+    def _state(concept):
+        return (hash(concept), concept.ui, frozenset(concept._atoms),
+                len(concept._attributes), len(concept._relationships))
+
+    inputs = list(concepts)  # Union replaces the roots in concepts.
+    before = [_state(c) for c in inputs]
+    connections = list(set_functions.Union(concepts,
+                                           run_union=False).connections)
+    assert len(connections) > 0
+    result = set_functions.Union(concepts, connections=connections).result
+
+    expected = _merge_pairwise(_load(_concept_dicts()), connections)
+    assert len(result) == len(expected) < len(concepts)
+    assert _canonical(result) == _canonical(expected)
+    for concept in result:
+        prefix_srcs = concept._prefix.split('_')
+        assert prefix_srcs == sorted(prefix_srcs)
+    # The input concepts keep their atoms and other elements.
+    # Only the objects of their relationships are updated.
+    assert [_state(c) for c in inputs] == before
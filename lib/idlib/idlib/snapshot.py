@@ -0,0 +1,269 @@
+"""
+Binary snapshots of a concepts JSON lines file, so that loading a
+knowledge base does not have to parse the JSON every time.
+``idlib.load_kb(..., snapshot=True)`` writes a snapshot next to the
+concepts file the first time it is loaded and restores from it afterwards.
+
+A snapshot starts with a magic string including the snapshot format
+version, followed by a sequence of pickles, and ends with an end marker
+so that truncated snapshots are detected. The first pickle is the key
+of the concepts file the snapshot was made from: its size, modification
+time, and SHA-256 digest. A snapshot is only used if all three still
+match the concepts file, so any change to the file invalidates it.
+The rest are the contents: batches of records (see ``idlib.loading``)
+for the "objects" backend, or the ColumnarKB for the "columnar" backend.
+
+Restoring a ColumnarKB takes a fraction of the time of parsing the
+concepts file. Restoring the "objects" backend only skips parsing the
+JSON, since every Concept, Atom, Attribute and Relationship still has
+to be built from the records, so it saves much less.
+
+Unpickling arbitrary data can run arbitrary code. Snapshots are read
+with an unpickler that only allows the few classes they contain, so a
+tampered snapshot fails to load rather than running code. Still, a
+snapshot is only as trustworthy as the directory it is in.
+"""
+
+import os
+import pickle
+import logging
+
+from idlib.connections import file_checksum
+
+
+MAGIC = b"IDSNP\x00\x00\x03"
+END = b"IDSNPEND"
+_BATCH_SIZE = 10000  # Number of records per pickle.
+# The only classes and functions a snapshot may refer to. Records and
+# keys are made of builtin types only.
+_ALLOWED_GLOBALS = set([
+    ("idlib.columnar", "ColumnarKB"),
+    ("idlib.columnar", "StringColumn"),
+    ("idlib.columnar", "Vocabulary"),
+    ("idlib.columnar", "_AttributeTable"),
+    ("numpy", "dtype"),
+    ("numpy", "ndarray"),
+    ("numpy.core.numeric", "_frombuffer"),
+    ("numpy._core.numeric", "_frombuffer"),
+    ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy._core.multiarray", "_reconstruct"),
+])
+
+
+class _Unpickler(pickle.Unpickler):
+    """
+    An unpickler that refuses any globals not in _ALLOWED_GLOBALS.
+    """
+    def find_class(self, module, name):
+        if (module, name) not in _ALLOWED_GLOBALS:
+            msg = f"'{module}.{name}' is not allowed in a snapshot."
+            raise pickle.UnpicklingError(msg)
+        return super().find_class(module, name)
+
+
+def _load(inF):
+    return _Unpickler(inF).load()
+
+
+def snapshot_path(concepts_file, backend="objects"):
+    """
+    The path of the snapshot of concepts_file for backend.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :param str backend: "objects" or "columnar". See ``idlib.load_kb``.
+    :rtype: str
+    """
+    return f"{concepts_file}.{backend}.snapshot"
+
+
+def _stat_key(concepts_file):
+    stat = os.stat(concepts_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_key(concepts_file):
+    """
+    The key a snapshot of concepts_file is stored under.
+
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :returns: The size, modification time, and checksum of the file.
+    :rtype: dict
+    """
+    key = _stat_key(concepts_file)
+    key["sha256"] = file_checksum(concepts_file)
+    return key
+
+
+def is_valid(snapshot_file, concepts_file):
+    """
+    Whether snapshot_file exists, is complete, and was made from
+    concepts_file as it is now. The checksum of concepts_file is only
+    computed if its size and modification time match.
+
+    :param str snapshot_file: Path to the snapshot.
+    :param str concepts_file: Path to the JSON lines file of concepts.
+    :rtype: bool
+    """
+    if not os.path.exists(snapshot_file):
+        return False
+    try:
+        with open(snapshot_file, 'rb') as inF:
+            if inF.read(len(MAGIC)) != MAGIC:
+                return False
+            key = _load(inF)
+            inF.seek(-len(END), os.SEEK_END)
+            if inF.read(len(END)) != END:
+                return False
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False
+    if not isinstance(key, dict):
+        return False
+    stat_key = _stat_key(concepts_file)
+    if any([key.get(name) != val for (name, val) in stat_key.items()]):
+        return False
+    return key.get("sha256") == file_checksum(concepts_file)
+
+
+def read_snapshot(snapshot_file):
+    """
+    Read the contents of a snapshot. Check that it is up to date
+    with ``is_valid`` first.
+
+    :param str snapshot_file: Path to the snapshot.
+    :returns: Generator over the pickled objects after the key.
+    :rtype: generator
+    """
+    end = os.path.getsize(snapshot_file) - len(END)
+    with open(snapshot_file, 'rb') as inF:
+        if inF.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{snapshot_file}' is not a snapshot.")
+        _load(inF)  # The key.
+        while inF.tell() < end:
+            yield _load(inF)
+        if inF.tell() != end or inF.read(len(END)) != END:
+            raise ValueError(f"'{snapshot_file}' is corrupt.")
+
+
+def read_snapshot_records(snapshot_file):
+    """
+    Read the records in a snapshot of the "objects" backend.
+
+    :param str snapshot_file: Path to the snapshot.
+    :returns: Generator over records. See ``idlib.loading``.
+    :rtype: generator
+    """
+    for batch in read_snapshot(snapshot_file):
+        yield from batch
+
+
+class SnapshotWriter(object):
+    """
+    Writes a snapshot of a concepts file. The snapshot is written to a
+    temporary file that replaces snapshot_file on ``close``. If the
+    concepts file changed in the meantime, or writing fails, e.g.
+    because the version directory is read-only, no snapshot is saved.
+
+    :param str snapshot_file: Where to save the snapshot.
+    :param str concepts_file: The concepts file the snapshot is of.
+    """
+    def __init__(self, snapshot_file, concepts_file):
+        self.snapshot_file = snapshot_file
+        self.concepts_file = concepts_file
+        self._key = file_key(concepts_file)
+        self._tmp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+        self._outF = None
+        try:
+            self._outF = open(self._tmp_file, 'wb')
+            self._outF.write(MAGIC)
+            self._dump(self._key)
+        except OSError as e:
+            self._fail(e)
+
+    def _dump(self, obj):
+        pickle.dump(obj, self._outF, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _fail(self, error):
+        # Loading goes on without the snapshot, e.g. in a read-only
+        # release directory, so this is not a warning.
+        logging.info(f"Not saving snapshot '{self.snapshot_file}': {error}")  # noqa
+        self.abort()
+
+    def write(self, obj):
+        """
+        Add obj to the contents of the snapshot.
+
+        :param obj: A picklable object.
+        """
+        if self._outF is None:
+            return
+        try:
+            self._dump(obj)
+        except OSError as e:
+            self._fail(e)
+
+    def abort(self):
+        """
+        Stop writing and remove the temporary file.
+        """
+        if self._outF is not None:
+            self._outF.close()
+            self._outF = None
+        try:
+            os.remove(self._tmp_file)
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Save the snapshot.
+
+        :returns: Whether the snapshot was saved.
+        :rtype: bool
+        """
+        if self._outF is None:
+            return False
+        try:
+            self._outF.write(END)
+            self._outF.close()
+        except OSError as e:
+            self._fail(e)
+            return False
+        self._outF = None
+        stat_key = _stat_key(self.concepts_file)
+        if any([self._key[name] != val for (name, val) in stat_key.items()]):
+            self._fail(f"'{self.concepts_file}' changed while loading.")
+            return False
+        try:
+            os.replace(self._tmp_file, self.snapshot_file)
+        except OSError as e:
+            self._fail(e)
+            return False
+        return True
+
+
+def tee_records(records, snapshot_file, concepts_file):
+    """
+    Pass records through while saving them to a snapshot of
+    concepts_file, which is saved once all records are consumed.
+
+    :param iterable records: Records of the concepts in concepts_file.
+    :param str snapshot_file: Where to save the snapshot.
+    :param str concepts_file: The concepts file the records are from.
+    :returns: Generator over records.
+    :rtype: generator
+    """
+    writer = SnapshotWriter(snapshot_file, concepts_file)
+    batch = []
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) == _BATCH_SIZE:
+                writer.write(batch)
+                batch = []
+            yield record
+    except BaseException:
+        writer.abort()
+        raise
+    if len(batch) > 0:
+        writer.write(batch)
+    writer.close()
@@ -0,0 +1,179 @@
+import os
+import json
+import pickle
+
+import pytest
+
+import idlib
+from idlib import config, snapshot
+from idlib.columnar import ColumnarKB
+
+
+KB_INI = """[1.0.0]
+sources = NMCD DSLD
+term_types = SY
+concept_types = SDSI DSP
+"""
+
+
+def _concept_dict(i, src="NMCD"):
+    return {"ui": f"{src}{i:07}", "concept_type": "SDSI",
+            "synonyms": [{"term": f"term {i}", "src": src,
+                          "src_id": str(i), "term_type": "SY",
+                          "is_preferred": True}],
+            "attributes": [{"atr_name": "background",
+                            "atr_value": f"text {i}", "src": src}],
+            "relationships": [{"rel_name": "related_to",
+                               "object": f"{src}{(i % 5) + 1:07}",
+                               "src": src, "attributes": []}]}
+
+
+@pytest.fixture
+def version_dir(tmp_path, monkeypatch):
+    # load_kb loads the config, so restore it afterwards.
+    for name in ["SOURCES", "SOURCE_RANKS", "TERM_TYPES", "CONCEPT_TYPES"]:
+        monkeypatch.setattr(config, name, getattr(config, name))
+    (tmp_path / ".version").write_text("1.0.0\n")
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "kb.ini").write_text(KB_INI)
+    (tmp_path / "concepts").mkdir()
+    with open(_concepts_file(tmp_path), 'w') as outF:
+        for i in range(1, 11):
+            outF.write(json.dumps(_concept_dict(i)) + '\n')
+    return tmp_path
+
+
+def _concepts_file(version_dir):
+    return str(version_dir / "concepts" / "concepts_merged.jsonl")
+
+
+def _uis(kb):
+    return [concept.ui for concept in kb]
+
+
+def test_no_snapshot_by_default(version_dir):
+    kb = idlib.load_kb(str(version_dir))
+    assert len(kb) == 10
+    assert os.listdir(version_dir / "concepts") == ["concepts_merged.jsonl"]
+
+
+@pytest.mark.parametrize("backend", ["objects", "columnar"])
+def test_snapshot_round_trip(version_dir, capsys, backend):
+    concepts_file = _concepts_file(version_dir)
+    snapshot_file = snapshot.snapshot_path(concepts_file, backend)
+    kb = idlib.load_kb(str(version_dir), backend=backend, snapshot=True)
+    assert snapshot.is_valid(snapshot_file, concepts_file)
+    capsys.readouterr()
+
+    restored = idlib.load_kb(str(version_dir), backend=backend,
+                             snapshot=True)
+    assert "from snapshot" in capsys.readouterr().out
+    assert _uis(restored) == _uis(kb)
+    assert ([c.to_dict() for c in restored] == [c.to_dict() for c in kb])
+    for concept in restored:
+        for rel in concept.get_relationships():
+            assert not isinstance(rel.object, str)
+
+
+def test_snapshot_default_backend(version_dir):
+    concepts_file = _concepts_file(version_dir)
+    kb = idlib.load_kb(str(version_dir), snapshot=True)
+    assert isinstance(kb, ColumnarKB)
+    assert os.path.exists(snapshot.snapshot_path(concepts_file, "columnar"))
+    # The columnar backend can't filter concepts.
+    kb = idlib.load_kb(str(version_dir), snapshot=True,
+                       concept_types=["SDSI"])
+    assert isinstance(kb, list)
+    assert os.path.exists(snapshot.snapshot_path(concepts_file, "objects"))
+
+
+def test_snapshot_invalidated_by_changes(version_dir, capsys):
+    concepts_file = _concepts_file(version_dir)
+    snapshot_file = snapshot.snapshot_path(concepts_file, "columnar")
+    idlib.load_kb(str(version_dir), snapshot=True)
+    assert snapshot.is_valid(snapshot_file, concepts_file)
+
+    # A new concept changes the size of the file.
+    with open(concepts_file, 'a') as outF:
+        outF.write(json.dumps(_concept_dict(11)) + '\n')
+    assert not snapshot.is_valid(snapshot_file, concepts_file)
+    capsys.readouterr()
+    kb = idlib.load_kb(str(version_dir), snapshot=True)
+    assert "from snapshot" not in capsys.readouterr().out
+    assert len(kb) == 11
+    assert snapshot.is_valid(snapshot_file, concepts_file)
+
+    # Changes that keep the size and modification time are caught
+    # by the checksum.
+    stat = os.stat(concepts_file)
+    with open(concepts_file, 'r') as inF:
+        data = inF.read()
+    with open(concepts_file, 'w') as outF:
+        outF.write(data.replace("term 11", "term XX"))
+    os.utime(concepts_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.path.getsize(concepts_file) == stat.st_size
+    assert not snapshot.is_valid(snapshot_file, concepts_file)
+    kb = idlib.load_kb(str(version_dir), snapshot=True)
+    assert "term XX" in [c.preferred_atom.term for c in kb]
+
+
+@pytest.mark.parametrize("corrupt", ["truncated", "garbage", "not_snapshot"])
+def test_corrupt_snapshot_rebuilt(version_dir, capsys, corrupt):
+    concepts_file = _concepts_file(version_dir)
+    snapshot_file = snapshot.snapshot_path(concepts_file, "columnar")
+    expected = _uis(idlib.load_kb(str(version_dir), snapshot=True))
+
+    with open(snapshot_file, 'rb') as inF:
+        data = inF.read()
+    if corrupt == "truncated":
+        data = data[:len(data) // 2]
+    elif corrupt == "garbage":
+        data = data[:len(data) // 2] + b"\x00" * 100 + snapshot.END
+    else:
+        data = b"not a snapshot"
+    with open(snapshot_file, 'wb') as outF:
+        outF.write(data)
+
+    capsys.readouterr()
+    kb = idlib.load_kb(str(version_dir), snapshot=True)
+    assert _uis(kb) == expected
+    assert snapshot.is_valid(snapshot_file, concepts_file)
+
+
+class _Remove(object):
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (os.remove, (self.path,))
+
+
+@pytest.mark.parametrize("backend", ["objects", "columnar"])
+def test_tampered_snapshot_not_executed(version_dir, tmp_path, backend):
+    concepts_file = _concepts_file(version_dir)
+    snapshot_file = snapshot.snapshot_path(concepts_file, backend)
+    marker = tmp_path / "marker"
+    marker.write_text("still here")
+    # A snapshot with an up to date key, whose contents would remove
+    # the marker file if they were unpickled.
+    with open(snapshot_file, 'wb') as outF:
+        outF.write(snapshot.MAGIC)
+        pickle.dump(snapshot.file_key(concepts_file), outF)
+        pickle.dump(_Remove(str(marker)), outF)
+        outF.write(snapshot.END)
+    assert snapshot.is_valid(snapshot_file, concepts_file)
+    with pytest.raises(pickle.UnpicklingError):
+        list(snapshot.read_snapshot(snapshot_file))
+    kb = idlib.load_kb(str(version_dir), backend=backend, snapshot=True)
+    assert len(kb) == 10
+    assert marker.exists()
+
+
+def test_snapshot_writer_fails_quietly(tmp_path):
+    concepts_file = tmp_path / "concepts.jsonl"
+    concepts_file.write_text(json.dumps(_concept_dict(1)) + '\n')
+    snapshot_file = str(tmp_path / "missing_dir" / "concepts.snapshot")
+    writer = snapshot.SnapshotWriter(snapshot_file, str(concepts_file))
+    writer.write([("record",)])
+    assert writer.close() is False
+    assert not os.path.exists(snapshot_file)
@@ -1,8 +1,7 @@
 import argparse
-import json
 from tqdm import tqdm
 
-from idlib import load_kb
+from idlib import load_kb, write_jsonl_file
 
 
 """
@@ -23,6 +22,10 @@ def parse_args():
                                 concept types.""")
     parser.add_argument("--outfile", type=str, required=True,
                         help="Where to save the result.")
+    parser.add_argument("--snapshot", action="store_true", default=False,
+                        help="""Save a snapshot of the concepts on the first
+                                load and restore from it afterwards.
+                                See idlib.snapshot.""")
     args = parser.parse_args()
     return args
 
@@ -80,11 +83,9 @@ def remove_source(concepts, source_code, rm_types=[]):
 if __name__ == "__main__":
     args = parse_args()
     print("Loading Knowledge Base...")
-    kb = load_kb(args.kb_dir)
+    # The concepts are modified, so they must be objects.
+    kb = load_kb(args.kb_dir, backend="objects", snapshot=args.snapshot)
     print("Done")
     source_code = args.source_code.upper()
     kb = remove_source(kb, source_code, args.concept_types)
-    with open(args.outfile, 'w') as outF:
-        for concept in kb:
-            json.dump(concept.to_dict(), outF)
-            outF.write('\n')
+    write_jsonl_file(kb, args.outfile)
@@ -6,7 +6,8 @@ import pandas as pd
 from collections import OrderedDict
 from nltk.corpus import stopwords
 
-from idlib import Atom, Concept, Attribute, Relationship
+from idlib import write_jsonl_file
+from idlib.data_elements import Atom, Concept, Attribute, Relationship
 
 """
 Obtains all the synonyms of the DSLD manual download
@@ -81,10 +82,7 @@ def main():
     all_concepts = connect_products_to_ingredients(product_concepts,
                                                    ingredient_concepts)
 
-    with open(args.outfile, 'w') as outF:
-        for concept in all_concepts:
-            json.dump(concept.to_dict(), outF)
-            outF.write("\n")
+    write_jsonl_file(all_concepts, args.outfile)
 
 
 def read_ingredients_data(infile):
@@ -3,7 +3,8 @@ import json
 import argparse
 import re
 
-from idlib import Atom, Concept, Attribute, Relationship
+from idlib.data_elements import Atom, Concept, Attribute, Relationship
+from idlib.jsonl import JSONLWriter
 
 
 def parse_args():
@@ -148,9 +149,7 @@ class MSKCC_Converter(object):
         :param list seen_id: concept ids that have beed processed
         :param Concept concept: the concept to be written in the local file
         """
-        with open(self.idisk_format_output, 'a') as outf:
-            json.dump(concept.to_dict(), outf)
-            outf.write("\n")
+        self.writer.write(concept)
 
     def iterate_mskcc_file(self):
         """
@@ -174,7 +173,8 @@ class MSKCC_Converter(object):
                                 Dietary Supplement Ingredient (SDSI)
         """
         Concept.set_ui_prefix("MSKCC")
-        with open(self.content_file, "r") as f:
+        self.writer = JSONLWriter(self.idisk_format_output)
+        with self.writer, open(self.content_file, "r") as f:
             # use counter as herb id
             for line in f:
                 items = json.loads(line)
@@ -1,10 +1,10 @@
 import argparse
-import json
 import re
 import string
 import pandas as pd
 
-from idlib import Atom, Concept, Attribute, Relationship
+from idlib import write_jsonl_file
+from idlib.data_elements import Atom, Concept, Attribute, Relationship
 
 """
 Formats product and ingredient information from NHP
@@ -50,10 +50,7 @@ def extract_concepts(ingredients_csv, products_csv, outjsonl):
     print("Connecting ingredients to products")
     all_concepts = connect_ingredients_to_products(ingredient_concepts,
                                                    product_concepts)
-    with open(outjsonl, 'w') as outF:
-        for concept in all_concepts:
-            json.dump(concept.to_dict(), outF)
-            outF.write('\n')
+    write_jsonl_file(all_concepts, outjsonl)
 
 
 def create_ingredient_concepts(dataframe):
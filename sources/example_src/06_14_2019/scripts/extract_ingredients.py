@@ -1,10 +1,10 @@
 import argparse
-import json
 import re
 import string
 import pandas as pd
 
-from idlib import Atom, Concept
+from idlib import write_jsonl_file
+from idlib.data_elements import Atom, Concept
 
 """
 Formats ingredient information from NHP into the iDISK JSON lines
@@ -60,10 +60,7 @@ def extract_ingredients(incsv, outjsonl):
     data = pd.read_csv(incsv, dtype=str)
     concepts = to_concepts(data)
     merged_concepts = merge_duplicate_concepts(concepts)
-    with open(outjsonl, 'w') as outF:
-        for concept in merged_concepts:
-            json.dump(concept.to_dict(), outF)
-            outF.write('\n')
+    write_jsonl_file(merged_concepts, outjsonl)
 
 
 def to_concepts(dataframe):